@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Android设备信息读取 - android_server 使用
+电池、WiFi、流量优先直接读取 sysfs/procfs（一次文件读取，毫秒级），
+读不到时才执行 dumpsys / pm（每次启动一个进程，低端机上要几百毫秒到几秒）；两条路径返回相同结构的数据
+
+直接运行本文件对比两条路径的耗时: python android_info.py [次数]
+"""
+
+import os
+import re
+import subprocess
+import sys
+import time
+
+POWER_SUPPLY = '/sys/class/power_supply'
+PROC_WIRELESS = '/proc/net/wireless'
+PROC_NET_DEV = '/proc/net/dev'
+SYS_NET = '/sys/class/net'
+PACKAGES_LIST = '/data/system/packages.list'
+
+# power_supply 中表示电池的类型，以及代表外部电源的类型与 plugged 取值的对应
+BATTERY_TYPE = 'Battery'
+PLUGGED_TYPES = {'Mains': 'ac', 'USB': 'usb', 'USB_PD': 'usb', 'USB_DCP': 'ac', 'USB_CDP': 'usb',
+                 'USB_C': 'usb', 'Wireless': 'wireless'}
+
+# dumpsys battery 的数字状态码
+DUMPSYS_STATUS = {'1': 'Unknown', '2': 'Charging', '3': 'Discharging', '4': 'Not charging', '5': 'Full'}
+DUMPSYS_HEALTH = {'1': 'Unknown', '2': 'Good', '3': 'Overheat', '4': 'Dead', '5': 'Over voltage',
+                  '6': 'Unspecified failure', '7': 'Cold'}
+
+
+def _read(path):
+    with open(path, 'r') as f:
+        return f.read().strip()
+
+
+def _read_uevent(path):
+    """读取 uevent 文件（POWER_SUPPLY_XXX=值）为 {xxx: 值}"""
+    values = {}
+    for line in _read(path).splitlines():
+        key, sep, value = line.partition('=')
+        if sep:
+            values[key.replace('POWER_SUPPLY_', '').lower()] = value
+    return values
+
+
+def _to_int(value, scale=1):
+    """转换为整数，给出scale时换算单位并保留一位小数；无法转换时返回None"""
+    try:
+        return round(int(value) / scale, 1) if scale != 1 else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _run(args, timeout):
+    return subprocess.run(args, capture_output=True, text=True, timeout=timeout).stdout
+
+
+# ---------- 电池 ----------
+
+def battery_from_sysfs(root=POWER_SUPPLY):
+    """从 /sys/class/power_supply 读取电池状态，没有可读的电池时返回None"""
+    battery = None
+    plugged = []
+    try:
+        names = sorted(os.listdir(root))
+    except OSError:
+        return None
+    for name in names:
+        path = os.path.join(root, name)
+        try:
+            values = _read_uevent(os.path.join(path, 'uevent'))
+        except OSError:
+            continue
+        kind = values.get('type')
+        if kind is None:
+            try:
+                kind = _read(os.path.join(path, 'type'))
+            except OSError:
+                continue
+        if kind == BATTERY_TYPE and battery is None and 'capacity' in values:
+            battery = values
+        elif kind in PLUGGED_TYPES and values.get('online') == '1':
+            plugged.append(PLUGGED_TYPES[kind])
+    if battery is None:
+        return None
+    # 电压/电流单位为微伏/微安，温度为0.1摄氏度
+    return {
+        'level': _to_int(battery.get('capacity')),
+        'status': battery.get('status'),
+        'health': battery.get('health'),
+        'plugged': plugged[0] if plugged else None,
+        'temperature': _to_int(battery.get('temp'), 10),
+        'voltage_mv': _to_int(battery.get('voltage_now'), 1000),
+        'current_ma': _to_int(battery.get('current_now'), 1000),
+        'technology': battery.get('technology'),
+        'charge_counter_mah': _to_int(battery.get('charge_counter'), 1000)
+    }
+
+
+def parse_dumpsys_battery(text):
+    """把 dumpsys battery 的输出整理成与 battery_from_sysfs 相同的结构"""
+    raw = {}
+    for line in text.splitlines():
+        key, sep, value = line.strip().partition(':')
+        if sep:
+            raw[key.strip()] = value.strip()
+    plugged = [kind for key, kind in (('AC powered', 'ac'), ('USB powered', 'usb'),
+                                      ('Wireless powered', 'wireless'), ('Dock powered', 'dock'))
+               if raw.get(key) == 'true']
+    voltage = _to_int(raw.get('voltage'))
+    return {
+        'level': _to_int(raw.get('level')),
+        'status': DUMPSYS_STATUS.get(raw.get('status'), raw.get('status')),
+        'health': DUMPSYS_HEALTH.get(raw.get('health'), raw.get('health')),
+        'plugged': plugged[0] if plugged else None,
+        'temperature': _to_int(raw.get('temperature'), 10),
+        'voltage_mv': voltage,
+        'current_ma': None,
+        'technology': raw.get('technology'),
+        'charge_counter_mah': _to_int(raw.get('Charge counter'), 1000)
+    }
+
+
+def battery_from_dumpsys(timeout=5):
+    return parse_dumpsys_battery(_run(['dumpsys', 'battery'], timeout))
+
+
+# ---------- 网络 ----------
+
+def read_net_dev(path=PROC_NET_DEV):
+    """解析 /proc/net/dev，返回 {接口: {rx_bytes, rx_packets, rx_errors, rx_dropped, tx_...}}"""
+    fields = ('bytes', 'packets', 'errors', 'dropped')
+    interfaces = {}
+    with open(path, 'r') as f:
+        lines = f.read().splitlines()[2:]
+    for line in lines:
+        name, sep, data = line.partition(':')
+        if not sep:
+            continue
+        values = data.split()
+        if len(values) < 16:
+            continue
+        stats = {f'rx_{k}': int(v) for k, v in zip(fields, values[0:4])}
+        stats.update({f'tx_{k}': int(v) for k, v in zip(fields, values[8:12])})
+        interfaces[name.strip()] = stats
+    return interfaces
+
+
+def read_wireless(path=PROC_WIRELESS):
+    """解析 /proc/net/wireless，返回 {接口: {link_quality, signal_dbm, noise_dbm}}"""
+    interfaces = {}
+    with open(path, 'r') as f:
+        lines = f.read().splitlines()[2:]
+    for line in lines:
+        name, sep, data = line.partition(':')
+        values = data.split()
+        if not sep or len(values) < 4:
+            continue
+        number = lambda v: float(v.rstrip('.'))
+        interfaces[name.strip()] = {
+            'link_quality': number(values[1]),
+            'signal_dbm': number(values[2]),
+            'noise_dbm': number(values[3])
+        }
+    return interfaces
+
+
+def _operstate(interface):
+    try:
+        return _read(os.path.join(SYS_NET, interface, 'operstate'))
+    except OSError:
+        return None
+
+
+def wifi_from_procfs(interface=None):
+    """从 procfs/sysfs 读取WiFi连接状态（没有SSID），没有无线接口时返回None"""
+    try:
+        wireless = read_wireless()
+    except OSError:
+        return None
+    if not wireless:
+        # 未连接时 /proc/net/wireless 可能没有数据行，仍可从 sysfs 判断接口是否存在
+        candidates = [interface] if interface else ['wlan0']
+        name = next((n for n in candidates if os.path.isdir(os.path.join(SYS_NET, n))), None)
+        if name is None:
+            return None
+        return {'interface': name, 'connected': False, 'operstate': _operstate(name)}
+
+    name = interface if interface in wireless else next(iter(wireless))
+    info = {'interface': name, 'operstate': _operstate(name)}
+    info['connected'] = info['operstate'] == 'up'
+    info.update(wireless[name])
+    try:
+        info.update(read_net_dev().get(name, {}))
+    except OSError:
+        pass
+    return info
+
+
+def parse_dumpsys_wifi(text):
+    """从 dumpsys wifi 的输出中提取开关状态和当前连接（mWifiInfo 行）"""
+    info = {'enabled': None, 'connected': False}
+    match = re.search(r'Wi-Fi is (enabled|disabled)', text)
+    if match:
+        info['enabled'] = match.group(1) == 'enabled'
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('mWifiInfo'):
+            # mWifiInfo SSID: "xx", BSSID: 11:22:.., RSSI: -55, Link speed: 72Mbps, Frequency: 2437MHz, ...
+            fields = dict(part.strip().split(': ', 1) for part in line[len('mWifiInfo'):].split(', ') if ': ' in part)
+            ssid = fields.get('SSID', '').strip().strip('"')
+            info.update({
+                'ssid': None if ssid in ('', '<unknown ssid>') else ssid,
+                'bssid': fields.get('BSSID'),
+                'signal_dbm': _to_int(fields.get('RSSI')),
+                'link_speed_mbps': _to_int(re.sub(r'\D', '', fields.get('Link speed', '')) or None),
+                'frequency_mhz': _to_int(re.sub(r'\D', '', fields.get('Frequency', '')) or None),
+                'ip': fields.get('IP', '').lstrip('/') or None,
+                'state': fields.get('Supplicant state')
+            })
+            info['connected'] = info['state'] == 'COMPLETED'
+            break
+    return info
+
+
+def wifi_from_dumpsys(timeout=5):
+    return parse_dumpsys_wifi(_run(['dumpsys', 'wifi'], timeout))
+
+
+# ---------- 应用 ----------
+
+def packages_from_list(path=PACKAGES_LIST):
+    """读取 /data/system/packages.list（通常需要root），每行第一列为包名"""
+    with open(path, 'r') as f:
+        return sorted(line.split(' ', 1)[0] for line in f if line.strip())
+
+
+def packages_from_pm(timeout=10):
+    output = _run(['pm', 'list', 'packages'], timeout)
+    return sorted(line[len('package:'):].strip() for line in output.splitlines()
+                  if line.startswith('package:'))
+
+
+# ---------- 对比测试 ----------
+
+def benchmark(rounds=5):
+    """对比 sysfs/procfs 与 dumpsys/pm 两条路径的平均耗时"""
+    pairs = [
+        ('battery', battery_from_sysfs, battery_from_dumpsys),
+        ('wifi', wifi_from_procfs, wifi_from_dumpsys),
+        ('apps', packages_from_list, packages_from_pm),
+    ]
+    print(f"{'项目':<10} {'快速路径':>14} {'子进程':>14}")
+    print('-' * 42)
+    for name, fast, slow in pairs:
+        row = []
+        for func in (fast, slow):
+            try:
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    result = func()
+                elapsed = (time.perf_counter() - start) * 1000 / rounds
+                row.append(f'{elapsed:.2f} ms' if result is not None else '不可用')
+            except Exception as e:
+                row.append(type(e).__name__)
+        print(f'{name:<10} {row[0]:>14} {row[1]:>14}')
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -5,26 +5,31 @@ Android增强服务端 - 专门针对Android设备优化
 支持更多Android特有功能
 """
 
-import socket
-import json
-import threading
-import time
 import os
-import sys
-import base64
-import platform
-import subprocess
+import time
 from datetime import datetime
 
-class AndroidMonitorServer:
-    def __init__(self, host='0.0.0.0', port=8888):
-        self.host = host
-        self.port = port
-        self.server_socket = None
-        self.running = False
-        self.clients = []
+import protocol
+import android_info
+import screen
+import server_base
+from server_base import MonitorServerBase
+
+
+class AndroidMonitorServer(MonitorServerBase):
+    """Android服务端：在通用命令之外提供电池、WiFi、应用列表，截图和默认目录使用Android的方式"""
+    
+    TITLE = "📱 Android监控服务端已启动"
+    PROCESS_LIMIT = 30
+    
+    def __init__(self, host=None, port=None, config=None):
+        # 默认目录和截图方式取决于是否在Android上，需在基类初始化之前确定
         self.is_android = self.detect_android()
-        
+        self.android_props = None
+        super().__init__(host, port, config)
+        if self.is_android:
+            self.sampler.add_collector(self.sample_battery, self.config.battery_interval)
+    
     def detect_android(self):
         """检测是否运行在Android上"""
         try:
@@ -50,399 +55,155 @@ class AndroidMonitorServer:
         return info
     
     def get_battery_info(self):
-        """获取电池信息"""
+        """获取电池信息（优先读取sysfs，读不到时执行dumpsys）"""
         try:
-            result = subprocess.run(['dumpsys', 'battery'], 
-                                  capture_output=True, text=True, timeout=5)
-            battery_info = {}
-            for line in result.stdout.split('\n'):
-                if ':' in line:
-                    key, value = line.strip().split(':', 1)
-                    battery_info[key.strip()] = value.strip()
-            return {'success': True, 'data': battery_info}
-        except:
+            data = android_info.battery_from_sysfs()
+            source = 'sysfs'
+            if data is None:
+                data = android_info.battery_from_dumpsys()
+                source = 'dumpsys'
+            return {'success': True, 'data': data, 'source': source}
+        except Exception:
             return {'success': False, 'error': '无法获取电池信息'}
     
-    def get_wifi_info(self):
-        """获取WiFi信息"""
+    def sample_battery(self):
+        """供后台采样器定期调用，只保留电量和温度"""
+        result = self.get_battery_info()
+        if not result.get('success'):
+            return {}
+        data = result['data']
+        if data.get('level') is None or data.get('temperature') is None:
+            return {}
+        return {'battery': {'level': data['level'], 'temperature': data['temperature']}}
+    
+    def get_wifi_info(self, params=None):
+        """获取WiFi信息（信号和流量读取procfs；detail=true或procfs不可用时执行dumpsys获取SSID等）"""
+        params = params or {}
         try:
-            result = subprocess.run(['dumpsys', 'wifi'], 
-                                  capture_output=True, text=True, timeout=5)
-            # 简化输出
-            wifi_info = {'raw': result.stdout[:500]}
-            return {'success': True, 'data': wifi_info}
-        except:
+            data = None if params.get('detail') else android_info.wifi_from_procfs(params.get('interface'))
+            source = 'procfs'
+            if data is None:
+                data = android_info.wifi_from_dumpsys()
+                source = 'dumpsys'
+            return {'success': True, 'data': data, 'source': source}
+        except Exception:
             return {'success': False, 'error': '无法获取WiFi信息'}
     
-    def get_installed_apps(self):
-        """获取已安装应用列表"""
+    def get_installed_apps(self, params=None):
+        """获取已安装应用列表（有权限时直接读取packages.list，否则执行pm）"""
+        params = params or {}
         try:
-            result = subprocess.run(['pm', 'list', 'packages'], 
-                                  capture_output=True, text=True, timeout=10)
-            packages = []
-            for line in result.stdout.split('\n'):
-                if line.startswith('package:'):
-                    packages.append(line.replace('package:', '').strip())
-            return {'success': True, 'apps': packages[:50]}  # 只返回前50个
-        except:
+            try:
+                packages = android_info.packages_from_list()
+                source = 'packages.list'
+            except OSError:
+                packages = android_info.packages_from_pm()
+                source = 'pm'
+            limit = int(params.get('limit') or 50)
+            return {'success': True, 'apps': packages[:limit], 'total': len(packages), 'source': source}
+        except Exception:
             return {'success': False, 'error': '无法获取应用列表'}
     
-    def take_screenshot_android(self):
-        """Android截图"""
+    def take_screenshot_android(self, options):
+        """Android截图（screencap原始像素经管道读取后按选项编码）"""
         try:
-            screenshot_path = '/sdcard/screenshot_temp.png'
-            result = subprocess.run(['screencap', '-p', screenshot_path], 
-                                  capture_output=True, timeout=10)
-            
-            if result.returncode == 0 and os.path.exists(screenshot_path):
-                with open(screenshot_path, 'rb') as f:
-                    img_data = base64.b64encode(f.read()).decode('utf-8')
-                
-                # 删除临时文件
-                try:
-                    os.remove(screenshot_path)
-                except:
-                    pass
-                
-                return {
-                    'success': True,
-                    'data': img_data,
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+            start = time.perf_counter()
+            if screen.Image is None:
+                # 没有Pillow时直接取PNG，无法应用编码选项
+                img_data = screen.capture_android_png()
+                stats = {'format': 'PNG', 'bytes': len(img_data), 'note': '安装Pillow后可使用格式、质量和缩放选项'}
+                capture_ms = round((time.perf_counter() - start) * 1000, 1)
             else:
-                return {'success': False, 'error': '截图命令执行失败'}
+                image = screen.capture_android()
+                capture_ms = round((time.perf_counter() - start) * 1000, 1)
+                img_data, stats = screen.encode_image(image, **options)
+            
+            response = {
+                'success': True,
+                'capture_ms': capture_ms,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                protocol.ATTACHMENT_KEY: protocol.Attachment(data=img_data)
+            }
+            response.update(stats)
+            return response
         except Exception as e:
             return {'success': False, 'error': f'截图失败: {str(e)}'}
     
+    def default_root(self):
+        """files 命令和文件索引的默认目录"""
+        return '/sdcard/' if self.is_android else super().default_root()
+    
+    def platform_name(self):
+        """自动发现应答中的平台名称"""
+        return 'Android' if self.is_android else super().platform_name()
+    
+    def capture_screen(self):
+        """截取一帧屏幕（PIL图像）"""
+        return screen.capture_android() if self.is_android else super().capture_screen()
+    
     def get_device_info(self):
         """获取设备信息"""
-        info = {
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'platform': platform.platform(),
-            'system': platform.system(),
-            'is_android': self.is_android,
-        }
+        result = super().get_device_info()
+        info = result['data']
+        info['is_android'] = self.is_android
         
-        # Android特有信息
+        # Android特有信息（build.prop运行期间不会变化，只解析一次）
         if self.is_android:
-            info['android_info'] = self.get_android_info()
-        
-        # 尝试获取系统信息
-        try:
-            import psutil
-            info['cpu_percent'] = psutil.cpu_percent(interval=1)
-            info['memory'] = {
-                'total': psutil.virtual_memory().total,
-                'available': psutil.virtual_memory().available,
-                'percent': psutil.virtual_memory().percent
-            }
-            info['disk'] = {
-                'total': psutil.disk_usage('/').total,
-                'used': psutil.disk_usage('/').used,
-                'free': psutil.disk_usage('/').free,
-                'percent': psutil.disk_usage('/').percent
-            }
-        except ImportError:
-            info['note'] = '安装psutil可获取更多信息'
-        
-        return {'success': True, 'data': info}
+            if self.android_props is None:
+                self.android_props = self.get_android_info()
+            info['android_info'] = self.android_props
+        return result
     
-    def take_screenshot(self):
+    def take_screenshot(self, params=None):
         """截图（自动选择方法）"""
-        if self.is_android:
-            return self.take_screenshot_android()
-        else:
-            # 桌面系统截图
-            try:
-                from PIL import ImageGrab
-                import io
-                
-                screenshot = ImageGrab.grab()
-                buffer = io.BytesIO()
-                screenshot.save(buffer, format='PNG')
-                img_data = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                
-                return {
-                    'success': True,
-                    'data': img_data,
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-            except ImportError:
-                return {'success': False, 'error': '需要安装Pillow'}
-            except Exception as e:
-                return {'success': False, 'error': str(e)}
-    
-    def get_running_processes(self):
-        """获取运行进程"""
+        if not self.is_android:
+            return super().take_screenshot(params)
         try:
-            import psutil
-            processes = []
-            for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
-                try:
-                    processes.append(proc.info)
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    pass
-            
-            processes.sort(key=lambda x: x.get('cpu_percent', 0), reverse=True)
-            return {'success': True, 'processes': processes[:30]}
-        except ImportError:
-            return {'success': False, 'error': '需要安装psutil'}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
+            options = screen.parse_options(params or {}, self.config.screenshot_quality)
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'error': f'参数错误: {e}'}
+        return self.take_screenshot_android(options)
     
-    def list_files(self, path=None):
-        """列出文件"""
-        if path is None:
-            path = '/sdcard/' if self.is_android else os.path.expanduser('~')
-        
+    def get_network_info_fallback(self):
+        """没有psutil时从 /proc/net/dev 读取各接口流量"""
         try:
-            if not os.path.exists(path):
-                return {'success': False, 'error': '路径不存在'}
-            
-            files = []
-            for item in os.listdir(path):
-                try:
-                    full_path = os.path.join(path, item)
-                    stat = os.stat(full_path)
-                    files.append({
-                        'name': item,
-                        'is_dir': os.path.isdir(full_path),
-                        'size': stat.st_size if os.path.isfile(full_path) else 0,
-                        'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-                    })
-                except Exception:
-                    continue
-            
-            return {'success': True, 'files': files, 'path': path}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
-    
-    def get_file_content(self, filepath):
-        """读取文件"""
-        try:
-            if not os.path.exists(filepath):
-                return {'success': False, 'error': '文件不存在'}
-            
-            if os.path.isdir(filepath):
-                return {'success': False, 'error': '这是一个目录'}
-            
-            file_size = os.path.getsize(filepath)
-            if file_size > 10 * 1024 * 1024:
-                return {'success': False, 'error': '文件太大'}
-            
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                return {'success': True, 'content': content, 'type': 'text', 'size': file_size}
-            except UnicodeDecodeError:
-                with open(filepath, 'rb') as f:
-                    content = base64.b64encode(f.read()).decode('utf-8')
-                return {'success': True, 'content': content, 'type': 'binary', 'size': file_size}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
-    
-    def execute_command(self, command):
-        """执行命令"""
-        try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            return {
-                'success': True,
-                'stdout': result.stdout,
-                'stderr': result.stderr,
-                'returncode': result.returncode
-            }
-        except subprocess.TimeoutExpired:
-            return {'success': False, 'error': '命令执行超时'}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
-    
-    def get_network_info(self):
-        """获取网络信息"""
-        try:
-            import psutil
-            
-            interfaces = {}
-            for interface, addrs in psutil.net_if_addrs().items():
-                interfaces[interface] = []
-                for addr in addrs:
-                    interfaces[interface].append({
-                        'family': str(addr.family),
-                        'address': addr.address,
-                        'netmask': addr.netmask,
-                    })
-            
-            net_io = psutil.net_io_counters()
-            stats = {
-                'bytes_sent': net_io.bytes_sent,
-                'bytes_recv': net_io.bytes_recv,
-            }
-            
-            return {'success': True, 'interfaces': interfaces, 'stats': stats}
-        except ImportError:
+            counters = android_info.read_net_dev()
+        except OSError:
             return {'success': False, 'error': '需要安装psutil'}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
-    
-    def handle_command(self, command, params=None):
-        """处理命令"""
-        if params is None:
-            params = {}
-        
-        handlers = {
-            'info': lambda: self.get_device_info(),
-            'screenshot': lambda: self.take_screenshot(),
-            'processes': lambda: self.get_running_processes(),
-            'files': lambda: self.list_files(params.get('path')),
-            'read_file': lambda: self.get_file_content(params.get('filepath')),
-            'exec': lambda: self.execute_command(params.get('command')),
-            'network': lambda: self.get_network_info(),
-            'battery': lambda: self.get_battery_info() if self.is_android else {'success': False, 'error': '仅Android支持'},
-            'wifi': lambda: self.get_wifi_info() if self.is_android else {'success': False, 'error': '仅Android支持'},
-            'apps': lambda: self.get_installed_apps() if self.is_android else {'success': False, 'error': '仅Android支持'},
-            'ping': lambda: {'success': True, 'message': 'pong', 'timestamp': datetime.now().isoformat()}
+        interfaces = {name: [] for name in counters}
+        stats = {
+            'bytes_sent': sum(c['tx_bytes'] for name, c in counters.items() if name != 'lo'),
+            'bytes_recv': sum(c['rx_bytes'] for name, c in counters.items() if name != 'lo'),
         }
-        
-        handler = handlers.get(command)
-        if handler:
-            return handler()
-        else:
-            return {'success': False, 'error': f'未知命令: {command}'}
-    
-    def handle_client(self, client_socket, address):
-        """处理客户端"""
-        print(f"[+] 客户端已连接: {address}")
-        self.clients.append(client_socket)
-        
-        try:
-            while self.running:
-                data = client_socket.recv(8192)
-                if not data:
-                    break
-                
-                try:
-                    request = json.loads(data.decode('utf-8'))
-                    command = request.get('command')
-                    params = request.get('params', {})
-                    
-                    print(f"[*] 收到命令: {command}")
-                    
-                    response = self.handle_command(command, params)
-                    response_data = json.dumps(response, ensure_ascii=False)
-                    
-                    # 分块发送
-                    chunk_size = 4096
-                    for i in range(0, len(response_data), chunk_size):
-                        chunk = response_data[i:i+chunk_size]
-                        client_socket.sendall(chunk.encode('utf-8'))
-                    
-                    client_socket.sendall(b'\n__END__\n')
-                    
-                except json.JSONDecodeError:
-                    error_response = json.dumps({'success': False, 'error': 'JSON解析错误'})
-                    client_socket.sendall(error_response.encode('utf-8'))
-                except Exception as e:
-                    error_response = json.dumps({'success': False, 'error': str(e)})
-                    client_socket.sendall(error_response.encode('utf-8'))
-        
-        except Exception as e:
-            print(f"[-] 客户端处理错误: {e}")
-        finally:
-            print(f"[-] 客户端断开: {address}")
-            if client_socket in self.clients:
-                self.clients.remove(client_socket)
-            client_socket.close()
+        return {'success': True, 'interfaces': interfaces, 'stats': stats, 'counters': counters}
     
-    def start(self):
-        """启动服务器"""
-        try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
-            self.running = True
-            
-            # 获取本机IP
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            try:
-                s.connect(('8.8.8.8', 80))
-                local_ip = s.getsockname()[0]
-            except:
-                local_ip = '127.0.0.1'
-            finally:
-                s.close()
-            
-            print("=" * 60)
-            print("📱 Android监控服务端已启动")
-            print(f"🌐 监听地址: {self.host}:{self.port}")
-            print(f"📍 本机IP: {local_ip}")
-            print(f"🔗 客户端连接: {local_ip}:{self.port}")
-            if self.is_android:
-                print("✓ 检测到Android环境，已启用Android特性")
-            print("=" * 60)
-            print("\n等待客户端连接...")
-            
-            while self.running:
-                try:
-                    client_socket, address = self.server_socket.accept()
-                    client_thread = threading.Thread(
-                        target=self.handle_client,
-                        args=(client_socket, address)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
-                except Exception as e:
-                    if self.running:
-                        print(f"[-] 接受连接错误: {e}")
-        
-        except Exception as e:
-            print(f"[-] 服务器启动失败: {e}")
-        finally:
-            self.stop()
+    def command_handlers(self, command, params, conn):
+        """在通用命令之外增加 battery/wifi/apps"""
+        handlers = super().command_handlers(command, params, conn)
+        handlers.update({
+            'battery': lambda: self.get_battery_info() if self.is_android else {'success': False, 'error': '仅Android支持'},
+            'wifi': lambda: self.get_wifi_info(params) if self.is_android else {'success': False, 'error': '仅Android支持'},
+            'apps': lambda: self.get_installed_apps(params) if self.is_android else {'success': False, 'error': '仅Android支持'},
+        })
+        return handlers
+    
+    def reload_config(self):
+        """重新加载配置，并应用电池采样间隔"""
+        if not super().reload_config():
+            return False
+        if self.is_android:
+            self.sampler.set_collector_interval(self.sample_battery, self.config.battery_interval)
+        return True
     
-    def stop(self):
-        """停止服务器"""
-        print("\n[*] 正在关闭服务器...")
-        self.running = False
-        
-        for client in self.clients:
-            try:
-                client.close()
-            except:
-                pass
-        
-        if self.server_socket:
-            try:
-                self.server_socket.close()
-            except:
-                pass
-        
-        print("[*] 服务器已关闭")
+    def banner_notes(self):
+        """启动信息中附加的说明行"""
+        if self.is_android:
+            return ["✓ 检测到Android环境，已启用Android特性"]
+        return []
+
 
 def main():
-    print("\n📱 Android监控服务端 v2.0")
-    print("⚠️  注意：请确保您有权监控此设备\n")
-    
-    port = 8888
-    if len(sys.argv) > 1:
-        try:
-            port = int(sys.argv[1])
-        except ValueError:
-            print("❌ 端口号必须是数字")
-            return
-    
-    server = AndroidMonitorServer(port=port)
-    
-    try:
-        server.start()
-    except KeyboardInterrupt:
-        print("\n[*] 收到中断信号")
-        server.stop()
+    server_base.main(AndroidMonitorServer, "📱 Android监控服务端 v2.0")
 
 if __name__ == '__main__':
     main()
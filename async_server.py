@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+asyncio服务端核心 - server.py 与 android_server.py 共用
+所有连接由一个事件循环处理，阻塞的命令处理函数放到有限大小的线程池中执行
+"""
+
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import protocol
+import security
+from config import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# 与 asyncio.start_server 相同的 StreamReader 缓冲上限
+STREAM_LIMIT = 2 ** 16
+
+
+class FilteredStreamProtocol(asyncio.StreamReaderProtocol):
+    """在创建连接处理任务之前检查来源IP，不在允许列表中的连接直接断开"""
+
+    def __init__(self, reader, client_connected_cb, allowed_ips, loop):
+        super().__init__(reader, client_connected_cb, loop=loop)
+        self.allowed_ips = allowed_ips
+
+    def connection_made(self, transport):
+        peer = transport.get_extra_info('peername')
+        if peer and not self.allowed_ips.allows(peer[0]):
+            print(f"[-] 来源不在允许列表中，拒绝: {peer}")
+            logger.warning('来源不在允许列表中，拒绝: %s', peer)
+            transport.abort()
+            return
+        super().connection_made(transport)
+
+
+class AsyncServerCore:
+    """asyncio模式的连接管理，命令分发复用服务端的 handle_command"""
+
+    def __init__(self, server):
+        self.server = server
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.config.worker_threads,
+            thread_name_prefix='monitor-worker'
+        )
+        self.connections = set()
+        self.aio_server = None
+
+    @property
+    def config(self):
+        # 重新加载配置时服务端整体替换 config，每次读取最新的对象
+        return self.server.config
+
+    async def handle_connection(self, reader, writer):
+        """处理单个客户端连接"""
+        address = writer.get_extra_info('peername')
+        conn = protocol.AsyncConnection(reader, writer, self.config.compress_threshold)
+
+        if len(self.connections) >= self.config.max_clients:
+            print(f"[-] 连接数已达上限({self.config.max_clients})，拒绝: {address}")
+            logger.warning('连接数已达上限(%d)，拒绝: %s', self.config.max_clients, address)
+            await conn.send_message_async({'success': False, 'rejected': True, 'error': '服务器连接数已满'})
+            writer.close()
+            return
+
+        print(f"[+] 客户端已连接: {address}")
+        logger.info('客户端已连接: %s', address)
+        conn.authenticated = not self.server.auth.required
+        self.connections.add(writer)
+        loop = asyncio.get_event_loop()
+        # 限制同一连接上并发处理的流水线请求数
+        slots = asyncio.Semaphore(self.config.pipeline_depth)
+
+        try:
+            while self.server.running:
+                try:
+                    request = await conn.recv_request()
+                    if request is None:
+                        break
+                    command = request.get('command')
+                    params = request.get('params', {})
+
+                    if command == protocol.HELLO_COMMAND:
+                        await conn.accept_hello(params, self.server.auth.challenge(conn))
+                        continue
+
+                    if command == security.AUTH_COMMAND:
+                        response = self.server.auth.verify(conn, params)
+                        await conn.send_message_async(response)
+                        if not response['success']:
+                            print(f"[-] 认证失败: {address}")
+                            logger.warning('认证失败: %s', address)
+                            break
+                        continue
+
+                    if not conn.authenticated:
+                        await conn.send_message_async(
+                            {'success': False, 'auth_required': True, 'error': '需要认证'})
+                        break
+
+                    print(f"[*] 收到命令: {command}")
+                    logger.info('命令 %s 来自 %s', command, address)
+
+                    request_id = request.get(protocol.REQUEST_ID_KEY)
+                    if request_id is not None and conn.framed:
+                        await slots.acquire()
+                        asyncio.ensure_future(
+                            self.handle_pipelined(conn, slots, command, params, request_id))
+                        continue
+
+                    response = await loop.run_in_executor(
+                        self.executor, self.server.handle_command, command, params, conn)
+                    await conn.send_message_async(response)
+
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    await conn.send_message_async({'success': False, 'error': 'JSON解析错误'})
+                except protocol.ProtocolError as e:
+                    print(f"[-] 协议错误: {e}")
+                    break
+                except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    await conn.send_message_async({'success': False, 'error': str(e)})
+
+        except Exception as e:
+            print(f"[-] 客户端处理错误: {e}")
+            logger.error('客户端处理错误 %s: %s', address, e)
+        finally:
+            print(f"[-] 客户端断开: {address}")
+            logger.info('客户端断开: %s', address)
+            self.server.connection_closed(conn)
+            self.connections.discard(writer)
+            writer.close()
+
+    async def handle_pipelined(self, conn, slots, command, params, request_id):
+        """在线程池中处理带请求ID的命令，完成后立即发送响应（不等待之前的请求）"""
+        loop = asyncio.get_event_loop()
+        try:
+            try:
+                response = await loop.run_in_executor(
+                    self.executor, self.server.handle_command, command, params, conn)
+            except Exception as e:
+                response = {'success': False, 'error': str(e)}
+            response = dict(response)
+            response[protocol.REQUEST_ID_KEY] = request_id
+            await conn.send_message_async(response)
+        except Exception:
+            # 连接已关闭
+            pass
+        finally:
+            slots.release()
+
+    async def serve(self):
+        """监听并处理连接，直到服务器停止"""
+        loop = asyncio.get_running_loop()
+
+        def protocol_factory():
+            reader = asyncio.StreamReader(limit=STREAM_LIMIT, loop=loop)
+            return FilteredStreamProtocol(reader, self.handle_connection, self.server.allowed_ips, loop)
+
+        # 启用TLS时握手由事件循环完成，IP检查在握手之后、创建处理任务之前
+        tls = self.server.tls_context
+        self.aio_server = await loop.create_server(
+            protocol_factory,
+            self.server.host,
+            self.server.port,
+            backlog=self.config.listen_backlog,
+            reuse_address=True,
+            ssl=tls,
+            ssl_handshake_timeout=security.HANDSHAKE_TIMEOUT if tls else None
+        )
+        async with self.aio_server:
+            await self.aio_server.serve_forever()
+
+    def run(self):
+        """阻塞运行事件循环"""
+        try:
+            asyncio.run(self.serve())
+        finally:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量命令 - 服务端共用
+batch 一次携带多个 {command, params}：互不影响的查询类命令并行执行，其余命令按顺序执行，
+各自的结果按请求顺序合并到一个响应中
+"""
+
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import protocol
+
+MAX_BATCH_SIZE = 32
+
+# 只读取状态、互不影响的命令，可以并行执行
+PARALLEL_COMMANDS = frozenset([
+    'info', 'network', 'processes', 'battery', 'wifi', 'apps', 'history', 'files',
+    'read_file', 'search', 'job_status', 'job_output', 'job_list', 'ping'
+])
+
+# 依赖连接推送、持续占用连接或结果过大的命令不能放在batch中
+EXCLUDED_COMMANDS = frozenset([
+    protocol.HELLO_COMMAND, 'batch', 'subscribe', 'unsubscribe', 'screen_stream',
+    'screen_stream_stop', 'sync', 'exec_stream', 'exec_cancel', 'download'
+])
+
+
+class BatchRunner:
+    """执行batch命令，并行部分使用独立的线程池（避免占满服务端处理请求的线程池而互相等待）"""
+
+    def __init__(self, handle_command, workers=4):
+        self.handle_command = handle_command
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers),
+                                           thread_name_prefix='batch-worker')
+
+    def run(self, conn, params):
+        """params: {'commands': [{'command': ..., 'params': {...}}, ...], 'parallel': True}"""
+        entries = params.get('commands')
+        if not isinstance(entries, list) or not entries:
+            return {'success': False, 'error': '缺少commands列表'}
+        if len(entries) > MAX_BATCH_SIZE:
+            return {'success': False, 'error': f'每个batch最多{MAX_BATCH_SIZE}个命令'}
+        parallel = params.get('parallel', True)
+
+        start = time.perf_counter()
+        results = [None] * len(entries)
+        futures = {}
+        serial = []
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict) or not entry.get('command'):
+                results[index] = {'success': False, 'error': '缺少command'}
+            elif entry['command'] in EXCLUDED_COMMANDS:
+                results[index] = {'success': False, 'error': f"不能在batch中使用: {entry['command']}"}
+            elif parallel and entry['command'] in PARALLEL_COMMANDS:
+                futures[index] = self.executor.submit(
+                    self._run_one, entry['command'], entry.get('params') or {}, conn)
+            else:
+                serial.append(index)
+
+        # 有副作用的命令按请求中的顺序在当前线程执行，与并行部分同时进行
+        for index in serial:
+            entry = entries[index]
+            results[index] = self._run_one(entry['command'], entry.get('params') or {}, conn)
+        for index, future in futures.items():
+            results[index] = future.result()
+
+        return {
+            'success': True,
+            'results': results,
+            'failed': sum(1 for r in results if not r.get('success')),
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)
+        }
+
+    def _run_one(self, command, params, conn):
+        started = time.perf_counter()
+        try:
+            result = dict(self.handle_command(command, params, conn))
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        attachment = result.pop(protocol.ATTACHMENT_KEY, None)
+        if attachment is not None:
+            # 合并的响应只有一条JSON，附件按旧协议的方式base64编码进字段
+            try:
+                result[attachment.legacy_field] = base64.b64encode(attachment.read_all()).decode('ascii')
+            finally:
+                attachment.close()
+        result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+响应缓存 - 服务端共用
+对配置了TTL的命令缓存成功的响应（按命令和参数区分）；同一请求正在执行时，
+其他相同的请求等待这一次的结果而不是再执行一遍；请求参数 refresh=true 时跳过缓存
+"""
+
+import json
+import threading
+import time
+
+import protocol
+
+# 缓存条目上限，超出时先清理过期条目，再丢弃最早写入的
+MAX_ENTRIES = 256
+
+REFRESH_PARAM = 'refresh'
+
+
+class _Flight:
+    """正在执行的一次计算，相同请求等待其结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache:
+    """按命令配置TTL的响应缓存，带单飞去重和命中统计"""
+
+    def __init__(self, ttls):
+        self.ttls = {command: ttl for command, ttl in ttls.items() if ttl > 0}
+        self.entries = {}
+        self.inflight = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def handles(self, command):
+        return command in self.ttls
+
+    def set_ttls(self, ttls):
+        """重新加载配置时更新各命令的缓存时间，不再缓存的命令清除已有条目"""
+        with self.lock:
+            self.ttls = {command: ttl for command, ttl in ttls.items() if ttl > 0}
+            for key in [key for key in self.entries if key[0] not in self.ttls]:
+                del self.entries[key]
+
+    @staticmethod
+    def _key(command, params):
+        params = {k: v for k, v in (params or {}).items() if k != REFRESH_PARAM}
+        return command, json.dumps(params, sort_keys=True, default=str)
+
+    def _count(self, command, name):
+        counters = self.counters.setdefault(command, {'hits': 0, 'misses': 0, 'shared': 0})
+        counters[name] += 1
+
+    def get(self, command, params, compute):
+        """返回缓存的响应，过期、未缓存或要求刷新时调用 compute() 并缓存成功的结果"""
+        key = self._key(command, params)
+        refresh = bool((params or {}).get(REFRESH_PARAM))
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and not refresh and now - entry[0] < self.ttls.get(command, 0):
+                self._count(command, 'hits')
+                return dict(entry[1], cached=True, cache_age=round(now - entry[0], 3))
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.inflight[key] = _Flight()
+                self._count(command, 'misses')
+            else:
+                self._count(command, 'shared')
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            if protocol.ATTACHMENT_KEY in flight.result:
+                return compute()
+            return dict(flight.result)
+
+        try:
+            flight.result = compute()
+            return dict(flight.result)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+                result = flight.result
+                # 只缓存成功且不带附件的响应（附件只能发送一次）
+                if (isinstance(result, dict) and result.get('success')
+                        and protocol.ATTACHMENT_KEY not in result):
+                    self._store(key, result)
+            flight.event.set()
+
+    def _store(self, key, result):
+        """写入缓存（调用方需持有锁）"""
+        self.entries[key] = (time.monotonic(), result)
+        if len(self.entries) > MAX_ENTRIES:
+            now = time.monotonic()
+            for k, (stored, _) in list(self.entries.items()):
+                if now - stored >= self.ttls.get(k[0], 0):
+                    del self.entries[k]
+            while len(self.entries) > MAX_ENTRIES:
+                del self.entries[next(iter(self.entries))]
+
+    def stats(self):
+        with self.lock:
+            commands = {command: dict(counters) for command, counters in self.counters.items()}
+            entries = len(self.entries)
+        return {
+            'hits': sum(c['hits'] for c in commands.values()),
+            'misses': sum(c['misses'] for c in commands.values()),
+            'shared': sum(c['shared'] for c in commands.values()),
+            'entries': entries,
+            'ttls': self.ttls,
+            'commands': commands
+        }
@@ -8,25 +8,60 @@
 import socket
 import json
 import base64
+import codecs
+import itertools
 import os
 import sys
+import time
+from concurrent.futures import Future
 from datetime import datetime
 
+import protocol
+import connection
+import screen
+import file_sync
+import discovery
+import fleet
+from screen_stream import FrameCompositor
+
+class ResponseFuture(Future):
+    """流水线请求的结果；等待时由调用线程读取连接，顺带完成先到达的其他请求"""
+
+    def __init__(self, client):
+        super().__init__()
+        self._client = client
+
+    def result(self, timeout=None):
+        self._client._wait_for(self)
+        return super().result(timeout)
+
 class PhoneMonitorClient:
-    def __init__(self, host, port=8888):
+    def __init__(self, host, port=8888, tls=None, password=None):
         self.host = host
         self.port = port
-        self.socket = None
         self.connected = False
+        # 已发出、尚未收到响应的流水线请求 {request_id: ResponseFuture}
+        self.pending = {}
+        self._request_ids = itertools.count(1)
+        # 长连接：keepalive、空闲心跳、断线重连；读取响应时持有 link.lock
+        self.link = connection.ConnectionManager(host, port, is_idle=lambda: not self.pending,
+                                                 tls=tls, password=password)
+        self.recv_lock = self.link.lock
+    
+    @property
+    def conn(self):
+        """当前连接（重连后会变成新的 Connection）"""
+        return self.link.conn
         
     def connect(self):
         """连接到服务器"""
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(10)
-            self.socket.connect((self.host, self.port))
+            # 协商分帧协议，旧服务端会继续使用__END__协议
+            self.link.open()
+            self.link.start_heartbeat()
             self.connected = True
-            print(f"✓ 已连接到 {self.host}:{self.port}")
+            secure = '（TLS）' if self.link.tls is not None else ''
+            print(f"✓ 已连接到 {self.host}:{self.port}{secure}")
             return True
         except Exception as e:
             print(f"✗ 连接失败: {e}")
@@ -34,19 +69,25 @@ class PhoneMonitorClient:
     
     def disconnect(self):
         """断开连接"""
-        if self.socket:
-            try:
-                self.socket.close()
-            except:
-                pass
+        self.link.close()
         self.connected = False
         print("✓ 已断开连接")
     
-    def send_command(self, command, params=None):
-        """发送命令"""
+    def _framed(self):
+        """当前连接是否使用分帧协议（连接已断开时先重连）"""
+        try:
+            return self.connected and self.link.ensure().framed
+        except ConnectionError:
+            return False
+    
+    def send_command(self, command, params=None, save_to=None):
+        """发送命令（save_to: 响应附件直接写入的文件路径）"""
         if not self.connected:
             print("✗ 未连接到服务器")
             return None
+        # 先取回未完成的流水线响应，避免与本次的响应混淆
+        for future in list(self.pending.values()):
+            self._wait_for(future)
             
         try:
             request = {
@@ -54,30 +95,105 @@ class PhoneMonitorClient:
                 'params': params or {}
             }
             
-            # 发送请求
-            request_data = json.dumps(request, ensure_ascii=False)
-            self.socket.sendall(request_data.encode('utf-8'))
-            
-            # 接收响应
-            response_data = b''
-            while True:
-                chunk = self.socket.recv(4096)
-                if not chunk:
-                    break
-                response_data += chunk
-                # 检查是否收到结束标记
-                if b'\n__END__\n' in response_data:
-                    response_data = response_data.replace(b'\n__END__\n', b'')
-                    break
-            
-            # 解析响应
-            response = json.loads(response_data.decode('utf-8'))
-            return response
+            # 没有副作用的命令在连接中断后自动重连并重发
+            return self.link.request(request, save_to=save_to,
+                                     retry=command in connection.IDEMPOTENT_COMMANDS)
             
         except Exception as e:
             print(f"✗ 命令执行失败: {e}")
             return None
     
+    def send_async(self, command, params=None):
+        """发送带请求ID的命令并立即返回 Future，多个请求只需一次往返
+
+        服务端不支持流水线时同步执行，返回已完成的 Future。
+        """
+        future = ResponseFuture(self)
+        if not (self.connected and self.conn and self.conn.pipelining):
+            future.set_result(self.send_command(command, params))
+            return future
+        # 登记和发送都在锁内完成：心跳持有同一把锁，且只在没有未完成的请求时发送 ping，
+        # 不会在两者之间插入 ping 并读走这条请求的响应
+        with self.link.lock:
+            request_id = next(self._request_ids)
+            self.pending[request_id] = future
+            try:
+                self.conn.send_message({'command': command, 'params': params or {},
+                                        protocol.REQUEST_ID_KEY: request_id})
+                self.link.touch()
+            except Exception as e:
+                self.pending.pop(request_id, None)
+                self.link.drop()
+                future.set_exception(e)
+        return future
+    
+    def _wait_for(self, future):
+        """读取响应直到 future 完成，途中收到的其他响应按ID交给各自的 future"""
+        while not future.done():
+            with self.recv_lock:
+                if future.done():
+                    break
+                try:
+                    response = self.conn.recv_response()
+                except Exception as e:
+                    # 连接出错后无法再对应响应，所有等待中的请求一起失败，下次使用时重连
+                    self.link.drop()
+                    pending, self.pending = self.pending, {}
+                    for waiter in pending.values():
+                        waiter.set_exception(e)
+                    break
+            waiter = self.pending.pop(response.pop(protocol.REQUEST_ID_KEY, None), None)
+            if waiter is not None:
+                waiter.set_result(response)
+    
+    def fetch_many(self, requests):
+        """同时发出多个命令 [(command, params), ...]，按顺序返回响应，失败的项为None"""
+        futures = [self.send_async(command, params) for command, params in requests]
+        responses = []
+        for future in futures:
+            try:
+                responses.append(future.result())
+            except Exception as e:
+                print(f"✗ 命令执行失败: {e}")
+                responses.append(None)
+        return responses
+    
+    def run_batch(self, requests, parallel=True):
+        """用一条 batch 命令执行多个命令 [(command, params), ...]，按顺序返回各自的结果
+
+        旧服务端不支持 batch 时逐个发送。
+        """
+        commands = [{'command': command, 'params': params or {}} for command, params in requests]
+        response = self.send_command('batch', {'commands': commands, 'parallel': parallel})
+        if response and response.get('success'):
+            return response['results']
+        if response and str(response.get('error', '')).startswith('未知命令'):
+            return [self.send_command(command, params) for command, params in requests]
+        print(f"✗ 批量执行失败: {response.get('error') if response else '无响应'}")
+        return None
+    
+    def dashboard(self):
+        """一次往返获取设备信息、进程和网络统计"""
+        start = time.perf_counter()
+        info, processes, network = self.fetch_many([
+            ('info', {}), ('processes', {'limit': 5}), ('network', {})])
+        elapsed = (time.perf_counter() - start) * 1000
+        mode = '流水线' if self.conn and self.conn.pipelining else '逐个请求'
+        print(f"\n📊 概览（{mode}，用时 {elapsed:.0f} ms）")
+        if info and info.get('success'):
+            data = info.get('data', {})
+            print(f"  系统: {data.get('system')}  CPU: {data.get('cpu_percent', '-')}%  "
+                  f"内存: {data.get('memory', {}).get('percent', '-')}%  "
+                  f"磁盘: {data.get('disk', {}).get('percent', '-')}%")
+        if processes and processes.get('success'):
+            print("  进程:")
+            for proc in processes.get('processes', []):
+                print(f"    {proc.get('pid', 0):<8} {proc.get('name', 'N/A'):<30} "
+                      f"CPU {proc.get('cpu_percent', 0):.1f}%")
+        if network and network.get('success'):
+            stats = network.get('stats', {})
+            print(f"  网络: 发送 {stats.get('bytes_sent', 0):,} 字节，接收 {stats.get('bytes_recv', 0):,} 字节")
+    
     def get_device_info(self):
         """获取设备信息"""
         print("\n📱 获取设备信息...")
@@ -97,22 +213,40 @@ class PhoneMonitorClient:
             if 'disk' in data:
                 disk = data['disk']
                 print(f"  磁盘使用: {disk.get('percent')}%")
+            if 'sampled_at' in data:
+                sampled_at = datetime.fromtimestamp(data['sampled_at']).strftime('%H:%M:%S')
+                print(f"  采样时间: {sampled_at}")
+            if 'cache' in data:
+                cache = data['cache']
+                print(f"  响应缓存: 命中 {cache['hits']}，未命中 {cache['misses']}，合并 {cache['shared']}")
         else:
             print(f"✗ 获取失败: {response.get('error') if response else '无响应'}")
     
-    def take_screenshot(self, save_path='screenshot.png'):
-        """截取屏幕"""
+    def take_screenshot(self, save_path='screenshot.png', quality=None, max_width=None):
+        """截取屏幕（格式由文件扩展名决定：.png/.jpg/.webp）"""
         print("\n📸 正在截取屏幕...")
-        response = self.send_command('screenshot')
+        params = {'format': screen.format_for_path(save_path)}
+        if quality:
+            params['quality'] = quality
+        if max_width:
+            params['max_width'] = max_width
+        response = self.send_command('screenshot', params, save_to=save_path)
         if response and response.get('success'):
-            img_data = response.get('data')
-            img_bytes = base64.b64decode(img_data)
-            
-            with open(save_path, 'wb') as f:
-                f.write(img_bytes)
+            if 'saved_to' in response:
+                size = response['attachment']['size']
+            else:
+                # 旧服务端：base64在JSON中
+                img_bytes = base64.b64decode(response.get('data'))
+                with open(save_path, 'wb') as f:
+                    f.write(img_bytes)
+                size = len(img_bytes)
             
             print(f"✓ 截图已保存: {save_path}")
-            print(f"  大小: {len(img_bytes)} 字节")
+            print(f"  大小: {size} 字节")
+            if 'width' in response:
+                print(f"  尺寸: {response['width']}x{response['height']} {response.get('format')}")
+            if 'encode_ms' in response:
+                print(f"  耗时: 截图 {response.get('capture_ms')}ms, 编码 {response['encode_ms']}ms")
             print(f"  时间: {response.get('timestamp')}")
         else:
             print(f"✗ 截图失败: {response.get('error') if response else '无响应'}")
@@ -123,7 +257,8 @@ class PhoneMonitorClient:
         response = self.send_command('processes')
         if response and response.get('success'):
             processes = response.get('processes', [])
-            print(f"\n运行中的进程 (前20个):")
+            total = response.get('total', len(processes))
+            print(f"\n运行中的进程 (前{len(processes)}个，共{total}个):")
             print(f"{'PID':<8} {'名称':<30} {'CPU%':<8} {'内存%':<8}")
             print("-" * 60)
             for proc in processes:
@@ -132,29 +267,67 @@ class PhoneMonitorClient:
         else:
             print(f"✗ 获取失败: {response.get('error') if response else '无响应'}")
     
-    def list_files(self, path=None):
-        """列出文件"""
+    def list_files(self, path=None, sort='name', order='asc', pattern=None, page_size=50):
+        """列出文件（服务端排序、过滤和分页，每次只取一页）"""
         print(f"\n📁 列出文件: {path or '默认目录'}")
-        response = self.send_command('files', {'path': path})
-        if response and response.get('success'):
+        params = {'path': path, 'sort': sort, 'order': order, 'limit': page_size}
+        if pattern:
+            params['pattern'] = pattern
+        
+        shown = 0
+        while True:
+            response = self.send_command('files', params)
+            if not response or not response.get('success'):
+                print(f"✗ 获取失败: {response.get('error') if response else '无响应'}")
+                return
+            
             files = response.get('files', [])
-            current_path = response.get('path')
-            print(f"\n当前路径: {current_path}")
-            print(f"\n{'类型':<6} {'名称':<40} {'大小':<15} {'修改时间'}")
-            print("-" * 90)
+            if not shown:
+                print(f"\n当前路径: {response.get('path')}（共 {response.get('total', len(files))} 项）")
+                print(f"\n{'类型':<6} {'名称':<40} {'大小':<15} {'修改时间'}")
+                print("-" * 90)
             
-            # 先显示目录
-            for item in sorted(files, key=lambda x: (not x['is_dir'], x['name'])):
+            # 服务端已按目录优先排好序
+            for item in files:
                 file_type = '[DIR]' if item['is_dir'] else '[FILE]'
                 size = '-' if item['is_dir'] else f"{item['size']:,} B"
                 print(f"{file_type:<6} {item['name']:<40} {size:<15} {item.get('modified', 'N/A')}")
+            shown += len(files)
+            
+            cursor = response.get('next_cursor')
+            if not cursor:
+                return
+            if input(f"-- 已显示 {shown}/{response.get('total')}，回车显示下一页，q 退出 -- ").strip().lower() == 'q':
+                return
+            params['cursor'] = cursor
+    
+    def search_files(self, **query):
+        """在服务端文件索引中搜索（contains/name/ext/min_size/max_size/after/before/path）"""
+        print(f"\n🔍 搜索文件: {query}")
+        response = self.send_command('search', query)
+        if response and response.get('success'):
+            results = response.get('results', [])
+            more = '（仅显示部分）' if response.get('truncated') else ''
+            print(f"✓ 找到 {len(results)} 项{more}，查询用时 {response.get('query_ms')} ms")
+            if response.get('indexing'):
+                print("  索引正在刷新，结果可能不完整")
+            print(f"\n{'大小':<15} {'修改时间':<20} {'路径'}")
+            print("-" * 90)
+            for item in results:
+                size = '[DIR]' if item['is_dir'] else f"{item['size']:,} B"
+                modified = datetime.fromtimestamp(item['mtime']).strftime('%Y-%m-%d %H:%M:%S')
+                print(f"{size:<15} {modified:<20} {item['path']}")
         else:
-            print(f"✗ 获取失败: {response.get('error') if response else '无响应'}")
+            print(f"✗ 搜索失败: {response.get('error') if response else '无响应'}")
     
     def read_file(self, filepath, save_as=None):
         """读取文件"""
+        if save_as and self._framed():
+            # 保存到本地时走流式下载，不受文件大小限制；读取总是得到完整的新文件，不续传
+            return self.download_file(filepath, save_as, resume=False)
+        
         print(f"\n📄 读取文件: {filepath}")
-        response = self.send_command('read_file', {'filepath': filepath})
+        response = self.send_command('read_file', {'filepath': filepath}, save_to=save_as)
         if response and response.get('success'):
             content = response.get('content')
             file_type = response.get('type')
@@ -163,9 +336,15 @@ class PhoneMonitorClient:
             print(f"✓ 文件读取成功")
             print(f"  类型: {file_type}")
             print(f"  大小: {file_size:,} 字节")
+            if 'compression' in response:
+                c = response['compression']
+                print(f"  传输压缩: {c['codec']}，{c['wire_size']:,} 字节（{c['ratio']:.0%}），"
+                      f"压缩 {c['compress_ms']} ms")
             
             if save_as:
-                if file_type == 'text':
+                if 'saved_to' in response:
+                    pass
+                elif file_type == 'text':
                     with open(save_as, 'w', encoding='utf-8') as f:
                         f.write(content)
                 else:
@@ -184,8 +363,213 @@ class PhoneMonitorClient:
         else:
             print(f"✗ 读取失败: {response.get('error') if response else '无响应'}")
     
+    def _remote_stat(self, conn, filepath):
+        """只取服务端文件的大小和修改时间（length=0 的下载，附件为空）"""
+        conn.send_message({'command': 'download', 'params': {'filepath': filepath, 'offset': 0, 'length': 0}})
+        response = conn.recv_reply()
+        if response.get('success'):
+            conn.recv_attachment()
+        return response
+    
+    def _resume_offset(self, conn, filepath, part, marker):
+        """上次未完成的下载（.part 文件及其记录）与服务端文件的大小和修改时间一致时返回续传位置，否则返回0"""
+        try:
+            with open(marker, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            done = os.path.getsize(part)
+        except (OSError, ValueError):
+            return 0
+        remote = self._remote_stat(conn, filepath)
+        if (remote.get('success') and record.get('filepath') == filepath
+                and record.get('size') == remote.get('size') and record.get('mtime') == remote.get('mtime')
+                and done <= remote['size']):
+            return done
+        return 0
+    
+    def download_file(self, filepath, save_as, resume=True):
+        """流式下载文件；连接中断时自动重连并从断点继续
+
+        下载中的数据写入 save_as.part，服务端文件的大小和修改时间记录在 save_as.part.json；
+        resume 为True且记录与服务端文件一致时从 .part 的末尾续传，否则重新下载。完成后改名为 save_as。
+        """
+        if not self.connected:
+            print("✗ 未连接到服务器")
+            return False
+        
+        part, marker = save_as + '.part', save_as + '.part.json'
+        print(f"\n⬇️  下载文件: {filepath} -> {save_as}")
+        start = time.time()
+        first_offset = None
+        offset = 0
+        state = {'last': 0.0}
+        
+        def progress(received, total):
+            now = time.time()
+            if now - state['last'] < 0.5 and received < total:
+                return
+            state['last'] = now
+            speed = (offset + received - first_offset) / max(now - start, 1e-6) / 1024 / 1024
+            percent = (offset + received) * 100 // (offset + total) if total else 100
+            print(f"\r  {percent:3d}%  {offset + received:,} 字节  {speed:.2f} MB/s", end='', flush=True)
+        
+        while True:
+            try:
+                with self.link.lock:
+                    conn = self.link.ensure()
+                    offset = self._resume_offset(conn, filepath, part, marker) if resume else 0
+                    if first_offset is None:
+                        first_offset = offset
+                        if offset:
+                            print(f"  从 {offset:,} 字节处续传")
+                    conn.send_message({
+                        'command': 'download',
+                        'params': {'filepath': filepath, 'offset': offset}
+                    })
+                    response = conn.recv_reply()
+                    if not response.get('success'):
+                        print(f"✗ 下载失败: {response.get('error')}")
+                        return False
+                    
+                    if offset:
+                        with open(marker, 'r', encoding='utf-8') as f:
+                            record = json.load(f)
+                        if (record.get('size'), record.get('mtime')) != (response.get('size'), response.get('mtime')):
+                            # 确认之后文件又被修改：丢弃这次的数据，重新下载
+                            with open(os.devnull, 'wb') as sink:
+                                conn.recv_attachment(sink)
+                            offset = first_offset = 0
+                            resume = False
+                            continue
+                    else:
+                        with open(marker, 'w', encoding='utf-8') as f:
+                            json.dump({'filepath': filepath, 'size': response.get('size'),
+                                       'mtime': response.get('mtime')}, f)
+                    
+                    # 按块直接写入磁盘，内存占用固定
+                    with open(part, 'ab' if offset else 'wb') as f:
+                        conn.recv_attachment(f, progress)
+                    self.link.touch()
+                break
+            except connection.CONNECTION_ERRORS as e:
+                # 连接停在帧中间，无法继续使用；已写入的部分保留，重连后核对服务端文件再从断点继续
+                self.link.drop()
+                print(f"\n✗ 下载中断: {e}")
+                if not self.link.reconnect():
+                    print("  重新连接后再次下载同一文件即可续传")
+                    return False
+                resume = True
+        
+        os.replace(part, save_as)
+        os.remove(marker)
+        elapsed = max(time.time() - start, 1e-6)
+        transferred = os.path.getsize(save_as) - first_offset
+        print(f"\n✓ 已保存到: {save_as}")
+        print(f"  文件大小: {response.get('size', 0):,} 字节，本次传输 {transferred:,} 字节")
+        print(f"  耗时: {elapsed:.2f} 秒，平均 {transferred / elapsed / 1024 / 1024:.2f} MB/s")
+        return True
+    
+    def sync_directory(self, remote_dir, local_dir, delete=False):
+        """把服务端目录同步到本地：只传输新增和变化的文件，变化的文件只传差异块"""
+        if not self._framed():
+            print("✗ 服务端不支持目录同步")
+            return False
+        
+        print(f"\n🔄 同步目录: {remote_dir} -> {local_dir}")
+        os.makedirs(local_dir, exist_ok=True)
+        local = file_sync.scan_tree(local_dir)
+        manifest = {rel: [size, mtime] for rel, (size, mtime, _) in local.items()}
+        plan = self.send_command('sync_plan', {'path': remote_dir, 'manifest': manifest})
+        if not plan or not plan.get('success'):
+            print(f"✗ 同步失败: {plan.get('error') if plan else '无响应'}")
+            return False
+        print(f"  新增 {len(plan['new'])}，变化 {len(plan['changed'])}，"
+              f"未变化 {plan['unchanged']}，服务端已删除 {len(plan['deleted'])}")
+        
+        # 只为变化的文件计算分块校验和
+        signatures = {}
+        for rel in plan['changed']:
+            size = local[rel][0]
+            if max(size, plan['sizes'].get(rel, 0)) <= file_sync.DELTA_MAX_SIZE:
+                block_size = file_sync.block_size_for(size)
+                signatures[rel] = {'block_size': block_size,
+                                   'blocks': file_sync.file_signature(local[rel][2], block_size)}
+        
+        files = plan['new'] + plan['changed']
+        start = time.time()
+        received = 0
+        try:
+            with self.link.lock:
+                conn = self.link.ensure()
+                if files:
+                    conn.send_message({
+                        'command': 'sync',
+                        'params': {'path': remote_dir, 'files': files, 'signatures': signatures}
+                    })
+                    # 服务端连续推送所有文件，最后一条为汇总响应
+                    while True:
+                        message = conn.recv_message()
+                        if message.get(protocol.PUSH_KEY) == 'sync':
+                            received += self._receive_sync_file(local_dir, message)
+                            continue
+                        if protocol.PUSH_KEY in message:
+                            if 'attachment' in message:
+                                message['attachment_data'] = conn.recv_attachment()
+                            if conn.push_handler:
+                                conn.push_handler(message)
+                            continue
+                        response = message
+                        break
+                    if not response.get('success'):
+                        print(f"✗ 同步失败: {response.get('error')}")
+                        return False
+                    for item in response.get('skipped', []):
+                        print(f"\n  跳过 {item['path']}: {item['error']}")
+        except connection.CONNECTION_ERRORS as e:
+            self.link.drop()
+            print(f"\n✗ 同步中断: {e}")
+            print("  再次同步时已完成的文件会被跳过")
+            return False
+        
+        if delete:
+            for rel in plan['deleted']:
+                try:
+                    os.remove(file_sync.safe_join(local_dir, rel))
+                    print(f"  删除 {rel}")
+                except (OSError, ValueError) as e:
+                    print(f"  删除 {rel} 失败: {e}")
+        
+        elapsed = max(time.time() - start, 1e-6)
+        total = sum(plan['sizes'].values())
+        print(f"\n✓ 同步完成: {len(files)} 个文件，共 {total:,} 字节，实际传输 {received:,} 字节，"
+              f"耗时 {elapsed:.2f} 秒")
+        return True
+    
+    def _receive_sync_file(self, local_dir, message):
+        """接收一个同步文件（整体或差异），先写临时文件再替换，返回传输的字节数"""
+        rel = message['path']
+        dest = file_sync.safe_join(local_dir, rel)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        temp = dest + '.sync-part'
+        with open(temp, 'wb') as f:
+            if message['mode'] == 'delta':
+                literal = self.conn.recv_attachment()
+                written = file_sync.apply_delta(dest, message['ops'], message['block_size'], literal, f)
+                transferred = len(literal)
+            else:
+                written = transferred = self.conn.recv_attachment(f)
+        if written != message['size']:
+            os.remove(temp)
+            raise protocol.ProtocolError(f'{rel} 大小不一致')
+        os.replace(temp, dest)
+        os.utime(dest, (message['mtime'], message['mtime']))
+        kind = '差异' if message['mode'] == 'delta' else '完整'
+        print(f"\r  {kind} {rel[-50:]:<50} {transferred:>14,}/{message['size']:,} 字节", end='', flush=True)
+        return transferred
+    
     def execute_command(self, command):
-        """执行系统命令"""
+        """执行系统命令（新协议下输出边产生边显示）"""
+        if self._framed():
+            return self.execute_command_stream(command)
         print(f"\n💻 执行命令: {command}")
         response = self.send_command('exec', {'command': command})
         if response and response.get('success'):
@@ -198,6 +582,131 @@ class PhoneMonitorClient:
         else:
             print(f"✗ 执行失败: {response.get('error') if response else '无响应'}")
     
+    def execute_command_stream(self, command, timeout=None):
+        """流式执行命令，Ctrl+C 取消"""
+        print(f"\n💻 执行命令: {command}")
+        exec_id = None
+        early = []
+        
+        def on_push(message):
+            """处理一条推送，命令结束时返回结束消息"""
+            if message.get(protocol.PUSH_KEY) != 'exec' or message.get('id') != exec_id:
+                return None
+            if message.get('done'):
+                return message
+            out = sys.stderr if message.get('stream') == 'stderr' else sys.stdout
+            out.write(message.get('data', ''))
+            out.flush()
+            return None
+        
+        # 接收输出期间持有连接，心跳不会读走推送
+        with self.link.lock:
+            # 输出可能先于命令响应到达，先缓存起来
+            self.link.ensure().push_handler = early.append
+            params = {'command': command}
+            if timeout is not None:
+                params['timeout'] = timeout
+            response = self.send_command('exec_stream', params)
+            if self.conn:
+                self.conn.push_handler = None
+            if not response or not response.get('success'):
+                print(f"✗ 执行失败: {response.get('error') if response else '无响应'}")
+                return
+            exec_id = response['id']
+        
+            done = None
+            for message in early:
+                done = done or on_push(message)
+            cancelled = False
+            while done is None:
+                try:
+                    done = on_push(self.conn.recv_push())
+                except socket.timeout:
+                    continue
+                except KeyboardInterrupt:
+                    if not cancelled:
+                        # 取消请求的响应不是推送，会被 on_push 忽略
+                        self.conn.send_message({'command': 'exec_cancel', 'params': {'id': exec_id}})
+                        cancelled = True
+                        print("\n[*] 正在取消...")
+                except Exception as e:
+                    # 命令随连接一起结束（服务端在连接关闭时终止进程），无法续接
+                    self.link.drop()
+                    print(f"\n✗ 接收输出失败: {e}")
+                    return
+        
+        if done.get('error'):
+            print(f"\n✗ 执行失败: {done['error']}")
+            return
+        reasons = {'timeout': '超时', 'idle_timeout': '长时间无输出', 'output_limit': '输出超过上限',
+                   'cancelled': '已取消'}
+        note = f"（{reasons[done['reason']]}）" if done.get('reason') in reasons else ''
+        print(f"\n返回码: {done.get('returncode')}{note}  用时 {done.get('elapsed')}s")
+    
+    def submit_job(self, command):
+        """提交后台任务，立即返回任务ID"""
+        response = self.send_command('exec_async', {'command': command})
+        if response and response.get('success'):
+            print(f"✓ 已提交后台任务 #{response['id']}（{response['status']}），用 job {response['id']} 查看结果")
+        else:
+            print(f"✗ 提交失败: {response.get('error') if response else '无响应'}")
+    
+    def list_jobs(self):
+        """列出本客户端的后台任务"""
+        response = self.send_command('job_list')
+        if not response or not response.get('success'):
+            print(f"✗ 获取失败: {response.get('error') if response else '无响应'}")
+            return
+        pool = response.get('pool', {})
+        print(f"\n后台任务（工作线程 {pool.get('workers')}，排队 {pool.get('queued')}，运行 {pool.get('running')}）:")
+        print(f"{'ID':<6} {'状态':<10} {'返回码':<8} {'用时':<10} {'输出':<12} {'命令'}")
+        print("-" * 80)
+        for job in response.get('jobs', []):
+            elapsed = f"{job['elapsed']}s" if job.get('elapsed') is not None else '-'
+            returncode = job['returncode'] if job.get('returncode') is not None else '-'
+            output = f"{job['stdout_bytes'] + job['stderr_bytes']:,} B"
+            print(f"{job['id']:<6} {job['status']:<10} {returncode!s:<8} {elapsed:<10} {output:<12} {job['command']}")
+    
+    def show_job(self, job_id):
+        """显示后台任务的状态和目前为止的全部输出"""
+        response = self.send_command('job_status', {'id': job_id})
+        if not response or not response.get('success'):
+            print(f"✗ 获取失败: {response.get('error') if response else '无响应'}")
+            return
+        print(f"\n任务 #{job_id}: {response['command']}")
+        print(f"  状态: {response['status']}  返回码: {response.get('returncode')}  "
+              f"结束原因: {response.get('reason') or '-'}  用时: {response.get('elapsed')}s")
+        stdout, stderr = [], []
+        # 输出按字节偏移分段返回，多字节字符可能被分在两段，用增量解码器拼接
+        decoders = {name: codecs.getincrementaldecoder('utf-8')(errors='replace') for name in ('stdout', 'stderr')}
+        offsets = {'stdout_offset': 0, 'stderr_offset': 0}
+        while True:
+            chunk = self.send_command('job_output', dict(offsets, id=job_id))
+            if not chunk or not chunk.get('success'):
+                print(f"✗ 读取输出失败: {chunk.get('error') if chunk else '无响应'}")
+                return
+            data = {name: base64.b64decode(chunk[name]) for name in ('stdout', 'stderr')}
+            stdout.append(decoders['stdout'].decode(data['stdout']))
+            stderr.append(decoders['stderr'].decode(data['stderr']))
+            if not data['stdout'] and not data['stderr']:
+                break
+            offsets = {'stdout_offset': chunk['stdout_offset'], 'stderr_offset': chunk['stderr_offset']}
+        stdout.append(decoders['stdout'].decode(b'', final=True))
+        stderr.append(decoders['stderr'].decode(b'', final=True))
+        print("\n标准输出:")
+        print(''.join(stdout) or '(无输出)')
+        if any(stderr):
+            print("\n标准错误:")
+            print(''.join(stderr))
+    
+    def cancel_job(self, job_id):
+        """取消后台任务"""
+        response = self.send_command('job_cancel', {'id': job_id})
+        if response and response.get('success'):
+            print(f"✓ 任务 #{job_id} 已取消（{response['status']}）")
+        else:
+            print(f"✗ 取消失败: {response.get('error') if response else '无响应'}")
+    
     def get_network_info(self):
         """获取网络信息"""
         print("\n🌐 获取网络信息...")
@@ -219,6 +728,155 @@ class PhoneMonitorClient:
         else:
             print(f"✗ 获取失败: {response.get('error') if response else '无响应'}")
     
+    def get_history(self, minutes=10, points=20):
+        """查询指标历史（一次请求取回降采样后的曲线）"""
+        print(f"\n📈 最近 {minutes} 分钟指标历史...")
+        response = self.send_command('history', {'seconds': minutes * 60, 'points': points})
+        if response and response.get('success'):
+            timestamps = response.get('timestamps', [])
+            print(f"\n采样点: {response.get('samples')}，显示: {len(timestamps)}")
+            print(f"{'时间':<10} {'CPU%':<8} {'内存%':<8} {'电量%':<8}")
+            print("-" * 40)
+            for i, ts in enumerate(timestamps):
+                def fmt(name):
+                    value = response.get(name, [None] * len(timestamps))[i]
+                    return '-' if value is None else f"{value:.1f}"
+                print(f"{datetime.fromtimestamp(ts).strftime('%H:%M:%S'):<10} "
+                      f"{fmt('cpu_percent'):<8} {fmt('memory_percent'):<8} {fmt('battery_level'):<8}")
+        else:
+            print(f"✗ 获取失败: {response.get('error') if response else '无响应'}")
+    
+    def watch(self, topics=None, interval=2):
+        """订阅实时指标（服务端推送），按 Ctrl+C 停止"""
+        if not self._framed():
+            print("✗ 服务端不支持订阅推送")
+            return
+        
+        topics = topics or ['cpu', 'memory', 'net_io', 'battery']
+        response = self.send_command('subscribe', {'topics': topics, 'interval': interval})
+        if not response or not response.get('success'):
+            print(f"✗ 订阅失败: {response.get('error') if response else '无响应'}")
+            return
+        
+        sub_id = response['subscription']
+        print(f"\n📡 实时监控（每 {response['interval']} 秒，Ctrl+C 停止）")
+        state = {}
+        try:
+            with self.link.lock:
+                while True:
+                    try:
+                        message = self.conn.recv_message()
+                    except socket.timeout:
+                        # 数据无变化时服务端不推送
+                        continue
+                    except connection.CONNECTION_ERRORS as e:
+                        # 重连后用同样的参数重新订阅，已显示的状态保留，服务端会先推送一次完整数据
+                        print(f"✗ 连接中断: {e}")
+                        if not self.link.reconnect():
+                            return
+                        response = self.send_command('subscribe', {'topics': topics, 'interval': interval})
+                        if not response or not response.get('success'):
+                            print(f"✗ 重新订阅失败: {response.get('error') if response else '无响应'}")
+                            return
+                        sub_id = response['subscription']
+                        continue
+                    if message.get(protocol.PUSH_KEY) != 'metrics':
+                        continue
+                    self.link.touch()
+                    protocol.apply_metrics_update(state, message.get('data', {}))
+                    ts = datetime.fromtimestamp(message['sampled_at']).strftime('%H:%M:%S')
+                    print(f"[{ts}] {protocol.format_metrics(state)}")
+                    for proc in state.get('processes') or []:
+                        print(f"    {proc.get('pid', 0):<8} {proc.get('name', 'N/A'):<30} {proc.get('cpu_percent', 0):.1f}%")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.link.alive:
+                self.send_command('unsubscribe', {'subscription': sub_id})
+            print("\n✓ 已停止实时监控")
+    
+    def stream_screen(self, fps=5, save_path='stream.jpg', duration=None, max_width=None):
+        """接收屏幕直播，合成完整画面并定期保存到save_path，按 Ctrl+C 停止"""
+        if not self._framed():
+            print("✗ 服务端不支持屏幕直播")
+            return
+        if screen.Image is None:
+            print("✗ 需要安装Pillow: pip install pillow")
+            return
+        
+        compositor = FrameCompositor()
+        state = {'error': None}
+        
+        def on_push(message):
+            if message.get(protocol.PUSH_KEY) != 'screen':
+                return
+            if 'error' in message:
+                state['error'] = message['error']
+            else:
+                compositor.apply(message)
+        
+        params = {'fps': fps, 'format': screen.format_for_path(save_path)}
+        if max_width:
+            params['max_width'] = max_width
+        
+        def start_stream():
+            # 首帧可能先于命令响应到达，由 push_handler 处理
+            conn = self.link.ensure()
+            conn.push_handler = on_push
+            response = self.send_command('screen_stream', params)
+            conn.push_handler = None
+            if not response or not response.get('success'):
+                print(f"✗ 直播启动失败: {response.get('error') if response else '无响应'}")
+                return None
+            return response
+        
+        response = start_stream()
+        if response is None:
+            return
+        
+        print(f"\n🎬 屏幕直播（{response['fps']} fps，画面保存到 {save_path}，Ctrl+C 停止）")
+        start = time.time()
+        last_report = start
+        frames, received = 0, 0
+        try:
+            with self.link.lock:
+                while state['error'] is None:
+                    if duration and time.time() - start >= duration:
+                        break
+                    try:
+                        on_push(self.conn.recv_push())
+                    except socket.timeout:
+                        continue
+                    except connection.CONNECTION_ERRORS as e:
+                        # 重连后重新开始推送，画布保留，新的直播首帧是完整画面
+                        print(f"✗ 连接中断: {e}")
+                        response = self.link.reconnect() and start_stream()
+                        if not response:
+                            return
+                        continue
+                    
+                    self.link.touch()
+                    now = time.time()
+                    if now - last_report >= 1 and compositor.canvas is not None:
+                        message = compositor.last_message
+                        elapsed = now - last_report
+                        print(f"  {(compositor.frames - frames) / elapsed:5.1f} fps  "
+                              f"{(compositor.bytes - received) / elapsed / 1024:8.1f} KB/s  "
+                              f"区域 {len(message['tiles']):<3} 丢帧 {message['dropped']:<4} "
+                              f"编码 {message['encode_ms']}ms")
+                        compositor.canvas.save(save_path)
+                        frames, received, last_report = compositor.frames, compositor.bytes, now
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if state['error'] is None and response and self.link.alive:
+                self.send_command('screen_stream_stop', {'stream': response['stream']})
+            if compositor.canvas is not None:
+                compositor.canvas.save(save_path)
+            if state['error']:
+                print(f"✗ 直播中止: {state['error']}")
+            print(f"\n✓ 已停止屏幕直播，共接收 {compositor.frames} 帧，{compositor.bytes / 1024:.1f} KB")
+    
     def ping(self):
         """测试连接"""
         response = self.send_command('ping')
@@ -239,13 +897,26 @@ class PhoneMonitorClient:
         commands_help = """
 可用命令:
   info          - 获取设备信息
+  dashboard     - 一次往返获取设备信息、进程和网络概览
+  batch <命令...> - 用一个请求执行多个无参数命令，如: batch info network battery
   screenshot    - 截取屏幕
   processes     - 列出运行进程
-  files [path]  - 列出文件
+  files [path] [*.jpg] [sort=name|size|mtime|type] [desc] - 分页列出文件
   read <file>   - 读取文件内容
-  exec <cmd>    - 执行系统命令
+  search <关键词|*.jpg> [ext=jpg,png] [min_size=字节] [after=2024-01-01] [path=目录] - 搜索文件索引
+  download <file> [本地路径] - 下载文件（支持断点续传）
+  sync <远程目录> <本地目录> [--delete] - 增量同步目录到本地
+  exec <cmd>    - 执行系统命令（实时输出，Ctrl+C 取消）
+  bg <cmd>      - 作为后台任务执行命令，立即返回任务ID
+  jobs          - 列出后台任务
+  job <id>      - 查看后台任务的状态和输出
+  kill <id>     - 取消后台任务
   network       - 获取网络信息
+  history [分钟] - 查看指标历史
+  watch [秒]    - 实时监控（服务端推送）
+  stream [fps] [文件] - 屏幕直播，画面定期保存到文件
   ping          - 测试连接
+  discover      - 查找局域网中的其他服务端
   help          - 显示帮助
   exit          - 退出
 """
@@ -267,27 +938,108 @@ class PhoneMonitorClient:
                     print(commands_help)
                 elif cmd == 'info':
                     self.get_device_info()
+                elif cmd == 'dashboard':
+                    self.dashboard()
+                elif cmd == 'batch':
+                    names = (args or '').split()
+                    if not names:
+                        print("✗ 请指定要执行的命令")
+                        continue
+                    start = time.perf_counter()
+                    results = self.run_batch([(name, {}) for name in names])
+                    if results is None:
+                        continue
+                    print(f"\n批量执行 {len(names)} 个命令，用时 {(time.perf_counter() - start) * 1000:.0f} ms")
+                    for name, result in zip(names, results):
+                        if result and result.get('success'):
+                            print(f"  ✓ {name:<12} {result.get('elapsed_ms', '-')} ms")
+                        else:
+                            print(f"  ✗ {name:<12} {result.get('error') if result else '无响应'}")
                 elif cmd == 'screenshot':
                     filename = args if args else f'screenshot_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png'
                     self.take_screenshot(filename)
                 elif cmd == 'processes':
                     self.list_processes()
                 elif cmd == 'files':
-                    self.list_files(args)
+                    path, options = None, {}
+                    for token in (args or '').split():
+                        if token.startswith('sort='):
+                            options['sort'] = token[5:]
+                        elif token == 'desc':
+                            options['order'] = 'desc'
+                        elif '*' in token or '?' in token:
+                            options['pattern'] = token
+                        else:
+                            path = token
+                    self.list_files(path, **options)
+                elif cmd == 'search':
+                    query = {}
+                    for token in (args or '').split():
+                        key, sep, value = token.partition('=')
+                        if sep:
+                            query[key] = value
+                        elif '*' in token or '?' in token:
+                            query['name'] = token
+                        else:
+                            query['contains'] = token
+                    if query:
+                        self.search_files(**query)
+                    else:
+                        print("✗ 请指定搜索条件")
                 elif cmd == 'read':
                     if args:
                         self.read_file(args)
                     else:
                         print("✗ 请指定文件路径")
+                elif cmd == 'download':
+                    if args:
+                        remote, _, local = args.partition(' ')
+                        local = local.strip() or os.path.basename(remote)
+                        if self._framed():
+                            self.download_file(remote, local)
+                        else:
+                            # 旧服务端没有流式下载，整体读取后保存
+                            self.read_file(remote, local)
+                    else:
+                        print("✗ 请指定文件路径")
+                elif cmd == 'sync':
+                    parts = (args or '').split()
+                    delete = '--delete' in parts
+                    parts = [p for p in parts if p != '--delete']
+                    if len(parts) == 2:
+                        self.sync_directory(parts[0], parts[1], delete)
+                    else:
+                        print("✗ 用法: sync <远程目录> <本地目录> [--delete]")
                 elif cmd == 'exec':
                     if args:
                         self.execute_command(args)
                     else:
                         print("✗ 请指定要执行的命令")
+                elif cmd == 'bg':
+                    if args:
+                        self.submit_job(args)
+                    else:
+                        print("✗ 请指定要执行的命令")
+                elif cmd == 'jobs':
+                    self.list_jobs()
+                elif cmd in ('job', 'kill'):
+                    if args and args.strip().isdigit():
+                        (self.show_job if cmd == 'job' else self.cancel_job)(int(args))
+                    else:
+                        print(f"✗ 用法: {cmd} <任务ID>")
                 elif cmd == 'network':
                     self.get_network_info()
+                elif cmd == 'history':
+                    self.get_history(int(args) if args else 10)
+                elif cmd == 'watch':
+                    self.watch(interval=float(args) if args else 2)
+                elif cmd == 'stream':
+                    fps, _, filename = (args or '').partition(' ')
+                    self.stream_screen(float(fps) if fps else 5, filename.strip() or 'stream.jpg')
                 elif cmd == 'ping':
                     self.ping()
+                elif cmd == 'discover':
+                    discovery.run_cli([])
                 else:
                     print(f"✗ 未知命令: {cmd}")
                     print("输入 'help' 查看可用命令")
@@ -301,15 +1053,29 @@ def main():
     """主函数"""
     print("\n📱 手机监控客户端 v1.0\n")
     
-    if len(sys.argv) < 2:
-        print("用法: python client.py <服务器IP> [端口]")
+    if len(sys.argv) > 1 and sys.argv[1] == '--fleet':
+        # 多设备模式：同时向设备列表中的所有服务端发送命令
+        fleet.run_cli(sys.argv[2:])
+        return
+    
+    if len(sys.argv) > 1 and sys.argv[1] == '--discover':
+        # 不知道服务端地址时先查找局域网中的设备
+        discovery.run_cli(sys.argv[2:])
+        return
+    
+    args = sys.argv[1:]
+    tls, password = connection.security_options(args)
+    if not args:
+        print("用法: python client.py <服务器IP> [端口] [--tls] [--ca server.crt] [--password 密码]")
+        print("      python client.py --fleet hosts.txt [命令] [JSON参数] [--timeout 秒]")
+        print("      python client.py --discover [--timeout 秒]")
         print("示例: python client.py 192.168.1.100 8888")
         sys.exit(1)
     
-    host = sys.argv[1]
-    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8888
+    host = args[0]
+    port = int(args[1]) if len(args) > 1 else 8888
     
-    client = PhoneMonitorClient(host, port)
+    client = PhoneMonitorClient(host, port, tls, password)
     
     if client.connect():
         # 测试连接
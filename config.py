@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+配置加载 - 读取 config.ini，供服务端共用
+配置文件缺失或某项未填写时使用默认值；服务端运行中修改配置文件（或发送 SIGHUP）会重新加载，
+能够在线调整的设置立即生效，其余设置在重启后生效
+"""
+
+import configparser
+import logging
+import os
+import signal
+import threading
+import time
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
+
+
+def data_dir():
+    """运行时生成的数据（文件索引等）的存放目录，不写入程序目录"""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'phone-monitor')
+
+
+MB = 1024 * 1024
+LOGGER_NAME = 'monitor'
+
+# 功能开关 -> 受其控制的命令
+FEATURE_COMMANDS = {
+    'allow_exec': ('exec', 'exec_stream', 'exec_async'),
+    'allow_file_access': ('files', 'read_file', 'download', 'search', 'sync_plan', 'sync', 'reindex'),
+    'allow_screenshot': ('screenshot', 'screen_stream'),
+}
+
+# 绑定端口、线程数、缓冲区大小等在启动时使用的设置，重新加载时保留当前值，重启后生效
+RESTART_REQUIRED = frozenset([
+    'host', 'port', 'server_mode', 'listen_backlog', 'worker_threads', 'reload_interval',
+    'tls_enabled', 'tls_cert', 'tls_key', 'job_workers', 'history_size',
+    'index_enabled', 'index_roots', 'index_file', 'index_interval', 'discovery_enabled', 'discovery_port'
+])
+
+
+class MonitorConfig:
+    """config.ini 的类型化视图"""
+
+    def __init__(self):
+        # 配置文件路径和命令行覆盖的设置，重新加载时沿用
+        self.path = CONFIG_FILE
+        self.overrides = {}
+
+        # [SERVER]
+        self.host = '0.0.0.0'
+        self.port = 8888
+        self.max_clients = 5
+        self.listen_backlog = 16
+        self.server_mode = 'thread'
+        self.worker_threads = 4
+        self.compress_threshold = 4096
+        self.pipeline_depth = 8
+        self.reload_interval = 2.0
+
+        # [SECURITY]
+        self.password_enabled = False
+        self.password = ''
+        self.allowed_ips = []
+        self.tls_enabled = False
+        self.tls_cert = os.path.join(os.path.dirname(CONFIG_FILE), 'server.crt')
+        self.tls_key = os.path.join(os.path.dirname(CONFIG_FILE), 'server.key')
+
+        # [FEATURES]
+        self.allow_exec = True
+        self.allow_file_access = True
+        self.allow_screenshot = True
+        self.max_file_size = 10 * MB
+        self.screenshot_quality = 85
+        self.exec_timeout = 300.0
+        self.exec_idle_timeout = 0.0
+        self.exec_max_output = 10 * MB
+        self.job_workers = 2
+        self.job_queue_size = 16
+        self.job_max_per_client = 4
+        self.job_output_budget = 32 * MB
+
+        # [METRICS]
+        self.sample_interval = 2.0
+        self.history_size = 3600
+        self.battery_interval = 30.0
+
+        # [INDEX]
+        self.index_enabled = False
+        self.index_roots = []
+        self.index_file = os.path.join(data_dir(), 'file_index.db')
+        self.index_interval = 600.0
+
+        # [DISCOVERY]
+        self.discovery_enabled = True
+        self.discovery_port = 8889
+        self.device_name = ''
+
+        # [CACHE] 命令名 -> 响应缓存秒数
+        self.cache_enabled = True
+        self.cache_ttls = {'apps': 300.0, 'battery': 10.0, 'wifi': 30.0, 'network': 2.0}
+
+        # [LOGGING]
+        self.logging_enabled = True
+        self.log_file = os.path.join(os.path.dirname(CONFIG_FILE), 'monitor.log')
+        self.log_level = 'INFO'
+
+    @classmethod
+    def load(cls, path=CONFIG_FILE, overrides=None):
+        """从文件加载配置，overrides（如命令行指定的端口）优先于文件中的值"""
+        config = cls()
+        config.path = path
+        config.overrides = dict(overrides or {})
+        parser = configparser.ConfigParser()
+        parser.read(path, encoding='utf-8')
+
+        config.host = parser.get('SERVER', 'HOST', fallback=config.host).strip() or config.host
+        config.port = parser.getint('SERVER', 'PORT', fallback=config.port)
+        config.max_clients = parser.getint('SERVER', 'MAX_CLIENTS', fallback=config.max_clients)
+        config.listen_backlog = parser.getint('SERVER', 'LISTEN_BACKLOG', fallback=config.listen_backlog)
+        config.server_mode = parser.get('SERVER', 'SERVER_MODE', fallback=config.server_mode).strip().lower()
+        config.worker_threads = parser.getint('SERVER', 'WORKER_THREADS', fallback=config.worker_threads)
+        config.compress_threshold = parser.getint('SERVER', 'COMPRESS_THRESHOLD', fallback=config.compress_threshold)
+        config.pipeline_depth = max(1, parser.getint('SERVER', 'PIPELINE_DEPTH', fallback=config.pipeline_depth))
+        config.reload_interval = parser.getfloat('SERVER', 'RELOAD_INTERVAL', fallback=config.reload_interval)
+
+        config.password_enabled = parser.getboolean('SECURITY', 'ENABLE_PASSWORD', fallback=config.password_enabled)
+        config.password = parser.get('SECURITY', 'PASSWORD', fallback=config.password)
+        ips = parser.get('SECURITY', 'ALLOWED_IPS', fallback='')
+        config.allowed_ips = [ip.strip() for ip in ips.split(',') if ip.strip()]
+        config.tls_enabled = parser.getboolean('SECURITY', 'ENABLE_TLS', fallback=config.tls_enabled)
+        base = os.path.dirname(os.path.abspath(path))
+        for attr, key in (('tls_cert', 'TLS_CERT'), ('tls_key', 'TLS_KEY')):
+            value = parser.get('SECURITY', key, fallback='').strip()
+            if value:
+                setattr(config, attr, os.path.join(base, value))
+
+        for attr in FEATURE_COMMANDS:
+            setattr(config, attr, parser.getboolean('FEATURES', attr.upper(), fallback=getattr(config, attr)))
+        config.max_file_size = int(parser.getfloat(
+            'FEATURES', 'MAX_FILE_SIZE', fallback=config.max_file_size / MB) * MB)
+        config.screenshot_quality = parser.getint('FEATURES', 'SCREENSHOT_QUALITY', fallback=config.screenshot_quality)
+        config.exec_timeout = parser.getfloat('FEATURES', 'EXEC_TIMEOUT', fallback=config.exec_timeout)
+        config.exec_idle_timeout = parser.getfloat('FEATURES', 'EXEC_IDLE_TIMEOUT', fallback=config.exec_idle_timeout)
+        config.exec_max_output = int(parser.getfloat(
+            'FEATURES', 'EXEC_MAX_OUTPUT', fallback=config.exec_max_output / MB) * MB)
+        config.job_workers = parser.getint('FEATURES', 'JOB_WORKERS', fallback=config.job_workers)
+        config.job_queue_size = parser.getint('FEATURES', 'JOB_QUEUE_SIZE', fallback=config.job_queue_size)
+        config.job_max_per_client = parser.getint('FEATURES', 'JOB_MAX_PER_CLIENT', fallback=config.job_max_per_client)
+        config.job_output_budget = int(parser.getfloat(
+            'FEATURES', 'JOB_OUTPUT_BUDGET', fallback=config.job_output_budget / MB) * MB)
+
+        config.sample_interval = parser.getfloat('METRICS', 'SAMPLE_INTERVAL', fallback=config.sample_interval)
+        config.history_size = parser.getint('METRICS', 'HISTORY_SIZE', fallback=config.history_size)
+        config.battery_interval = parser.getfloat('METRICS', 'BATTERY_INTERVAL', fallback=config.battery_interval)
+
+        config.index_enabled = parser.getboolean('INDEX', 'ENABLE_INDEX', fallback=config.index_enabled)
+        roots = parser.get('INDEX', 'INDEX_ROOTS', fallback='')
+        config.index_roots = [r.strip() for r in roots.split(',') if r.strip()]
+        index_file = parser.get('INDEX', 'INDEX_FILE', fallback='').strip()
+        if index_file:
+            config.index_file = os.path.join(data_dir(), os.path.expanduser(index_file))
+        config.index_interval = parser.getfloat('INDEX', 'INDEX_INTERVAL', fallback=config.index_interval)
+
+        config.discovery_enabled = parser.getboolean('DISCOVERY', 'ENABLE_DISCOVERY', fallback=config.discovery_enabled)
+        config.discovery_port = parser.getint('DISCOVERY', 'DISCOVERY_PORT', fallback=config.discovery_port)
+        config.device_name = parser.get('DISCOVERY', 'DEVICE_NAME', fallback=config.device_name).strip()
+
+        config.cache_enabled = parser.getboolean('CACHE', 'ENABLE_CACHE', fallback=config.cache_enabled)
+        if parser.has_section('CACHE'):
+            # <命令>_TTL = 秒数，0表示不缓存该命令
+            for key, value in parser.items('CACHE'):
+                if key.endswith('_ttl'):
+                    config.cache_ttls[key[:-4]] = float(value or 0)
+
+        config.logging_enabled = parser.getboolean('LOGGING', 'ENABLE_LOGGING', fallback=config.logging_enabled)
+        log_file = parser.get('LOGGING', 'LOG_FILE', fallback='').strip()
+        if log_file:
+            config.log_file = os.path.join(os.path.dirname(os.path.abspath(path)), log_file)
+        config.log_level = parser.get('LOGGING', 'LOG_LEVEL', fallback=config.log_level).strip().upper()
+
+        for attr, value in config.overrides.items():
+            setattr(config, attr, value)
+        return config
+
+    def reload(self):
+        """重新读取配置文件，返回 (新配置, 已变化的设置, 需要重启才能生效的设置)
+
+        需要重启的设置在新配置中保留当前值，运行中的服务与配置保持一致。
+        配置文件有误时抛出异常，调用方继续使用当前配置。
+        """
+        config = type(self).load(self.path, self.overrides)
+        changed = sorted(name for name, value in vars(config).items() if getattr(self, name, None) != value)
+        pending = [name for name in changed if name in RESTART_REQUIRED]
+        for name in pending:
+            setattr(config, name, getattr(self, name))
+        return config, [name for name in changed if name not in RESTART_REQUIRED], pending
+
+    def command_allowed(self, command):
+        """命令所属的功能（执行命令、文件访问、截图）是否已在配置中关闭"""
+        return all(getattr(self, attr) or command not in commands for attr, commands in FEATURE_COMMANDS.items())
+
+
+def setup_logging(config):
+    """按 [LOGGING] 设置服务端日志，重新加载配置后再次调用即可切换文件和级别"""
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    if config.logging_enabled:
+        try:
+            handler = logging.FileHandler(config.log_file, encoding='utf-8')
+        except OSError as e:
+            print(f"[-] 无法打开日志文件: {e}")
+        else:
+            handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(getattr(logging, config.log_level, logging.INFO))
+            return logger
+    logger.addHandler(logging.NullHandler())
+    logger.setLevel(logging.CRITICAL + 1)
+    return logger
+
+
+class ConfigWatcher(threading.Thread):
+    """配置文件变化（修改时间或大小）或收到 SIGHUP 时调用 callback 重新加载"""
+
+    # 检测到变化后稍等再读取，避免读到编辑器只写了一半的文件
+    SETTLE_DELAY = 0.2
+
+    def __init__(self, path, callback, interval=2.0):
+        super().__init__(name='config-watcher', daemon=True)
+        self.path = path
+        self.callback = callback
+        # 0表示不检查文件，只响应 SIGHUP
+        self.interval = interval
+        self._signature = self._stat()
+        self._wake = threading.Event()
+        self._stopped = False
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def install_signal(self):
+        """注册 SIGHUP（只能在主线程中调用，Windows没有该信号）；处理函数只唤醒监视线程"""
+        if not hasattr(signal, 'SIGHUP') or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signal.SIGHUP, lambda signum, frame: self.trigger())
+        return True
+
+    def trigger(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def run(self):
+        while True:
+            signalled = self._wake.wait(self.interval if self.interval > 0 else None)
+            self._wake.clear()
+            if self._stopped:
+                return
+            if not signalled and self._stat() == self._signature:
+                continue
+            time.sleep(self.SETTLE_DELAY)
+            self._signature = self._stat()
+            try:
+                self.callback()
+            except Exception as e:
+                print(f"[-] 重新加载配置失败: {e}")
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+客户端连接管理 - 命令行和图形客户端共用
+TCP keepalive 让系统及时发现半开的连接；空闲时用 ping 做应用层心跳；
+连接断开后按指数退避自动重连，没有副作用的命令自动重发，下载、订阅等由调用方在重连后从断点继续；
+启用TLS时保存会话，重连和额外的连接恢复会话而不做完整握手
+"""
+
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+import protocol
+import security
+
+DEFAULT_TIMEOUT = 10
+# 连接空闲超过该秒数时发送一次 ping
+HEARTBEAT_INTERVAL = 15
+# 重连退避：首次等待0.5秒，每次翻倍，最长30秒，最多尝试6次（约1分钟）
+BACKOFF_INITIAL = 0.5
+BACKOFF_MAX = 30
+MAX_RETRIES = 6
+# TCP keepalive：空闲30秒后开始探测，每10秒一次，3次无应答判定断开
+KEEPALIVE_IDLE = 30
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+# 重复执行没有副作用的命令，连接断开后可以在新连接上自动重发
+IDEMPOTENT_COMMANDS = frozenset([
+    'info', 'network', 'processes', 'battery', 'wifi', 'apps', 'history', 'files', 'read_file',
+    'search', 'screenshot', 'sync_plan', 'job_status', 'job_output', 'job_list', 'ping'
+])
+
+# 说明连接已不可用的异常（读超时时响应可能稍后才到，连接同样无法继续使用）
+CONNECTION_ERRORS = (OSError, EOFError, protocol.ProtocolError)
+
+
+def enable_keepalive(sock, idle=KEEPALIVE_IDLE, interval=KEEPALIVE_INTERVAL, count=KEEPALIVE_COUNT):
+    """开启TCP keepalive并按平台设置探测间隔，不支持的选项忽略"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if sys.platform == 'win32' and hasattr(socket, 'SIO_KEEPALIVE_VALS'):
+        sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, idle * 1000, interval * 1000))
+        return
+    # Linux/Android: TCP_KEEPIDLE；macOS: TCP_KEEPALIVE
+    idle_option = getattr(socket, 'TCP_KEEPIDLE', getattr(socket, 'TCP_KEEPALIVE', None))
+    for option, value in ((idle_option, idle),
+                          (getattr(socket, 'TCP_KEEPINTVL', None), interval),
+                          (getattr(socket, 'TCP_KEEPCNT', None), count)):
+        if option is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, option, value)
+            except OSError:
+                pass
+
+
+def security_options(args):
+    """从命令行参数中取出 --tls、--ca <证书>、--password <密码>（参数列表被原地修改）
+
+    密码也可以通过环境变量 MONITOR_PASSWORD 提供，避免出现在进程列表中。返回 (TLS上下文或None, 密码或None)
+    """
+    def take(flag, has_value):
+        if flag not in args:
+            return None
+        index = args.index(flag)
+        value = args[index + 1] if has_value and index + 1 < len(args) else True
+        del args[index:index + (2 if has_value else 1)]
+        return value
+
+    tls = take('--tls', False)
+    cafile = take('--ca', True)
+    password = take('--password', True) or os.environ.get('MONITOR_PASSWORD')
+    context = security.client_context(cafile) if tls or cafile else None
+    return context, password
+
+
+def create_connection(host, port, timeout=DEFAULT_TIMEOUT):
+    """建立开启了keepalive的TCP连接"""
+    sock = socket.create_connection((host, port), timeout=timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    enable_keepalive(sock)
+    return sock
+
+
+class ConnectionManager:
+    """维护到一个服务端的长连接：断开时自动重连，空闲时发送心跳
+
+    使用连接（发送请求并读取响应，或持续接收推送）期间需持有 lock，心跳只在没有人持有时进行。
+    """
+
+    def __init__(self, host, port, timeout=DEFAULT_TIMEOUT, heartbeat=HEARTBEAT_INTERVAL,
+                 retries=MAX_RETRIES, log=print, is_idle=None, tls=None, password=None):
+        self.host = host
+        self.port = port
+        # tls: security.client_context() 创建的上下文，None表示不加密
+        self.tls = tls
+        self.tls_session = None
+        self.password = password
+        self.timeout = timeout
+        self.heartbeat = heartbeat
+        self.retries = retries
+        self.log = log
+        # 调用方还有未完成的请求时返回False（例如流水线请求），此时不发送心跳
+        self.is_idle = is_idle or (lambda: True)
+        self.conn = None
+        self.lock = threading.RLock()
+        self.last_used = time.monotonic()
+        self.reconnects = 0
+        self._closed = threading.Event()
+        self._heartbeat_thread = None
+
+    @property
+    def alive(self):
+        return self.conn is not None
+
+    def open(self):
+        """建立连接并协商协议，失败时抛出异常"""
+        with self.lock:
+            self._closed.clear()
+            self._open()
+
+    def _open(self):
+        self.conn = self.open_connection()
+        self.touch()
+
+    def open_connection(self):
+        """新建一条完成协商和认证的连接（不由本对象管理，可用于推送等独立用途）"""
+        sock = create_connection(self.host, self.port, self.timeout)
+        try:
+            if self.tls is not None:
+                sock = self.tls.wrap_socket(sock, session=self.tls_session)
+            conn = protocol.Connection(sock, client=True)
+            conn.negotiate()
+            if self.tls is not None:
+                # TLS 1.3 的会话票据在握手后到达，读完 hello 响应时已经可用
+                self.tls_session = sock.session
+            security.authenticate(conn, self.password)
+        except BaseException:
+            sock.close()
+            raise
+        return conn
+
+    @property
+    def tls_resumed(self):
+        """当前连接是否恢复了之前的TLS会话"""
+        return bool(self.conn is not None and self.tls is not None and self.conn.sock.session_reused)
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def drop(self):
+        """丢弃当前连接（出错后连接状态未知），下次使用时重连"""
+        with self.lock:
+            if self.conn is not None:
+                try:
+                    self.conn.sock.close()
+                except OSError:
+                    pass
+                self.conn = None
+
+    def close(self):
+        """主动断开，停止心跳和正在等待的重连"""
+        self._closed.set()
+        self.drop()
+
+    def reconnect(self):
+        """按指数退避重连，成功返回True；已调用 close() 或多次失败时返回False"""
+        with self.lock:
+            self.drop()
+            delay = BACKOFF_INITIAL
+            for attempt in range(1, self.retries + 1):
+                if self._closed.is_set():
+                    return False
+                try:
+                    self._open()
+                except CONNECTION_ERRORS as e:
+                    # 加入随机抖动，避免多台客户端在服务端重启后同时重连
+                    wait = min(delay, BACKOFF_MAX) * random.uniform(0.8, 1.2)
+                    self.log(f"✗ 重连失败（第 {attempt} 次）: {e}，{wait:.1f} 秒后重试")
+                    if self._closed.wait(wait):
+                        return False
+                    delay *= 2
+                    continue
+                self.reconnects += 1
+                resumed = '（恢复TLS会话）' if self.tls_resumed else ''
+                self.log(f"✓ 已重新连接到 {self.host}:{self.port}{resumed}")
+                return True
+            self.log(f"✗ 重连 {self.retries} 次均失败，下次发送命令时再试")
+            return False
+
+    def ensure(self):
+        """返回可用的连接，已断开时先重连"""
+        with self.lock:
+            if self.conn is None and not self.reconnect():
+                raise ConnectionError('未连接到服务器')
+            return self.conn
+
+    def request(self, message, save_to=None, progress=None, retry=False):
+        """发送请求并读取响应；连接断开时重连，retry为True时在新连接上重发一次"""
+        with self.lock:
+            for attempt in range(2):
+                conn = self.ensure()
+                try:
+                    conn.send_message(message)
+                    response = conn.recv_response(save_to=save_to, progress=progress)
+                except CONNECTION_ERRORS as e:
+                    self.drop()
+                    if attempt or not retry or self._closed.is_set():
+                        raise
+                    self.log(f"✗ 连接中断: {e}，重连后重发")
+                    continue
+                self.touch()
+                return response
+
+    def start_heartbeat(self):
+        if self.heartbeat and (self._heartbeat_thread is None or not self._heartbeat_thread.is_alive()):
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name='heartbeat',
+                                                      daemon=True)
+            self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        while not self._closed.wait(min(self.heartbeat / 3, 5)):
+            if time.monotonic() - self.last_used < self.heartbeat:
+                continue
+            # 正在使用连接时跳过，下一轮再检查
+            if not self.lock.acquire(blocking=False):
+                continue
+            try:
+                if self._closed.is_set() or not self.is_idle():
+                    continue
+                if self.conn is None:
+                    # 之前的重连已放弃，空闲时每个心跳周期在后台再试一轮
+                    if not self.reconnect():
+                        self.touch()
+                    continue
+                try:
+                    self.conn.send_message({'command': 'ping', 'params': {}})
+                    self.conn.recv_response()
+                    self.touch()
+                except CONNECTION_ERRORS as e:
+                    self.log(f"\n✗ 心跳失败: {e}，正在重连")
+                    self.reconnect()
+            finally:
+                self.lock.release()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+局域网自动发现 - 服务端应答，客户端查找
+服务端在UDP端口上监听广播和组播的探测包，直接回复设备名称、平台、服务端口和负载；
+客户端发出一次探测后在短时间窗口内收集所有回复，不需要逐个IP尝试TCP连接
+"""
+
+import json
+import os
+import platform
+import socket
+import struct
+import threading
+import time
+import uuid
+
+DISCOVERY_PORT = 8889
+MULTICAST_GROUP = '239.255.77.77'
+# 探测包和应答包的开头，过滤掉同一端口上的其他UDP数据
+MAGIC = b'PMDISC1'
+MAX_PACKET = 2048
+
+
+def _encode(message):
+    return MAGIC + json.dumps(message, ensure_ascii=False).encode('utf-8')
+
+
+def _decode(data):
+    if not data.startswith(MAGIC):
+        return None
+    try:
+        return json.loads(data[len(MAGIC):].decode('utf-8'))
+    except ValueError:
+        return None
+
+
+def local_ip():
+    """本机的局域网IP；不依赖外网（没有默认路由时也能得到结果）"""
+    # UDP connect 不发送数据，只让系统选出对应路由的源地址
+    for target in ('10.255.255.255', '192.168.255.255', '8.8.8.8'):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            s.connect((target, 1))
+            address = s.getsockname()[0]
+            if not address.startswith('0.'):
+                return address
+        except OSError:
+            pass
+        finally:
+            s.close()
+    try:
+        for address in socket.gethostbyname_ex(socket.gethostname())[2]:
+            if not address.startswith('127.'):
+                return address
+    except OSError:
+        pass
+    return '127.0.0.1'
+
+
+class DiscoveryResponder(threading.Thread):
+    """服务端：应答探测包；is_allowed(ip) 为False的来源不应答（与 ALLOWED_IPS 一致）"""
+
+    def __init__(self, info_provider, port=DISCOVERY_PORT, is_allowed=None):
+        super().__init__(name='discovery', daemon=True)
+        self.info_provider = info_provider
+        self.port = port
+        self.is_allowed = is_allowed or (lambda address: True)
+        self.sock = None
+        self._stop_event = threading.Event()
+
+    def open(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            try:
+                # 同一台机器上运行多个服务端时都能收到探测
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            except OSError:
+                pass
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.bind(('', self.port))
+        try:
+            membership = struct.pack('4s4s', socket.inet_aton(MULTICAST_GROUP), socket.inet_aton('0.0.0.0'))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        except OSError:
+            # 没有支持组播的接口时仍可响应广播
+            pass
+        sock.settimeout(1.0)
+        self.sock = sock
+
+    def start(self):
+        """绑定端口并启动应答线程，端口不可用时打印原因后放弃（不影响服务端）"""
+        try:
+            self.open()
+        except OSError as e:
+            print(f"[-] 自动发现未启动: {e}")
+            return
+        super().start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                data, address = self.sock.recvfrom(MAX_PACKET)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            probe = _decode(data)
+            if not probe or probe.get('type') != 'discover':
+                continue
+            # 不允许连接的来源也不透露设备名称、端口和认证方式
+            if not self.is_allowed(address[0]):
+                continue
+            try:
+                reply = dict(self.info_provider(), type='reply', nonce=probe.get('nonce'))
+                self.sock.sendto(_encode(reply), address)
+            except Exception as e:
+                print(f"[-] 自动发现应答失败: {e}")
+        self.sock.close()
+
+
+def load_info():
+    """负载信息：系统平均负载（支持时），CPU和内存由调用方的采样数据补充"""
+    try:
+        return {'loadavg': [round(x, 2) for x in os.getloadavg()]}
+    except (AttributeError, OSError):
+        return {}
+
+
+def discover(timeout=0.5, port=DISCOVERY_PORT, targets=None):
+    """发出探测并在 timeout 秒内收集应答，返回按地址排序的设备列表（同一服务端只保留一条）"""
+    nonce = uuid.uuid4().hex
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        sock.bind(('', 0))
+        probe = _encode({'type': 'discover', 'nonce': nonce})
+        for address in targets or ('<broadcast>', MULTICAST_GROUP):
+            try:
+                sock.sendto(probe, (address, port))
+            except OSError:
+                pass
+
+        devices = {}
+        sent = time.monotonic()
+        deadline = sent + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data, (host, _) = sock.recvfrom(MAX_PACKET)
+            except socket.timeout:
+                break
+            reply = _decode(data)
+            if not reply or reply.get('nonce') != nonce:
+                continue
+            reply.pop('nonce', None)
+            reply.pop('type', None)
+            reply['host'] = host
+            reply['latency_ms'] = round((time.monotonic() - sent) * 1000, 1)
+            devices[(host, reply.get('port'))] = reply
+    finally:
+        sock.close()
+    return sorted(devices.values(), key=lambda d: (socket.inet_aton(d['host']), d.get('port') or 0))
+
+
+def device_name():
+    return platform.node() or socket.gethostname()
+
+
+def format_devices(devices):
+    """发现结果表：名称、地址、平台、负载、应答延迟"""
+    if not devices:
+        return '未发现设备（确认服务端已启动、在同一网段，且防火墙允许UDP端口）'
+    width = max([len(d.get('name') or '') for d in devices] + [4])
+    lines = [f"{'名称':<{width}}  {'地址':<21}  {'平台':<8}  {'延迟':>8}  负载", '-' * (width + 70)]
+    for d in devices:
+        load = d.get('load') or {}
+        parts = [label for key, label in (('tls', 'TLS'), ('auth', '需密码')) if d.get(key)]
+        if load.get('loadavg'):
+            parts.append(f"loadavg {load['loadavg'][0]}")
+        if load.get('cpu') is not None:
+            parts.append(f"CPU {load['cpu']}%")
+        if load.get('memory') is not None:
+            parts.append(f"内存 {load['memory']}%")
+        if load.get('battery') is not None:
+            parts.append(f"电量 {load['battery']}%")
+        if load.get('clients') is not None:
+            parts.append(f"客户端 {load['clients']}")
+        address = f"{d['host']}:{d.get('port')}"
+        lines.append(f"{d.get('name') or '':<{width}}  {address:<21}  {d.get('platform') or '':<8}  "
+                     f"{d.get('latency_ms', 0):>6.1f}ms  {'  '.join(parts)}")
+    lines.append('-' * (width + 70))
+    lines.append(f"共发现 {len(devices)} 台设备")
+    return '\n'.join(lines)
+
+
+def run_cli(args):
+    """client.py --discover [--timeout 秒] [--port UDP端口]"""
+    timeout, port = 0.5, DISCOVERY_PORT
+    if '--timeout' in args:
+        timeout = float(args[args.index('--timeout') + 1])
+    if '--port' in args:
+        port = int(args[args.index('--port') + 1])
+    print(f"🔍 正在查找局域网中的服务端（{timeout}秒）...")
+    print(format_devices(discover(timeout, port)))
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令流式执行 - 服务端共用
+用 Popen 启动命令，stdout/stderr 各由一个线程增量读取并立即回调；
+支持取消、总超时、无输出超时和输出总量上限，超限时结束整个进程组
+"""
+
+import codecs
+import itertools
+import os
+import signal
+import subprocess
+import threading
+import time
+
+import protocol
+
+READ_SIZE = 65536
+
+# 发送SIGTERM后等待多久再强制结束（秒）
+KILL_GRACE = 2.0
+
+# 每个连接同时运行的流式命令上限
+MAX_STREAMS_PER_CONNECTION = 4
+
+
+def _terminate(proc):
+    """结束进程及其子进程（POSIX下命令在独立的进程组中运行）"""
+    if proc.poll() is not None:
+        return
+    try:
+        if os.name == 'posix':
+            os.killpg(proc.pid, signal.SIGTERM)
+        else:
+            proc.terminate()
+        proc.wait(KILL_GRACE)
+    except subprocess.TimeoutExpired:
+        if os.name == 'posix':
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_process(command, on_output, timeout=0, idle_timeout=0, max_output=0, cancel_event=None):
+    """运行命令直到结束，输出到达时调用 on_output(流名称, bytes)
+
+    返回 (返回码, 结束原因)，原因为 exit/timeout/idle_timeout/output_limit/cancelled。
+    """
+    kwargs = {'start_new_session': True} if os.name == 'posix' else {}
+    proc = subprocess.Popen(command, shell=True, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, **kwargs)
+    state = {'bytes': 0, 'last_output': time.monotonic()}
+    lock = threading.Lock()
+
+    def reader(pipe, name):
+        fd = pipe.fileno()
+        while True:
+            try:
+                data = os.read(fd, READ_SIZE)
+            except OSError:
+                break
+            if not data:
+                break
+            with lock:
+                allowed = max_output - state['bytes'] if max_output else len(data)
+                state['bytes'] += len(data)
+                state['last_output'] = time.monotonic()
+            # 超过上限的部分不再转发，进程由主循环结束
+            if allowed > 0:
+                on_output(name, data[:allowed])
+
+    readers = [threading.Thread(target=reader, args=(proc.stdout, 'stdout'), daemon=True),
+               threading.Thread(target=reader, args=(proc.stderr, 'stderr'), daemon=True)]
+    for t in readers:
+        t.start()
+
+    start = time.monotonic()
+    reason = 'exit'
+    try:
+        while proc.poll() is None:
+            if cancel_event is not None and cancel_event.wait(0.1):
+                reason = 'cancelled'
+            elif cancel_event is None:
+                time.sleep(0.1)
+            now = time.monotonic()
+            if reason == 'exit':
+                if timeout and now - start > timeout:
+                    reason = 'timeout'
+                elif idle_timeout and now - state['last_output'] > idle_timeout:
+                    reason = 'idle_timeout'
+                elif max_output and state['bytes'] > max_output:
+                    reason = 'output_limit'
+            if reason != 'exit':
+                _terminate(proc)
+                break
+    finally:
+        if proc.poll() is None:
+            _terminate(proc)
+        # 后台子进程可能仍持有管道，读完已有数据后不再等待
+        for t in readers:
+            t.join(KILL_GRACE)
+        proc.stdout.close()
+        proc.stderr.close()
+    return proc.wait(), reason
+
+
+class ExecStream(threading.Thread):
+    """单个流式命令：输出按到达顺序推送给客户端，结束时推送返回码和原因"""
+
+    def __init__(self, stream_id, conn, command, timeout, idle_timeout, max_output, on_finish):
+        super().__init__(name=f'exec-stream-{stream_id}', daemon=True)
+        self.id = stream_id
+        self.conn = conn
+        self.command = command
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_output = max_output
+        self.on_finish = on_finish
+        self.cancel_event = threading.Event()
+        self.sent = 0
+        self.decoders = {name: codecs.getincrementaldecoder('utf-8')(errors='replace')
+                         for name in ('stdout', 'stderr')}
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def on_output(self, name, data):
+        self.sent += len(data)
+        self._push(name, self.decoders[name].decode(data))
+
+    def _push(self, name, text):
+        if not text:
+            return
+        try:
+            self.conn.send_message({protocol.PUSH_KEY: 'exec', 'id': self.id, 'stream': name, 'data': text})
+        except Exception:
+            # 客户端已断开，不再继续运行
+            self.cancel_event.set()
+
+    def run(self):
+        start = time.time()
+        try:
+            returncode, reason = run_process(self.command, self.on_output, self.timeout,
+                                             self.idle_timeout, self.max_output, self.cancel_event)
+            message = {'returncode': returncode, 'reason': reason}
+        except Exception as e:
+            message = {'returncode': None, 'reason': 'error', 'error': str(e)}
+        # 输出末尾不完整的多字节字符在结束消息之前发出（替换为U+FFFD）
+        for name, decoder in self.decoders.items():
+            self._push(name, decoder.decode(b'', final=True))
+        message.update({protocol.PUSH_KEY: 'exec', 'id': self.id, 'done': True,
+                        'bytes': self.sent, 'elapsed': round(time.time() - start, 3)})
+        try:
+            self.conn.send_message(message)
+        except Exception:
+            pass
+        finally:
+            self.on_finish(self)
+
+
+class ExecStreamManager:
+    """管理各连接正在运行的流式命令"""
+
+    def __init__(self):
+        self.streams = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def start(self, conn, command, timeout=0, idle_timeout=0, max_output=0):
+        """启动命令，返回 ExecStream；超过单连接上限时抛出 RuntimeError"""
+        with self.lock:
+            running = sum(1 for s in self.streams.values() if s.conn is conn)
+            if running >= MAX_STREAMS_PER_CONNECTION:
+                raise RuntimeError(f'同时运行的命令不能超过{MAX_STREAMS_PER_CONNECTION}个')
+            stream = ExecStream(next(self._ids), conn, command, timeout, idle_timeout,
+                                max_output, self._finished)
+            self.streams[stream.id] = stream
+        stream.start()
+        return stream
+
+    def _finished(self, stream):
+        with self.lock:
+            self.streams.pop(stream.id, None)
+
+    def cancel(self, conn, stream_id=None):
+        """取消该连接的命令（stream_id为空时取消全部），返回取消的数量"""
+        with self.lock:
+            streams = [s for s in self.streams.values()
+                       if s.conn is conn and (stream_id is None or s.id == stream_id)]
+        for stream in streams:
+            stream.cancel()
+        return len(streams)
+
+    def remove_connection(self, conn):
+        """连接关闭时结束其命令"""
+        self.cancel(conn)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件索引 - 服务端共用
+把配置的根目录下所有文件的路径、大小和修改时间保存在SQLite中，search 命令直接查询索引；
+增量刷新时只重新扫描修改时间变化过的目录，未变化的目录只需一次stat
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS dirs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    dir_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    is_dir INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir_id);
+CREATE INDEX IF NOT EXISTS files_name ON files (name_lower);
+CREATE INDEX IF NOT EXISTS files_ext ON files (ext);
+CREATE INDEX IF NOT EXISTS files_size ON files (size);
+CREATE INDEX IF NOT EXISTS files_mtime ON files (mtime);
+'''
+
+SORT_COLUMNS = {'name': 'f.name_lower', 'size': 'f.size', 'mtime': 'f.mtime', 'path': 'd.path'}
+
+# 刷新时每隔多少秒提交一次，期间的查询看到的是部分更新的索引
+COMMIT_INTERVAL = 0.5
+
+
+def parse_time(value):
+    """时间参数：时间戳或 YYYY-MM-DD[ HH:MM:SS] 字符串"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            pass
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'无法识别的时间: {value}')
+
+
+class FileIndex:
+    """基于SQLite的文件索引，刷新在后台线程中进行"""
+
+    def __init__(self, db_path, roots):
+        self.db_path = db_path
+        self.roots = [os.path.abspath(os.path.expanduser(r)) for r in roots]
+        self.db = None
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.refreshing = False
+        self.last_refresh = None
+        self.last_stats = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def _connect(self):
+        """首次使用时打开数据库（调用方需持有锁）"""
+        if self.db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self.db = db
+        return self.db
+
+    # ---------- 刷新 ----------
+
+    def start(self, interval=0):
+        """启动后台刷新：立即刷新一次，interval>0 时之后按周期刷新"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,),
+                                        name='file-index', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self, interval):
+        while not self._stop_event.is_set():
+            try:
+                stats = self.refresh()
+                print(f"[*] 文件索引已刷新: 扫描 {stats['dirs_scanned']} 个目录，"
+                      f"跳过 {stats['dirs_skipped']} 个，用时 {stats['elapsed_ms']:.0f}ms")
+            except Exception as e:
+                print(f"[-] 文件索引刷新失败: {e}")
+            if interval <= 0 or self._stop_event.wait(interval):
+                break
+
+    def refresh_async(self):
+        """在新线程中刷新一次，已在刷新时不重复启动；返回是否启动"""
+        if self.refreshing:
+            return False
+        threading.Thread(target=self.refresh, name='file-index-refresh', daemon=True).start()
+        return True
+
+    def refresh(self):
+        """增量刷新所有根目录，返回统计信息"""
+        with self.refresh_lock:
+            self.refreshing = True
+            start = time.perf_counter()
+            stats = {'dirs_scanned': 0, 'dirs_skipped': 0, 'dirs_removed': 0}
+            try:
+                with self.lock:
+                    db = self._connect()
+                    known = {path: (dir_id, mtime_ns) for dir_id, path, mtime_ns
+                             in db.execute('SELECT id, path, mtime_ns FROM dirs')}
+                seen = set()
+                for root in self.roots:
+                    self._refresh_tree(root, known, seen, stats)
+                # 根目录之外的旧记录（配置变更）和已删除的目录；中途停止时不清理
+                removed = [dir_id for path, (dir_id, _) in known.items()
+                           if path not in seen and not self._stop_event.is_set()]
+                with self.lock:
+                    for dir_id in removed:
+                        db.execute('DELETE FROM files WHERE dir_id = ?', (dir_id,))
+                        db.execute('DELETE FROM dirs WHERE id = ?', (dir_id,))
+                    db.commit()
+                stats['dirs_removed'] = len(removed)
+            finally:
+                self.refreshing = False
+            stats['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            self.last_refresh = time.time()
+            self.last_stats = stats
+            return stats
+
+    def _refresh_tree(self, root, known, seen, stats):
+        db = self.db
+        stack = [root]
+        last_commit = time.monotonic()
+        while stack and not self._stop_event.is_set():
+            path = stack.pop()
+            if path in seen:
+                continue
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(path)
+
+            row = known.get(path)
+            if row is not None and row[1] == mtime_ns:
+                # 目录内容未变化（新增、删除、重命名都会改变目录的修改时间），只需继续检查子目录
+                stats['dirs_skipped'] += 1
+                with self.lock:
+                    names = db.execute('SELECT name FROM files WHERE dir_id = ? AND is_dir = 1',
+                                       (row[0],)).fetchall()
+                stack.extend(os.path.join(path, name) for name, in names)
+                continue
+
+            rows = []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        name = entry.name
+                        ext = '' if is_dir else os.path.splitext(name)[1][1:].lower()
+                        rows.append((name, name.lower(), ext, 0 if is_dir else st.st_size,
+                                     st.st_mtime, int(is_dir)))
+                        if is_dir:
+                            stack.append(entry.path)
+            except OSError:
+                continue
+
+            stats['dirs_scanned'] += 1
+            with self.lock:
+                if row is None:
+                    dir_id = db.execute('INSERT INTO dirs (path, mtime_ns) VALUES (?, ?)',
+                                        (path, mtime_ns)).lastrowid
+                else:
+                    dir_id = row[0]
+                    db.execute('UPDATE dirs SET mtime_ns = ? WHERE id = ?', (mtime_ns, dir_id))
+                    db.execute('DELETE FROM files WHERE dir_id = ?', (dir_id,))
+                db.executemany('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               [(dir_id,) + r for r in rows])
+                now = time.monotonic()
+                if now - last_commit >= COMMIT_INTERVAL:
+                    db.commit()
+                    last_commit = now
+        with self.lock:
+            db.commit()
+
+    # ---------- 查询 ----------
+
+    def search(self, name=None, contains=None, ext=None, min_size=None, max_size=None,
+               after=None, before=None, path=None, kind=None, sort='name', order='asc', limit=100):
+        """按条件查询索引，参数错误抛出 ValueError"""
+        where, args = [], []
+        if name:
+            name = str(name).lower()
+            if any(c in name for c in '*?['):
+                where.append('f.name_lower GLOB ?')
+            else:
+                where.append('f.name_lower = ?')
+            args.append(name)
+        if contains:
+            where.append('instr(f.name_lower, ?) > 0')
+            args.append(str(contains).lower())
+        if ext:
+            if isinstance(ext, str):
+                ext = ext.split(',')
+            exts = [e.strip().lstrip('.').lower() for e in ext if e.strip()]
+            where.append(f"f.ext IN ({','.join('?' * len(exts))})")
+            args.extend(exts)
+        if min_size is not None:
+            where.append('f.size >= ?')
+            args.append(int(min_size))
+        if max_size is not None:
+            where.append('f.size <= ?')
+            args.append(int(max_size))
+        after, before = parse_time(after), parse_time(before)
+        if after is not None:
+            where.append('f.mtime >= ?')
+            args.append(after)
+        if before is not None:
+            where.append('f.mtime < ?')
+            args.append(before)
+        if path:
+            prefix = os.path.abspath(os.path.expanduser(path)).rstrip(os.sep)
+            where.append('(d.path = ? OR substr(d.path, 1, ?) = ?)')
+            args.extend([prefix, len(prefix) + 1, prefix + os.sep])
+        if kind in ('file', 'dir'):
+            where.append('f.is_dir = ?')
+            args.append(int(kind == 'dir'))
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f'不支持的排序字段: {sort}')
+        direction = 'DESC' if str(order).lower() == 'desc' else 'ASC'
+        limit = max(1, min(int(limit or 100), 10000))
+
+        sql = ('SELECT d.path, f.name, f.size, f.mtime, f.is_dir FROM files f '
+               'JOIN dirs d ON d.id = f.dir_id')
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        # 有过滤条件时用一元+禁止按排序列的索引遍历，让SQLite先用过滤列的索引缩小范围
+        column = SORT_COLUMNS[sort]
+        if where:
+            column = '+' + column
+        sql += f' ORDER BY {column} {direction} LIMIT ?'
+        args.append(limit + 1)
+
+        start = time.perf_counter()
+        with self.lock:
+            rows = self._connect().execute(sql, args).fetchall()
+        elapsed = (time.perf_counter() - start) * 1000
+
+        results = [{
+            'path': os.path.join(directory, name),
+            'name': name,
+            'size': size,
+            'mtime': mtime,
+            'is_dir': bool(is_dir)
+        } for directory, name, size, mtime, is_dir in rows[:limit]]
+        return {
+            'results': results,
+            'count': len(results),
+            'truncated': len(rows) > limit,
+            'query_ms': round(elapsed, 2)
+        }
+
+    def status(self):
+        """索引状态"""
+        with self.lock:
+            db = self._connect()
+            files = db.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+            dirs = db.execute('SELECT COUNT(*) FROM dirs').fetchone()[0]
+        return {
+            'roots': self.roots,
+            'files': files,
+            'dirs': dirs,
+            'refreshing': self.refreshing,
+            'last_refresh': self.last_refresh,
+            'last_stats': self.last_stats
+        }
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录列表 - 服务端共用
+基于 os.scandir，文件类型直接来自目录项，只有排序或当前页需要时才stat；
+支持服务端排序、按通配符/扩展名过滤和基于游标的分页
+"""
+
+import base64
+import fnmatch
+import functools
+import heapq
+import json
+import operator
+import os
+import re
+from datetime import datetime
+
+SORT_KEYS = ('name', 'size', 'mtime', 'type')
+
+
+@functools.total_ordering
+class _Descending:
+    """倒序比较的包装，使升序和降序可以共用同一套堆选择与游标比较"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def encode_cursor(key):
+    """把一页最后一项的排序键编码为游标字符串"""
+    raw = json.dumps(key, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        rank, primary, name = json.loads(base64.urlsafe_b64decode(str(cursor).encode('ascii')))
+        return [int(rank), primary, str(name)]
+    except Exception:
+        raise ValueError('无效的分页游标')
+
+
+class _Entry:
+    """目录项及其按需获取的stat结果"""
+
+    __slots__ = ('entry', 'is_dir', '_stat')
+
+    def __init__(self, entry, is_dir):
+        self.entry = entry
+        self.is_dir = is_dir
+        self._stat = None
+
+    def stat(self):
+        # DirEntry 自身也会缓存stat结果，这里只避免重复的方法调用
+        if self._stat is None:
+            try:
+                self._stat = self.entry.stat()
+            except FileNotFoundError:
+                # 悬空的符号链接，显示链接本身
+                self._stat = self.entry.stat(follow_symlinks=False)
+        return self._stat
+
+    def raw_key(self, sort, dirs_first):
+        """排序键: [目录优先级, 主键, 名称]，可直接JSON编码为游标"""
+        name = self.entry.name
+        rank = 0 if (self.is_dir or not dirs_first) else 1
+        if sort == 'size':
+            primary = 0 if self.is_dir else self.stat().st_size
+        elif sort == 'mtime':
+            primary = self.stat().st_mtime
+        elif sort == 'type':
+            primary = '' if self.is_dir else os.path.splitext(name)[1].lower()
+        else:
+            primary = name.lower()
+        return [rank, primary, name]
+
+
+def _sort_key(raw, descending):
+    rank, primary, name = raw
+    if descending:
+        return (rank, _Descending(primary), _Descending(name))
+    return (rank, primary, name)
+
+
+def _file_filter(pattern, extensions):
+    """生成文件过滤函数；目录不受过滤影响，便于继续向下浏览"""
+    regex = re.compile(fnmatch.translate(pattern), re.IGNORECASE) if pattern else None
+    if isinstance(extensions, str):
+        extensions = extensions.split(',')
+    suffixes = tuple('.' + e.strip().lstrip('.').lower() for e in extensions or [] if e.strip())
+
+    def accept(name):
+        if regex is not None and not regex.match(name):
+            return False
+        if suffixes and not name.lower().endswith(suffixes):
+            return False
+        return True
+    return accept
+
+
+def list_directory(path, sort='name', order='asc', pattern=None, extensions=None,
+                   limit=None, cursor=None, dirs_first=True):
+    """列出目录，返回一页结果；limit为空时返回全部
+
+    参数错误（排序字段、游标）抛出 ValueError，目录无法读取时抛出 OSError。
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f'不支持的排序字段: {sort}')
+    descending = str(order).lower() == 'desc'
+    limit = int(limit) if limit else None
+    after = _sort_key(decode_cursor(cursor), descending) if cursor else None
+    accept = _file_filter(pattern, extensions)
+
+    keyed = []
+    total = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+                if not is_dir and not accept(entry.name):
+                    continue
+                item = _Entry(entry, is_dir)
+                raw = item.raw_key(sort, dirs_first)
+            except OSError:
+                # 无权限等
+                continue
+            total += 1
+            key = _sort_key(raw, descending)
+            if after is not None and not key > after:
+                continue
+            keyed.append((key, raw, item))
+
+    # 只需要一页时用堆选出前limit项，不对整个目录排序
+    first = operator.itemgetter(0)
+    if limit is not None and limit < len(keyed):
+        page = heapq.nsmallest(limit, keyed, key=first)
+        has_more = True
+    else:
+        page = sorted(keyed, key=first)
+        has_more = False
+
+    files = []
+    for _, _, item in page:
+        try:
+            stat = item.stat()
+        except OSError:
+            continue
+        files.append({
+            'name': item.entry.name,
+            'is_dir': item.is_dir,
+            'size': 0 if item.is_dir else stat.st_size,
+            'mtime': stat.st_mtime,
+            'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+    return {
+        'files': files,
+        'total': total,
+        'sort': sort,
+        'order': 'desc' if descending else 'asc',
+        'next_cursor': encode_cursor(page[-1][1]) if has_more and page else None
+    }
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录同步 - 服务端与客户端共用
+客户端上报已有文件的大小和修改时间，服务端给出新增/变化/删除清单；
+对变化的文件客户端再提供分块校验和（弱校验可滚动 + 强校验），
+服务端只发送客户端没有的数据块，客户端用本地旧文件的块和收到的字面数据重建新文件
+"""
+
+import hashlib
+import os
+import zlib
+
+# 两端修改时间相差不超过该值（秒）视为相同，兼容FAT等时间精度较低的文件系统
+MTIME_WINDOW = 1.0
+
+MIN_BLOCK_SIZE = 2048
+MAX_BLOCK_SIZE = 1024 * 1024
+
+# 超过该大小的变化文件直接整体发送（差异计算需要把文件读入内存）
+DELTA_MAX_SIZE = 64 * 1024 * 1024
+
+ADLER_MOD = 65521
+
+# 滚动查找逐字节进行，在纯Python中较慢，只用于不超过该大小的文件；更大的文件按块对齐比较
+ROLLING_MAX_SIZE = 2 * 1024 * 1024
+
+
+def block_size_for(size):
+    """按文件大小选择块大小，使每个文件的校验和不超过约1024个"""
+    block = MIN_BLOCK_SIZE
+    while block * 1024 < size and block < MAX_BLOCK_SIZE:
+        block *= 2
+    return block
+
+
+def weak_checksum(block):
+    """弱校验和使用adler32（C实现），滚动更新见 compute_delta"""
+    return zlib.adler32(block)
+
+
+def strong_checksum(block):
+    return hashlib.blake2b(block, digest_size=8).hexdigest()
+
+
+def file_signature(path, block_size):
+    """计算文件各块的 [弱校验, 强校验] 列表"""
+    blocks = []
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            blocks.append([weak_checksum(block), strong_checksum(block)])
+    return blocks
+
+
+def scan_tree(root):
+    """递归列出目录下的普通文件，返回 {相对路径: (大小, 修改时间, 完整路径)}，路径统一用/分隔"""
+    files = {}
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            it = os.scandir(path)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        rel = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                        files[rel] = (st.st_size, st.st_mtime, entry.path)
+                except OSError:
+                    continue
+    return files
+
+
+def make_plan(remote, manifest):
+    """对比服务端文件和客户端清单 {相对路径: [大小, 修改时间]}"""
+    new, changed, unchanged = [], [], 0
+    for rel, (size, mtime, _) in remote.items():
+        local = manifest.get(rel)
+        if local is None:
+            new.append(rel)
+        elif local[0] != size or abs(local[1] - mtime) > MTIME_WINDOW:
+            changed.append(rel)
+        else:
+            unchanged += 1
+    deleted = [rel for rel in manifest if rel not in remote]
+    return {'new': sorted(new), 'changed': sorted(changed), 'deleted': sorted(deleted),
+            'unchanged': unchanged}
+
+
+def compute_delta(data, block_size, signatures):
+    """计算差异，返回 (操作列表, 字面数据)
+
+    操作为 ['c', 起始块号, 块数]（复用客户端旧文件的块）或 ['l', 长度]（依次取字面数据）。
+    """
+    table = {}
+    for index, (weak, strong) in enumerate(signatures):
+        table.setdefault(weak, {}).setdefault(strong, index)
+
+    ops = []
+    literal = bytearray()
+    view = memoryview(data)
+    n = len(data)
+
+    def emit_copy(index):
+        if ops and ops[-1][0] == 'c' and ops[-1][1] + ops[-1][2] == index:
+            ops[-1][2] += 1
+        else:
+            ops.append(['c', index, 1])
+
+    def emit_literal(start, end):
+        if end > start:
+            literal.extend(view[start:end])
+            if ops and ops[-1][0] == 'l':
+                ops[-1][1] += end - start
+            else:
+                ops.append(['l', end - start])
+
+    def lookup(start, end, weak):
+        candidates = table.get(weak)
+        if candidates:
+            return candidates.get(strong_checksum(view[start:end]))
+        return None
+
+    i = 0
+    literal_start = 0
+    if n <= ROLLING_MAX_SIZE and n >= block_size:
+        # 滚动查找：窗口每次后移一个字节，adler32的两个分量O(1)更新
+        checksum = zlib.adler32(view[:block_size])
+        a, b = checksum & 0xffff, checksum >> 16
+        while True:
+            index = lookup(i, i + block_size, (b << 16) | a)
+            if index is not None:
+                emit_literal(literal_start, i)
+                emit_copy(index)
+                i += block_size
+                literal_start = i
+                if i + block_size > n:
+                    break
+                checksum = zlib.adler32(view[i:i + block_size])
+                a, b = checksum & 0xffff, checksum >> 16
+                continue
+            if i + block_size >= n:
+                break
+            out, new = data[i], data[i + block_size]
+            a = (a - out + new) % ADLER_MOD
+            b = (b - block_size * out + a - 1) % ADLER_MOD
+            i += 1
+    else:
+        # 按块对齐比较，能发现原地修改和追加
+        while i + block_size <= n:
+            block = view[i:i + block_size]
+            index = lookup(i, i + block_size, weak_checksum(block))
+            if index is not None:
+                emit_literal(literal_start, i)
+                emit_copy(index)
+                literal_start = i + block_size
+            i += block_size
+
+    # 末尾不足一块的数据可能与客户端旧文件的最后一个（不完整的）块相同
+    if n - literal_start < block_size:
+        tail = literal_start
+    else:
+        tail = n - (n - literal_start) % block_size
+    if tail < n:
+        index = lookup(tail, n, weak_checksum(view[tail:n]))
+        if index is not None:
+            emit_literal(literal_start, tail)
+            emit_copy(index)
+            return ops, literal
+    emit_literal(literal_start, n)
+    return ops, literal
+
+
+def apply_delta(old_path, ops, block_size, literal, out):
+    """用旧文件和字面数据重建新文件，写入已打开的out，返回写入字节数"""
+    written = 0
+    position = 0
+    with open(old_path, 'rb') as old:
+        for op in ops:
+            if op[0] == 'c':
+                old.seek(op[1] * block_size)
+                data = old.read(op[2] * block_size)
+            else:
+                data = literal[position:position + op[1]]
+                position += op[1]
+            out.write(data)
+            written += len(data)
+    return written
+
+
+def safe_join(root, rel):
+    """把服务端给出的相对路径拼到本地目录下，拒绝越出该目录的路径"""
+    path = os.path.normpath(os.path.join(root, *rel.split('/')))
+    base = os.path.normpath(root)
+    if os.path.isabs(rel) or os.path.commonpath([base, path]) != base:
+        raise ValueError(f'非法路径: {rel}')
+    return path
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多设备控制 - 客户端
+按设备保持连接，用asyncio同时向多台服务端发送同一个命令（或batch），
+每台设备单独计时和超时，结果汇总成一张表；一台设备无响应不影响其他设备
+"""
+
+import asyncio
+import json
+import time
+
+import connection
+import protocol
+
+DEFAULT_PORT = 8888
+DEFAULT_TIMEOUT = 10
+# 同时进行的请求数上限
+DEFAULT_CONCURRENCY = 32
+
+
+class Device:
+    """设备列表中的一项"""
+
+    def __init__(self, host, port=DEFAULT_PORT, name=None):
+        self.host = host
+        self.port = port
+        self.name = name or self.address
+
+    @property
+    def address(self):
+        """host:port，用作结果和连接的键（名称可能重复）"""
+        return f'{self.host}:{self.port}'
+
+
+def load_hosts(path, default_port=DEFAULT_PORT):
+    """读取设备列表：每行 host[:port] [名称]，空行和#开头的行忽略，重复的地址只保留第一行"""
+    devices = []
+    seen = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            address, _, name = line.partition(' ')
+            host, sep, port = address.rpartition(':')
+            if not sep:
+                host, port = address, default_port
+            device = Device(host, int(port), name.strip() or None)
+            if device.address not in seen:
+                seen.add(device.address)
+                devices.append(device)
+    return devices
+
+
+class FleetController:
+    """多设备连接池；同一个实例只能在一个事件循环中使用"""
+
+    def __init__(self, devices, timeout=DEFAULT_TIMEOUT, concurrency=DEFAULT_CONCURRENCY,
+                 tls=None, password=None):
+        self.devices = devices
+        self.timeout = timeout
+        self.concurrency = concurrency
+        # 所有设备共用TLS上下文和密码
+        self.tls = tls
+        self.password = password
+        self.connections = {}
+        self._semaphore = None
+
+    async def _connection(self, device):
+        conn = self.connections.get(device.address)
+        if conn is None or conn.writer.is_closing():
+            conn = await protocol.AsyncClientConnection.open(device.host, device.port, self.tls, self.password)
+            self.connections[device.address] = conn
+        return conn
+
+    async def _request(self, device, command, params):
+        conn = await self._connection(device)
+        return await conn.request(command, params)
+
+    def _drop(self, device):
+        """超时或出错后连接状态未知，丢弃后下次重新连接"""
+        conn = self.connections.pop(device.address, None)
+        if conn is not None:
+            conn.close()
+
+    async def _run_one(self, device, command, params):
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(self._request(device, command, params), self.timeout)
+            except asyncio.TimeoutError:
+                self._drop(device)
+                response = {'success': False, 'error': f'超时（{self.timeout}秒）'}
+            except (OSError, EOFError, ValueError, protocol.ProtocolError) as e:
+                # 连接失败、连接中断（IncompleteReadError 属于 EOFError）、响应无法解析
+                self._drop(device)
+                response = {'success': False, 'error': str(e) or type(e).__name__}
+            response['latency_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            response['name'] = device.name
+        return response
+
+    async def run(self, command, params=None, devices=None):
+        """向所有（或指定的）设备发送同一命令，返回 {host:port: 响应}，顺序与设备列表一致；响应的 name 为设备名"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        devices = devices or self.devices
+        results = await asyncio.gather(*(self._run_one(d, command, params) for d in devices))
+        return dict(zip((d.address for d in devices), results))
+
+    async def run_batch(self, requests, devices=None):
+        """向每台设备发送同一个batch [(command, params), ...]"""
+        commands = [{'command': command, 'params': params or {}} for command, params in requests]
+        return await self.run('batch', {'commands': commands}, devices)
+
+    def close(self):
+        for conn in self.connections.values():
+            conn.close()
+        self.connections.clear()
+
+
+def summarize(command, response):
+    """把一台设备的响应压缩成表格中的一行说明"""
+    if not response.get('success'):
+        return response.get('error', '失败')
+    if command == 'info':
+        data = response.get('data', {})
+        parts = [data.get('system') or '']
+        if 'cpu_percent' in data:
+            parts.append(f"CPU {data['cpu_percent']}%")
+        if 'memory' in data:
+            parts.append(f"内存 {data['memory'].get('percent')}%")
+        if 'disk' in data:
+            parts.append(f"磁盘 {data['disk'].get('percent')}%")
+        if data.get('battery'):
+            parts.append(f"电量 {data['battery'].get('level')}%")
+        return '  '.join(p for p in parts if p)
+    if command == 'batch':
+        results = response.get('results', [])
+        return f"{len(results) - response.get('failed', 0)}/{len(results)} 成功"
+    if command == 'exec':
+        lines = (response.get('stdout') or response.get('stderr') or '').strip().splitlines()
+        return f"[{response.get('returncode')}] {lines[0] if lines else ''}"
+    if command == 'battery':
+        data = response.get('data', {})
+        return f"电量 {data.get('level')}%  {data.get('status') or ''}  {data.get('temperature')}°C"
+    if command == 'ping':
+        return response.get('message', 'pong')
+    keys = [k for k in response if k not in ('success', 'latency_ms', 'name')]
+    return ', '.join(keys[:6])
+
+
+def format_table(command, results):
+    """汇总表：每台设备一行（名称与地址不同时一并显示地址），最后一行为统计"""
+    labels = {}
+    for address, response in results.items():
+        name = response.get('name', address)
+        labels[address] = name if name == address else f'{name} ({address})'
+    width = max([len(label) for label in labels.values()] + [4])
+    lines = [f"{'设备':<{width}}  {'状态':<4}  {'延迟':>9}  说明", '-' * (width + 60)]
+    ok = 0
+    for address, response in results.items():
+        success = response.get('success')
+        ok += bool(success)
+        status = '✓' if success else '✗'
+        lines.append(f"{labels[address]:<{width}}  {status:<4}  {response['latency_ms']:>7.0f}ms  "
+                     f"{summarize(command, response)}")
+    slowest = max((r['latency_ms'] for r in results.values()), default=0)
+    lines.append('-' * (width + 60))
+    lines.append(f"成功 {ok}/{len(results)}，最慢 {slowest:.0f} ms")
+    return '\n'.join(lines)
+
+
+def run_cli(args):
+    """client.py --fleet hosts.txt [命令] [JSON参数] [--timeout 秒] [--tls] [--ca 证书] [--password 密码]"""
+    tls, password = connection.security_options(args)
+    timeout = DEFAULT_TIMEOUT
+    if '--timeout' in args:
+        index = args.index('--timeout')
+        timeout = float(args[index + 1])
+        del args[index:index + 2]
+    if not args:
+        print("用法: python client.py --fleet hosts.txt [命令] [JSON参数] [--timeout 秒]")
+        print("示例: python client.py --fleet hosts.txt exec '{\"command\": \"uptime\"}'")
+        return
+    devices = load_hosts(args[0])
+    command = args[1] if len(args) > 1 else 'info'
+    params = json.loads(args[2]) if len(args) > 2 else {}
+    if not devices:
+        print("✗ 设备列表为空")
+        return
+
+    async def sweep():
+        fleet = FleetController(devices, timeout, tls=tls, password=password)
+        try:
+            return await fleet.run(command, params)
+        finally:
+            fleet.close()
+
+    print(f"\n📡 向 {len(devices)} 台设备发送: {command}")
+    start = time.perf_counter()
+    results = asyncio.run(sweep())
+    print(format_table(command, results))
+    print(f"总用时 {(time.perf_counter() - start) * 1000:.0f} ms")
@@ -8,24 +8,41 @@
 try:
     import tkinter as tk
     from tkinter import scrolledtext, messagebox, filedialog
-    import socket
-    import json
     import threading
     import base64
+    import time
     from datetime import datetime
+    import protocol
+    import connection
+    import discovery
+    import security
+    import screen
+    from screen_stream import FrameCompositor
 except ImportError as e:
     print(f"缺少依赖: {e}")
     print("请安装: pip install tk")
     exit(1)
 
+try:
+    from PIL import ImageTk
+except ImportError:
+    ImageTk = None
+
 class MonitorGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("手机监控客户端")
         self.root.geometry("800x600")
         
-        self.socket = None
+        # 主连接：keepalive、空闲心跳、断线重连
+        self.link = None
         self.connected = False
+        self.live_conn = None
+        self.stream_conn = None
+        self.stream_window = None
+        self.stream_pending = False
+        self.exec_conn = None
+        self.exec_id = None
         
         self.create_widgets()
     
@@ -45,12 +62,22 @@ class MonitorGUI:
         self.port_entry.pack(side=tk.LEFT, padx=5)
         self.port_entry.insert(0, "8888")
         
+        tk.Label(conn_frame, text="密码:").pack(side=tk.LEFT)
+        self.password_entry = tk.Entry(conn_frame, width=12, show="*")
+        self.password_entry.pack(side=tk.LEFT, padx=5)
+        
+        self.tls_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(conn_frame, text="TLS", variable=self.tls_var).pack(side=tk.LEFT)
+        
         self.connect_btn = tk.Button(conn_frame, text="连接", command=self.connect)
         self.connect_btn.pack(side=tk.LEFT, padx=5)
         
         self.disconnect_btn = tk.Button(conn_frame, text="断开", command=self.disconnect, state=tk.DISABLED)
         self.disconnect_btn.pack(side=tk.LEFT)
         
+        self.discover_btn = tk.Button(conn_frame, text="发现设备", command=self.discover_devices)
+        self.discover_btn.pack(side=tk.LEFT, padx=5)
+        
         self.status_label = tk.Label(conn_frame, text="未连接", fg="red")
         self.status_label.pack(side=tk.LEFT, padx=10)
         
@@ -59,11 +86,14 @@ class MonitorGUI:
         btn_frame.pack(pady=10, padx=10, fill=tk.X)
         
         buttons = [
+            ("一键刷新", self.refresh_all),
             ("设备信息", self.get_info),
             ("截图", self.screenshot),
             ("进程列表", self.get_processes),
             ("文件浏览", self.browse_files),
             ("网络信息", self.get_network),
+            ("实时监控", self.toggle_live),
+            ("屏幕直播", self.toggle_stream),
             ("清空输出", self.clear_output)
         ]
         
@@ -71,6 +101,10 @@ class MonitorGUI:
             btn = tk.Button(btn_frame, text=text, command=command, width=12)
             btn.pack(side=tk.LEFT, padx=5)
         
+        # 实时监控状态栏（由服务端推送更新）
+        self.live_label = tk.Label(self.root, text="实时监控: 未开启", anchor=tk.W)
+        self.live_label.pack(padx=10, fill=tk.X)
+        
         # 输出区域
         output_frame = tk.Frame(self.root)
         output_frame.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
@@ -90,6 +124,8 @@ class MonitorGUI:
         self.cmd_entry.bind('<Return>', lambda e: self.execute_custom_command())
         
         tk.Button(cmd_frame, text="执行", command=self.execute_custom_command).pack(side=tk.LEFT)
+        self.cancel_btn = tk.Button(cmd_frame, text="停止", command=self.cancel_custom_command, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
     
     def log(self, message):
         """输出日志"""
@@ -101,6 +137,70 @@ class MonitorGUI:
         """清空输出"""
         self.output_text.delete(1.0, tk.END)
     
+    @property
+    def conn(self):
+        return self.link.conn if self.link else None
+    
+    def discover_devices(self):
+        """在后台查找局域网中的服务端，结果在列表中选择后填入地址"""
+        self.discover_btn.config(state=tk.DISABLED)
+        self.log("正在查找局域网中的服务端...")
+        
+        def worker():
+            try:
+                devices = discovery.discover()
+            except OSError as e:
+                devices = e
+            self.root.after(0, self._show_discovered, devices)
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def _show_discovered(self, devices):
+        self.discover_btn.config(state=tk.NORMAL)
+        if isinstance(devices, OSError):
+            self.log(f"✗ 查找失败: {devices}")
+            return
+        self.log(f"发现 {len(devices)} 台设备")
+        if not devices:
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title("选择设备")
+        listbox = tk.Listbox(window, width=70, height=min(len(devices), 15))
+        listbox.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+        for d in devices:
+            load = d.get('load') or {}
+            extra = f"  CPU {load['cpu']}%" if load.get('cpu') is not None else ''
+            listbox.insert(tk.END, f"{d.get('name')}  {d['host']}:{d.get('port')}  {d.get('platform') or ''}{extra}")
+        
+        def choose(event=None):
+            selection = listbox.curselection()
+            if not selection:
+                return
+            device = devices[selection[0]]
+            self.ip_entry.delete(0, tk.END)
+            self.ip_entry.insert(0, device['host'])
+            self.port_entry.delete(0, tk.END)
+            self.port_entry.insert(0, str(device.get('port')))
+            self.tls_var.set(bool(device.get('tls')))
+            window.destroy()
+        
+        listbox.bind('<Double-Button-1>', choose)
+        tk.Button(window, text="使用所选设备", command=choose).pack(pady=(0, 10))
+    
+    def make_link(self, host, port):
+        """按界面上的地址、密码和TLS选项创建连接管理器"""
+        # 心跳和重连在后台线程中进行，日志交给界面线程输出
+        return connection.ConnectionManager(
+            host, port, log=lambda message: self.root.after(0, self.log, message.strip()),
+            tls=security.client_context() if self.tls_var.get() else None,
+            password=self.password_entry.get() or None)
+    
+    def open_connection(self):
+        """为推送类功能新建独立连接；已连接时沿用主连接的TLS会话，省去完整握手"""
+        link = self.link or self.make_link(self.ip_entry.get().strip(), int(self.port_entry.get().strip()))
+        return link.open_connection()
+    
     def connect(self):
         """连接到服务器"""
         host = self.ip_entry.get().strip()
@@ -111,10 +211,9 @@ class MonitorGUI:
             return
         
         try:
-            port = int(port)
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(10)
-            self.socket.connect((host, port))
+            self.link = self.make_link(host, int(port))
+            self.link.open()
+            self.link.start_heartbeat()
             
             self.connected = True
             self.status_label.config(text="已连接", fg="green")
@@ -131,21 +230,18 @@ class MonitorGUI:
     
     def disconnect(self):
         """断开连接"""
-        if self.socket:
-            try:
-                self.socket.close()
-            except:
-                pass
+        if self.link:
+            self.link.close()
         
         self.connected = False
-        self.socket = None
+        self.link = None
         self.status_label.config(text="未连接", fg="red")
         self.connect_btn.config(state=tk.NORMAL)
         self.disconnect_btn.config(state=tk.DISABLED)
         self.log("✓ 已断开连接")
     
-    def send_command(self, command, params=None):
-        """发送命令"""
+    def send_command(self, command, params=None, save_to=None):
+        """发送命令（save_to: 响应附件直接写入的文件路径）"""
         if not self.connected:
             messagebox.showwarning("警告", "请先连接到服务器")
             return None
@@ -156,22 +252,9 @@ class MonitorGUI:
                 'params': params or {}
             }
             
-            request_data = json.dumps(request, ensure_ascii=False)
-            self.socket.sendall(request_data.encode('utf-8'))
-            
-            # 接收响应
-            response_data = b''
-            while True:
-                chunk = self.socket.recv(4096)
-                if not chunk:
-                    break
-                response_data += chunk
-                if b'\n__END__\n' in response_data:
-                    response_data = response_data.replace(b'\n__END__\n', b'')
-                    break
-            
-            response = json.loads(response_data.decode('utf-8'))
-            return response
+            # 没有副作用的命令在连接中断后自动重连并重发
+            return self.link.request(request, save_to=save_to,
+                                     retry=command in connection.IDEMPOTENT_COMMANDS)
             
         except Exception as e:
             self.log(f"✗ 命令执行失败: {e}")
@@ -181,8 +264,9 @@ class MonitorGUI:
     def get_info(self):
         """获取设备信息"""
         self.log("正在获取设备信息...")
-        response = self.send_command('info')
-        
+        self.show_info(self.send_command('info'))
+    
+    def show_info(self, response):
         if response and response.get('success'):
             data = response.get('data', {})
             self.log("\n设备信息:")
@@ -196,35 +280,57 @@ class MonitorGUI:
         else:
             self.log(f"✗ 获取失败: {response.get('error') if response else '无响应'}")
     
+    def refresh_all(self):
+        """用一条 batch 命令同时获取设备信息、进程和网络（旧服务端逐个请求）"""
+        self.log("正在刷新...")
+        names = ['info', 'processes', 'network']
+        response = self.send_command('batch', {'commands': [{'command': n} for n in names]})
+        if response is None:
+            return
+        if response.get('success'):
+            results = response['results']
+            self.log(f"✓ 批量获取完成，用时 {response.get('elapsed_ms')} ms")
+        else:
+            results = [self.send_command(n) for n in names]
+        for show, result in zip((self.show_info, self.show_processes, self.show_network), results):
+            show(result)
+    
     def screenshot(self):
         """截图"""
+        # 先选择保存位置，截图数据直接写入文件
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".png",
+            filetypes=[("PNG图片", "*.png"), ("JPEG图片", "*.jpg"), ("WebP图片", "*.webp"), ("所有文件", "*.*")],
+            initialfile=f"screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
+        )
+        if not filename:
+            return
+        
         self.log("正在截取屏幕...")
-        response = self.send_command('screenshot')
+        # 按扩展名选择格式，JPEG/WebP体积小、编码快
+        response = self.send_command('screenshot', {'format': screen.format_for_path(filename)}, save_to=filename)
         
         if response and response.get('success'):
-            filename = filedialog.asksaveasfilename(
-                defaultextension=".png",
-                filetypes=[("PNG图片", "*.png"), ("所有文件", "*.*")],
-                initialfile=f"screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-            )
-            
-            if filename:
-                img_data = response.get('data')
-                img_bytes = base64.b64decode(img_data)
-                
+            if 'saved_to' not in response:
+                # 旧服务端：base64在JSON中
+                img_bytes = base64.b64decode(response.get('data'))
                 with open(filename, 'wb') as f:
                     f.write(img_bytes)
-                
-                self.log(f"✓ 截图已保存: {filename}")
-                messagebox.showinfo("成功", f"截图已保存到:\n{filename}")
+            
+            self.log(f"✓ 截图已保存: {filename}")
+            if 'encode_ms' in response:
+                self.log(f"  {response.get('width')}x{response.get('height')} {response.get('format')}, "
+                         f"{response.get('bytes')} 字节, 编码 {response['encode_ms']}ms")
+            messagebox.showinfo("成功", f"截图已保存到:\n{filename}")
         else:
             self.log(f"✗ 截图失败: {response.get('error') if response else '无响应'}")
     
     def get_processes(self):
         """获取进程列表"""
         self.log("正在获取进程列表...")
-        response = self.send_command('processes')
-        
+        self.show_processes(self.send_command('processes'))
+    
+    def show_processes(self, response):
         if response and response.get('success'):
             processes = response.get('processes', [])
             self.log(f"\n运行中的进程 (共{len(processes)}个):")
@@ -241,25 +347,34 @@ class MonitorGUI:
                                          initialvalue="/sdcard/" if self.is_android() else "")
         if path:
             self.log(f"正在浏览: {path}")
-            response = self.send_command('files', {'path': path})
-            
-            if response and response.get('success'):
+            # 每页20项，由服务端排序和分页
+            params = {'path': path, 'limit': 20}
+            while True:
+                response = self.send_command('files', params)
+                if not response or not response.get('success'):
+                    self.log(f"✗ 浏览失败: {response.get('error') if response else '无响应'}")
+                    return
+                
                 files = response.get('files', [])
-                current_path = response.get('path')
-                self.log(f"\n路径: {current_path}")
-                self.log(f"{'类型':<8} {'名称':<40}")
-                self.log("-" * 50)
-                for item in files[:20]:  # 只显示前20个
+                if 'cursor' not in params:
+                    self.log(f"\n路径: {response.get('path')}（共 {response.get('total', len(files))} 项）")
+                    self.log(f"{'类型':<8} {'名称':<40}")
+                    self.log("-" * 50)
+                for item in files:
                     file_type = '[DIR]' if item['is_dir'] else '[FILE]'
                     self.log(f"{file_type:<8} {item['name']:<40}")
-            else:
-                self.log(f"✗ 浏览失败: {response.get('error') if response else '无响应'}")
+                
+                cursor = response.get('next_cursor')
+                if not cursor or not messagebox.askyesno("浏览文件", "还有更多文件，显示下一页？"):
+                    return
+                params['cursor'] = cursor
     
     def get_network(self):
         """获取网络信息"""
         self.log("正在获取网络信息...")
-        response = self.send_command('network')
-        
+        self.show_network(self.send_command('network'))
+    
+    def show_network(self, response):
         if response and response.get('success'):
             interfaces = response.get('interfaces', {})
             self.log("\n网络接口:")
@@ -277,7 +392,15 @@ class MonitorGUI:
         if not cmd:
             return
         
+        if self.exec_conn:
+            messagebox.showwarning("警告", "已有命令在运行")
+            return
+        
         self.log(f"执行命令: {cmd}")
+        if self.conn and self.conn.framed:
+            self.start_exec_stream(cmd)
+            self.cmd_entry.delete(0, tk.END)
+            return
         response = self.send_command('exec', {'command': cmd})
         
         if response and response.get('success'):
@@ -291,6 +414,221 @@ class MonitorGUI:
         
         self.cmd_entry.delete(0, tk.END)
     
+    def start_exec_stream(self, cmd):
+        """用独立连接流式执行命令，输出边产生边显示，界面不阻塞"""
+        try:
+            conn = self.open_connection()
+            sock = conn.sock
+            if not conn.framed:
+                sock.close()
+                self.log("✗ 服务端不支持流式执行")
+                return
+            conn.send_message({'command': 'exec_stream', 'params': {'command': cmd}})
+            # 输出可能先于响应到达，先缓存起来
+            early = []
+            conn.push_handler = early.append
+            response = conn.recv_reply()
+            if not response.get('success'):
+                sock.close()
+                self.log(f"✗ 执行失败: {response.get('error')}")
+                return
+            sock.settimeout(None)
+        except Exception as e:
+            self.log(f"✗ 执行失败: {e}")
+            return
+        
+        self.exec_conn = conn
+        self.exec_id = response['id']
+        self.cancel_btn.config(state=tk.NORMAL)
+        threading.Thread(target=self._exec_reader, args=(conn, response['id'], early), daemon=True).start()
+    
+    def cancel_custom_command(self):
+        """取消正在运行的命令，结束消息仍由读取线程接收"""
+        if self.exec_conn:
+            try:
+                self.exec_conn.send_message({'command': 'exec_cancel', 'params': {'id': self.exec_id}})
+            except Exception as e:
+                self.log(f"✗ 取消失败: {e}")
+    
+    def _exec_reader(self, conn, exec_id, early):
+        """后台线程：接收命令输出推送并在界面线程中追加显示"""
+        done = None
+        try:
+            messages = iter(early)
+            while done is None:
+                message = next(messages, None) or conn.recv_push()
+                if message.get(protocol.PUSH_KEY) != 'exec' or message.get('id') != exec_id:
+                    continue
+                if message.get('done'):
+                    done = message
+                else:
+                    self.root.after(0, self._append_output, message.get('data', ''))
+        except Exception as e:
+            done = {'error': str(e)}
+        finally:
+            try:
+                conn.sock.close()
+            except:
+                pass
+        self.root.after(0, self._exec_finished, done)
+    
+    def _append_output(self, text):
+        self.output_text.insert(tk.END, text)
+        self.output_text.see(tk.END)
+    
+    def _exec_finished(self, done):
+        self.exec_conn = None
+        self.exec_id = None
+        self.cancel_btn.config(state=tk.DISABLED)
+        if done.get('error'):
+            self.log(f"\n✗ 执行失败: {done['error']}")
+        else:
+            self.log(f"\n返回码: {done.get('returncode')}（{done.get('reason')}，用时 {done.get('elapsed')}s）")
+    
+    def toggle_live(self):
+        """开启/关闭实时监控，使用独立连接接收服务端推送"""
+        if self.live_conn:
+            try:
+                self.live_conn.sock.close()
+            except:
+                pass
+            self.live_conn = None
+            self.live_label.config(text="实时监控: 未开启")
+            return
+        
+        try:
+            conn = self.open_connection()
+            sock = conn.sock
+            if not conn.framed:
+                sock.close()
+                messagebox.showwarning("警告", "服务端版本过旧，不支持实时监控")
+                return
+            conn.send_message({
+                'command': 'subscribe',
+                'params': {'topics': ['cpu', 'memory', 'net_io', 'battery'], 'interval': 2}
+            })
+            response = conn.recv_reply()
+            if not response.get('success'):
+                sock.close()
+                self.log(f"✗ 订阅失败: {response.get('error')}")
+                return
+            sock.settimeout(None)
+        except Exception as e:
+            self.log(f"✗ 实时监控启动失败: {e}")
+            return
+        
+        self.live_conn = conn
+        self.live_label.config(text="实时监控: 等待数据...")
+        threading.Thread(target=self._live_reader, args=(conn,), daemon=True).start()
+    
+    def _live_reader(self, conn):
+        """后台线程：接收推送并在界面线程中更新状态栏"""
+        state = {}
+        try:
+            while True:
+                message = conn.recv_message()
+                if message.get(protocol.PUSH_KEY) != 'metrics':
+                    continue
+                protocol.apply_metrics_update(state, message.get('data', {}))
+                text = f"实时监控: {protocol.format_metrics(state)}"
+                self.root.after(0, self.live_label.config, {'text': text})
+        except Exception:
+            pass
+    
+    def toggle_stream(self):
+        """打开/关闭屏幕直播窗口，使用独立连接接收画面推送"""
+        if self.stream_conn:
+            self.close_stream()
+            return
+        if ImageTk is None:
+            messagebox.showwarning("警告", "屏幕直播需要安装Pillow: pip install pillow")
+            return
+        
+        try:
+            conn = self.open_connection()
+            sock = conn.sock
+            if not conn.framed:
+                sock.close()
+                messagebox.showwarning("警告", "服务端版本过旧，不支持屏幕直播")
+                return
+            conn.send_message({
+                'command': 'screen_stream',
+                'params': {'fps': 10, 'format': 'JPEG', 'quality': 60, 'max_width': 720}
+            })
+            # 首帧可能先于响应到达，先缓存起来
+            early = []
+            conn.push_handler = early.append
+            response = conn.recv_reply()
+            if not response.get('success'):
+                sock.close()
+                self.log(f"✗ 屏幕直播启动失败: {response.get('error')}")
+                return
+            sock.settimeout(None)
+        except Exception as e:
+            self.log(f"✗ 屏幕直播启动失败: {e}")
+            return
+        
+        self.stream_conn = conn
+        self.stream_window = tk.Toplevel(self.root)
+        self.stream_window.title("屏幕直播")
+        self.stream_window.geometry("400x760")
+        self.stream_window.protocol("WM_DELETE_WINDOW", self.close_stream)
+        self.stream_view = tk.Label(self.stream_window, text="等待画面...", bg="black", fg="white")
+        self.stream_view.pack(fill=tk.BOTH, expand=True)
+        self.stream_status = tk.Label(self.stream_window, anchor=tk.W)
+        self.stream_status.pack(fill=tk.X)
+        self.stream_view_size = (400, 720)
+        self.stream_view.bind('<Configure>', lambda e: setattr(self, 'stream_view_size', (e.width, e.height)))
+        threading.Thread(target=self._stream_reader, args=(conn, early), daemon=True).start()
+    
+    def close_stream(self):
+        """关闭屏幕直播（断开连接后服务端自动停止推流）"""
+        if self.stream_conn:
+            try:
+                self.stream_conn.sock.close()
+            except:
+                pass
+            self.stream_conn = None
+        if self.stream_window:
+            self.stream_window.destroy()
+            self.stream_window = None
+    
+    def _stream_reader(self, conn, early):
+        """后台线程：合成画面；界面还没显示完上一帧时跳过显示，不堆积"""
+        compositor = FrameCompositor()
+        started = time.time()
+        try:
+            messages = iter(early)
+            while conn is self.stream_conn:
+                message = next(messages, None) or conn.recv_push()
+                if message.get(protocol.PUSH_KEY) != 'screen':
+                    continue
+                if 'error' in message:
+                    self.root.after(0, self.log, f"✗ 屏幕直播中止: {message['error']}")
+                    break
+                canvas = compositor.apply(message)
+                if self.stream_pending:
+                    continue
+                image = canvas.copy()
+                image.thumbnail(self.stream_view_size)
+                fps = compositor.frames / max(time.time() - started, 1e-6)
+                status = (f"{canvas.width}x{canvas.height}  {fps:.1f} fps  "
+                          f"区域 {len(message['tiles'])}  丢帧 {message['dropped']}")
+                self.stream_pending = True
+                self.root.after(0, self._show_stream_frame, image, status)
+        except Exception:
+            pass
+    
+    def _show_stream_frame(self, image, status):
+        """界面线程：显示一帧"""
+        self.stream_pending = False
+        if not self.stream_window:
+            return
+        photo = ImageTk.PhotoImage(image)
+        self.stream_view.config(image=photo, text="")
+        self.stream_view.image = photo
+        self.stream_status.config(text=status)
+    
     def is_android(self):
         """判断服务端是否为Android"""
         # 简单判断，可以通过info命令获取更准确的信息
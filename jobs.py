@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台命令任务 - 服务端共用
+exec_async 立即返回任务ID，命令在固定数量的工作线程中排队执行，不占用连接；
+按客户端地址限制同时排队/运行的任务数，已结束任务的输出按LRU在总大小预算内保留
+"""
+
+import base64
+import collections
+import itertools
+import threading
+import time
+
+from exec_stream import run_process
+
+ACTIVE_STATES = ('queued', 'running')
+
+# 已结束任务最多保留的个数（输出很小的任务不会占满大小预算）
+MAX_FINISHED_JOBS = 200
+
+
+class JobError(Exception):
+    """任务提交或查询失败（队列已满、超出配额、任务不存在）"""
+
+
+class Job:
+    """一个后台命令及其输出"""
+
+    def __init__(self, job_id, owner, command, timeout, idle_timeout, max_output):
+        self.id = job_id
+        self.owner = owner
+        self.command = command
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_output = max_output
+        self.status = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.returncode = None
+        self.reason = None
+        self.error = None
+        self.output = {'stdout': bytearray(), 'stderr': bytearray()}
+        self.cancel_event = threading.Event()
+
+    @property
+    def size(self):
+        return len(self.output['stdout']) + len(self.output['stderr'])
+
+    def on_output(self, name, data):
+        # 只有工作线程的两个读取线程追加，查询方读取的是切片副本
+        self.output[name].extend(data)
+
+    def run(self):
+        # 状态已由工作线程在出队时（持有锁）设为 running
+        try:
+            self.returncode, self.reason = run_process(
+                self.command, self.on_output, self.timeout, self.idle_timeout,
+                self.max_output, self.cancel_event)
+            self.status = 'cancelled' if self.reason == 'cancelled' else 'done'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+        self.finished = time.time()
+
+    def info(self):
+        end = self.finished or time.time()
+        info = {
+            'id': self.id,
+            'command': self.command,
+            'status': self.status,
+            'returncode': self.returncode,
+            'reason': self.reason,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'elapsed': round(end - self.started, 3) if self.started else None,
+            'stdout_bytes': len(self.output['stdout']),
+            'stderr_bytes': len(self.output['stderr'])
+        }
+        if self.error:
+            info['error'] = self.error
+        return info
+
+
+class JobManager:
+    """有界工作线程池 + 等待队列；任务按提交顺序执行"""
+
+    def __init__(self, workers=2, queue_size=16, per_client=4, output_budget=32 * 1024 * 1024):
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.per_client = per_client
+        self.output_budget = output_budget
+        self.jobs = {}
+        self.pending = collections.deque()
+        # 已结束的任务，按最近访问排序（最久未访问的在前）
+        self.finished = collections.OrderedDict()
+        self.finished_bytes = 0
+        self.condition = threading.Condition()
+        self._ids = itertools.count(1)
+        self._threads = []
+        self._stopped = False
+
+    def start(self):
+        """启动工作线程"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f'job-worker-{i + 1}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        """停止接收任务并取消全部正在运行的命令"""
+        with self.condition:
+            self._stopped = True
+            jobs = [job for job in self.jobs.values() if job.status in ACTIVE_STATES]
+            self.condition.notify_all()
+        for job in jobs:
+            job.cancel_event.set()
+
+    def configure(self, queue_size, per_client, output_budget):
+        """重新加载配置时调整队列和配额上限（工作线程数需要重启），已提交的任务不受影响"""
+        with self.condition:
+            self.queue_size = queue_size
+            self.per_client = per_client
+            self.output_budget = output_budget
+            self._evict()
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self._stopped:
+                    self.condition.wait()
+                if self._stopped:
+                    return
+                job = self.pending.popleft()
+                # 出队和状态变化在同一把锁内完成，cancel 不会看到已出队却仍是 queued 的任务
+                job.status = 'running'
+                job.started = time.time()
+            job.run()
+            self._finish(job)
+
+    def _finish(self, job):
+        with self.condition:
+            self.finished[job.id] = job
+            self.finished_bytes += job.size
+            self._evict()
+
+    def _evict(self):
+        """超出预算时丢弃最久未访问的已结束任务（调用方需持有锁）"""
+        while self.finished and (self.finished_bytes > self.output_budget
+                                 or len(self.finished) > MAX_FINISHED_JOBS):
+            _, job = self.finished.popitem(last=False)
+            self.finished_bytes -= job.size
+            del self.jobs[job.id]
+
+    # ---------- 命令 ----------
+
+    def submit(self, owner, command, timeout=0, idle_timeout=0, max_output=0):
+        """提交任务，返回 Job；队列已满或超出该客户端配额时抛出 JobError"""
+        with self.condition:
+            if self._stopped:
+                raise JobError('服务器正在关闭')
+            if len(self.pending) >= self.queue_size:
+                raise JobError(f'任务队列已满（{self.queue_size}个）')
+            active = sum(1 for job in self.jobs.values()
+                         if job.owner == owner and job.status in ACTIVE_STATES)
+            if active >= self.per_client:
+                raise JobError(f'每个客户端同时最多{self.per_client}个未完成的任务')
+            job = Job(next(self._ids), owner, command, timeout, idle_timeout, max_output)
+            self.jobs[job.id] = job
+            self.pending.append(job)
+            self.condition.notify()
+        return job
+
+    def get(self, owner, job_id):
+        """查找该客户端的任务（已结束的任务同时标记为最近访问），找不到时抛出 JobError"""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.owner != owner:
+                raise JobError(f'任务不存在或已过期: {job_id}')
+            if job.id in self.finished:
+                self.finished.move_to_end(job.id)
+            return job
+
+    def cancel(self, owner, job_id):
+        """取消任务：排队中的直接移出队列，运行中的结束其进程"""
+        job = self.get(owner, job_id)
+        with self.condition:
+            if job.status == 'queued':
+                self.pending.remove(job)
+                job.status = 'cancelled'
+                job.reason = 'cancelled'
+                job.finished = time.time()
+                self.finished[job.id] = job
+                self._evict()
+                return job
+        job.cancel_event.set()
+        return job
+
+    def output(self, owner, job_id, stdout_offset=0, stderr_offset=0, limit=1024 * 1024):
+        """从给定偏移读取输出，每个流最多limit字节；返回base64编码的原始字节和下次读取的偏移
+
+        多字节字符可能跨两次读取，由客户端用增量解码器拼接后解码。
+        """
+        job = self.get(owner, job_id)
+        result = {'id': job.id, 'status': job.status, 'encoding': 'base64'}
+        for name, offset in (('stdout', stdout_offset), ('stderr', stderr_offset)):
+            offset = max(0, int(offset or 0))
+            data = bytes(job.output[name][offset:offset + limit])
+            result[name] = base64.b64encode(data).decode('ascii')
+            result[f'{name}_offset'] = offset + len(data)
+        result['complete'] = (job.status not in ACTIVE_STATES
+                              and result['stdout_offset'] >= len(job.output['stdout'])
+                              and result['stderr_offset'] >= len(job.output['stderr']))
+        return result
+
+    def list(self, owner):
+        with self.condition:
+            jobs = [job for job in self.jobs.values() if job.owner == owner]
+        return [job.info() for job in sorted(jobs, key=lambda j: j.id)]
+
+    def stats(self):
+        with self.condition:
+            return {
+                'workers': self.workers,
+                'queued': len(self.pending),
+                'running': sum(1 for job in self.jobs.values() if job.status == 'running'),
+                'finished': len(self.finished),
+                'finished_bytes': self.finished_bytes,
+                'output_budget': self.output_budget
+            }
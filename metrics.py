@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+系统指标采样 - 服务端共用
+后台线程按固定周期采集CPU、内存、磁盘、网络计数，命令处理时直接读取最新快照；
+每次采样同时写入定长的环形缓冲区，供 history 命令按时间范围查询
+"""
+
+import math
+import threading
+import time
+from array import array
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class MetricsSampler:
+    """后台指标采样器，快照以整体替换的方式更新，读取无需加锁"""
+
+    def __init__(self, interval=2.0, disk_path='/'):
+        self.interval = interval
+        self.disk_path = disk_path
+        self._snapshot = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._listeners = []
+        # 额外采集函数: [函数, 周期, 上次采集时间, 上次结果]
+        self._collectors = []
+
+    def add_listener(self, callback):
+        """注册回调，每次采样后以快照为参数调用"""
+        self._listeners.append(callback)
+
+    def add_collector(self, func, interval):
+        """注册额外的采集函数（如Android电池），按自己的周期执行，结果合并进快照"""
+        self._collectors.append([func, interval, 0.0, {}])
+
+    def set_collector_interval(self, func, interval):
+        """修改已注册采集函数的周期（采样周期直接修改 interval，都从下一次采样起生效）"""
+        for collector in self._collectors:
+            if collector[0] == func:
+                collector[1] = interval
+
+    @property
+    def available(self):
+        return psutil is not None
+
+    def start(self):
+        """启动采样线程（重复调用无副作用）"""
+        if psutil is None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            # cpu_percent(None) 以上次调用为基准，先建立基准再取第一份快照
+            psutil.cpu_percent(interval=None)
+            self._update()
+            self._thread = threading.Thread(target=self._run, name='metrics-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止采样线程"""
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._update()
+            except Exception as e:
+                print(f"[-] 指标采样失败: {e}")
+
+    def _update(self):
+        snapshot = self.sample()
+        now = snapshot['sampled_at']
+        for collector in self._collectors:
+            func, interval, last, result = collector
+            if now - last >= interval:
+                try:
+                    result = func() or {}
+                except Exception:
+                    result = {}
+                collector[2:] = [now, result]
+            snapshot.update(result)
+        self._snapshot = snapshot
+        for callback in self._listeners:
+            callback(snapshot)
+
+    def sample(self):
+        """采集一次指标，每个psutil接口只调用一次"""
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage(self.disk_path)
+        net_io = psutil.net_io_counters()
+        return {
+            'sampled_at': time.time(),
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'memory': {
+                'total': memory.total,
+                'available': memory.available,
+                'percent': memory.percent
+            },
+            'disk': {
+                'total': disk.total,
+                'used': disk.used,
+                'free': disk.free,
+                'percent': disk.percent
+            },
+            'net_io': {
+                'bytes_sent': net_io.bytes_sent,
+                'bytes_recv': net_io.bytes_recv,
+                'packets_sent': net_io.packets_sent,
+                'packets_recv': net_io.packets_recv
+            }
+        }
+
+    def snapshot(self):
+        """返回最新快照，psutil不可用时返回None"""
+        if self._thread is None:
+            self.start()
+        return self._snapshot
+
+
+# history 中的指标列: (名称, array类型码, 从快照取值的函数, 降采样方式)
+# 计数类指标（网络字节数）在桶内取最后一个值，其余取平均值
+HISTORY_FIELDS = (
+    ('cpu_percent', 'f', lambda s: s['cpu_percent'], 'mean'),
+    ('memory_percent', 'f', lambda s: s['memory']['percent'], 'mean'),
+    ('disk_percent', 'f', lambda s: s['disk']['percent'], 'mean'),
+    ('bytes_sent', 'd', lambda s: s['net_io']['bytes_sent'], 'last'),
+    ('bytes_recv', 'd', lambda s: s['net_io']['bytes_recv'], 'last'),
+    ('battery_level', 'f', lambda s: s['battery']['level'], 'mean'),
+    ('battery_temperature', 'f', lambda s: s['battery']['temperature'], 'mean'),
+)
+
+
+class MetricsHistory:
+    """定长环形缓冲区，每个指标一列紧凑的array，缺失值记为NaN"""
+
+    def __init__(self, capacity=3600):
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.columns = {
+            name: array(typecode, bytes(array(typecode).itemsize * capacity))
+            for name, typecode, _, _ in HISTORY_FIELDS
+        }
+        self.count = 0
+        self.next_index = 0
+        self.lock = threading.Lock()
+
+    def append(self, snapshot):
+        """写入一次采样（作为MetricsSampler的监听器）"""
+        values = []
+        for name, _, getter, _ in HISTORY_FIELDS:
+            try:
+                values.append(float(getter(snapshot)))
+            except (KeyError, TypeError, ValueError):
+                values.append(math.nan)
+
+        with self.lock:
+            i = self.next_index
+            self.timestamps[i] = snapshot['sampled_at']
+            for (name, _, _, _), value in zip(HISTORY_FIELDS, values):
+                self.columns[name][i] = value
+            self.next_index = (i + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def _position(self, logical):
+        """按时间顺序的逻辑序号 -> 缓冲区下标"""
+        return (self.next_index - self.count + logical) % self.capacity
+
+    def _bisect(self, ts, right=False):
+        """二分查找第一个时间戳 >= ts（right=True 时为 > ts）的逻辑序号"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self.timestamps[self._position(mid)]
+            if value < ts or (right and value == ts):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def query(self, start=None, end=None, points=100, fields=None):
+        """查询时间范围内的数据，在服务端降采样为不超过points个点"""
+        names = [f[0] for f in HISTORY_FIELDS if not fields or f[0] in fields]
+        modes = {f[0]: f[3] for f in HISTORY_FIELDS}
+        points = max(1, int(points or 100))
+
+        with self.lock:
+            first = self._bisect(start) if start is not None else 0
+            last = self._bisect(end, right=True) if end is not None else self.count
+            total = max(0, last - first)
+            positions = [self._position(i) for i in range(first, last)]
+            timestamps = [self.timestamps[p] for p in positions]
+            columns = {name: [self.columns[name][p] for p in positions] for name in names}
+
+        result = {'timestamps': [], 'samples': total}
+        result.update({name: [] for name in names})
+        buckets = min(points, total)
+        for b in range(buckets):
+            lo = b * total // buckets
+            hi = (b + 1) * total // buckets
+            result['timestamps'].append(round(timestamps[hi - 1], 3))
+            for name in names:
+                values = [v for v in columns[name][lo:hi] if not math.isnan(v)]
+                if not values:
+                    value = None
+                elif modes[name] == 'last':
+                    value = values[-1]
+                else:
+                    value = round(sum(values) / len(values), 2)
+                result[name].append(value)
+        return result
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程表 - 服务端共用
+跨调用保留 psutil.Process 对象，cpu_percent 是两次刷新之间的真实占用率；
+每次刷新生成一个版本号，客户端可用 since 令牌只取新增、结束和变化的进程
+"""
+
+import heapq
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 两次刷新的最小间隔（秒），间隔过短时cpu_percent没有意义，直接复用上次结果
+MIN_REFRESH_INTERVAL = 0.5
+
+SORT_KEYS = {'cpu': 'cpu_percent', 'memory': 'memory_percent'}
+
+
+def _read(method, *args):
+    """读取单个进程属性；没有权限读取时返回None，其余属性照常读取"""
+    try:
+        return method(*args)
+    except psutil.AccessDenied:
+        return None
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
+
+
+class ProcessTable:
+    """增量维护的进程表
+
+    行以 (pid, 创建时间) 为键，pid 被新进程复用时旧行直接替换为新行（作为新增返回，不记录结束）。
+    客户端应用增量时先删除 removed 中的pid，再按pid写入 added 和 changed 中的行。
+    """
+
+    def __init__(self, removed_log_size=4096):
+        self.keys = {}       # pid -> (pid, 创建时间)
+        self.procs = {}      # 键 -> psutil.Process
+        self.rows = {}       # 键 -> 最近一次的进程信息
+        self.created = {}    # 键 -> 出现时的版本号
+        self.changed = {}    # 键 -> 最后一次变化的版本号
+        self.removed = deque(maxlen=removed_log_size)  # (版本号, pid)
+        self.version = 0
+        self.session = os.urandom(4).hex()
+        self.last_refresh = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def token(self):
+        return f'{self.session}:{self.version}'
+
+    def refresh(self):
+        """刷新进程表（调用方需持有锁）"""
+        now = time.monotonic()
+        if self.version and now - self.last_refresh < MIN_REFRESH_INTERVAL:
+            return
+        self.last_refresh = now
+        self.version += 1
+        version = self.version
+
+        current = set(psutil.pids())
+        for pid in [p for p in self.keys if p not in current]:
+            self._remove(self.keys[pid], version)
+
+        for pid in current:
+            key = self.keys.get(pid)
+            replaced = False
+            try:
+                if key is not None and not self.procs[key].is_running():
+                    # 创建时间不同：pid 已被新进程复用
+                    self._remove(key, version, log=False)
+                    key, replaced = None, True
+                if key is None:
+                    proc = psutil.Process(pid)
+                    key = (pid, _read(proc.create_time))
+                    with proc.oneshot():
+                        # 第一次调用建立基准，返回值恒为0
+                        baseline = _read(proc.cpu_percent, None)
+                        row = {
+                            'pid': pid,
+                            'name': _read(proc.name),
+                            'cpu_percent': None if baseline is None else 0.0,
+                            'memory_percent': _round(_read(proc.memory_percent))
+                        }
+                    self.keys[pid] = key
+                    self.procs[key] = proc
+                    self.rows[key] = row
+                    self.created[key] = version
+                    self.changed[key] = version
+                    continue
+
+                proc = self.procs[key]
+                with proc.oneshot():
+                    cpu = _round(_read(proc.cpu_percent, None))
+                    memory = _round(_read(proc.memory_percent))
+                row = self.rows[key]
+                if cpu != row['cpu_percent'] or memory != row['memory_percent']:
+                    # 生成新字典，已返回给调用方的旧行不受影响
+                    self.rows[key] = dict(row, cpu_percent=cpu, memory_percent=memory)
+                    self.changed[key] = version
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                if pid in self.keys:
+                    self._remove(self.keys[pid], version)
+                elif replaced:
+                    self.removed.append((version, pid))
+            except psutil.AccessDenied:
+                # 连进程对象都无法建立，跳过
+                pass
+
+    def _remove(self, key, version, log=True):
+        del self.keys[key[0]]
+        del self.procs[key]
+        del self.rows[key]
+        del self.created[key]
+        del self.changed[key]
+        if log:
+            self.removed.append((version, key[0]))
+
+    def top(self, limit=20, sort='cpu'):
+        """刷新后返回排序最靠前的limit个进程"""
+        key = SORT_KEYS.get(sort, 'cpu_percent')
+        with self.lock:
+            self.refresh()
+            # 无权限读取的值（None）排在最后
+            processes = heapq.nlargest(int(limit), self.rows.values(),
+                                       key=lambda r: -1 if r[key] is None else r[key])
+            return {'processes': processes, 'total': len(self.rows), 'token': self.token}
+
+    def delta(self, since):
+        """刷新后返回相对since令牌的变化；令牌无效或过旧时返回完整进程表"""
+        with self.lock:
+            self.refresh()
+            base = self._parse_token(since)
+            if base is None:
+                return {
+                    'full': True,
+                    'processes': list(self.rows.values()),
+                    'total': len(self.rows),
+                    'token': self.token
+                }
+
+            added, changed = [], []
+            for key, row in self.rows.items():
+                if self.created[key] > base:
+                    added.append(row)
+                elif self.changed[key] > base:
+                    changed.append(row)
+            removed = [pid for version, pid in self.removed if version > base]
+            return {
+                'full': False,
+                'added': added,
+                'changed': changed,
+                'removed': removed,
+                'total': len(self.rows),
+                'token': self.token
+            }
+
+    def _parse_token(self, since):
+        try:
+            session, version = str(since).split(':')
+            version = int(version)
+        except ValueError:
+            return None
+        if session != self.session or version > self.version:
+            return None
+        # 结束记录已被淘汰，无法保证增量完整
+        if self.removed and len(self.removed) == self.removed.maxlen and self.removed[0][0] > version:
+            return None
+        return version
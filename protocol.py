@@ -0,0 +1,683 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+通信协议 - 服务端与客户端共用
+
+v1 分帧格式（所有整数均为网络字节序）:
+    magic(2) 'PM' | version(1) | type(1) | flags(1) | reserved(3) | length(8) | payload
+
+为兼容旧客户端，连接建立后默认使用旧的 "JSON + \\n__END__\\n" 协议。
+新客户端的第一条消息发送 hello 命令，服务端回复后双方切换到分帧协议；
+旧服务端不认识 hello，会返回错误，新客户端则继续使用旧协议。
+
+截图、二进制文件等大块数据作为附件发送：先发一条JSON元数据
+（其中 attachment.size 为附件长度），紧接着一帧原始二进制内容。
+旧协议下附件会被base64编码后放回JSON字段，保持旧客户端可用。
+
+压缩：客户端在hello中列出支持的编码（zlib/lzma），服务端取交集。
+超过阈值的帧按负载类型选择编码和级别压缩，帧头flags标明编码，
+压缩帧的内容以 原始长度(8) + 压缩耗时微秒(4) 开头；PNG/JPEG等已压缩数据不再压缩。
+
+流水线：分帧协议下请求可以带 request_id，服务端并发处理同一连接上的这类请求，
+响应带回相同的 request_id，返回顺序不保证与请求顺序一致；不带ID的请求仍按顺序处理。
+"""
+
+import asyncio
+import base64
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+import security
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+PROTOCOL_VERSION = 1
+MAGIC = b'PM'
+HEADER = struct.Struct('!2sBBB3xQ')
+
+# 消息类型
+MSG_JSON = 1
+MSG_BINARY = 2
+
+# 帧头flags：内容的压缩编码
+FLAG_ZLIB = 0x01
+FLAG_LZMA = 0x02
+CODEC_FLAGS = {'zlib': FLAG_ZLIB, 'lzma': FLAG_LZMA}
+COMPRESSED_PREFIX = struct.Struct('!QI')
+# JSON超过此大小且双方支持lzma时使用lzma，小消息用zlib更快
+LZMA_MIN_SIZE = 256 * 1024
+# 已压缩格式的文件头，这些数据不再压缩
+COMPRESSED_SIGNATURES = (
+    b'\x89PNG', b'\xff\xd8\xff', b'GIF8', b'PK\x03\x04',
+    b'\x1f\x8b', b'\xfd7zXZ', b'BZh', b'7z\xbc\xaf'
+)
+
+# 旧协议的结束标记
+LEGACY_END = b'\n__END__\n'
+LEGACY_RECV_SIZE = 8192
+
+HELLO_COMMAND = 'hello'
+# 服务端主动推送的消息带有此键（值为推送类型），与请求的响应区分
+PUSH_KEY = 'push'
+# 流水线请求的ID，服务端在对应的响应中原样带回
+REQUEST_ID_KEY = 'request_id'
+
+# 读入内存的单帧最大长度，防止异常帧头导致超大内存分配（流式写入文件的附件不受限）
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+# 小于此大小的消息把帧头和内容合并为一次发送
+COALESCE_SIZE = 64 * 1024
+# 接收附件时的固定缓冲区大小
+ATTACHMENT_CHUNK = 256 * 1024
+# 响应中存放附件对象的键，发送时会被取出
+ATTACHMENT_KEY = '_attachment'
+
+
+class ProtocolError(Exception):
+    """协议错误"""
+
+
+def pack_header(msg_type, length, flags=0):
+    """打包帧头"""
+    return HEADER.pack(MAGIC, PROTOCOL_VERSION, msg_type, flags, length)
+
+
+def unpack_header(data):
+    """解析帧头，返回 (type, flags, length)"""
+    magic, version, msg_type, flags, length = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ProtocolError('无效的帧头')
+    if version > PROTOCOL_VERSION:
+        raise ProtocolError(f'不支持的协议版本: {version}')
+    return msg_type, flags, length
+
+
+def recv_into_exact(sock, view):
+    """把数据直接读入预分配的缓冲区，直到填满"""
+    received = 0
+    total = len(view)
+    while received < total:
+        n = sock.recv_into(view[received:], total - received)
+        if n == 0:
+            raise ConnectionError('连接已关闭')
+        received += n
+
+
+def recv_exact(sock, size):
+    """读取固定长度的数据到内存"""
+    if size > MAX_FRAME_SIZE:
+        raise ProtocolError(f'帧过大: {size} 字节')
+    buffer = bytearray(size)
+    recv_into_exact(sock, memoryview(buffer))
+    return buffer
+
+
+def encode_json(message):
+    """序列化JSON消息"""
+    return json.dumps(message, ensure_ascii=False).encode('utf-8')
+
+
+def available_codecs():
+    """本机支持的压缩编码"""
+    return ['lzma', 'zlib'] if lzma is not None else ['zlib']
+
+
+def is_compressed_format(data):
+    """判断数据是否为PNG/JPEG/WebP/ZIP等已压缩格式"""
+    head = bytes(data[:12])
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return True
+    return head.startswith(COMPRESSED_SIGNATURES)
+
+
+def choose_codec(codecs, kind, size):
+    """按负载类型和大小选择编码与级别，返回 (codec, level)"""
+    if kind == 'json':
+        if 'lzma' in codecs and size >= LZMA_MIN_SIZE:
+            return 'lzma', 1
+        if 'zlib' in codecs:
+            return 'zlib', 6
+    elif 'zlib' in codecs:
+        # 二进制数据压缩收益通常较低，用最快的级别
+        return 'zlib', 1
+    if 'lzma' in codecs:
+        return 'lzma', 0
+    return None, 0
+
+
+def compress_payload(data, codecs, kind, threshold):
+    """按协商结果压缩一帧内容，返回 (flags, payload)；不值得压缩时原样返回"""
+    if not codecs or threshold <= 0 or len(data) < threshold:
+        return 0, data
+    if kind == 'binary' and is_compressed_format(data):
+        return 0, data
+    codec, level = choose_codec(codecs, kind, len(data))
+    if codec is None:
+        return 0, data
+
+    start = time.perf_counter()
+    if codec == 'lzma':
+        compressed = lzma.compress(data, preset=level)
+    else:
+        compressed = zlib.compress(data, level)
+    elapsed_us = min(int((time.perf_counter() - start) * 1e6), 0xFFFFFFFF)
+    if len(compressed) + COMPRESSED_PREFIX.size >= len(data):
+        return 0, data
+    return CODEC_FLAGS[codec], COMPRESSED_PREFIX.pack(len(data), elapsed_us) + compressed
+
+
+def _codec_name(flags):
+    if flags & FLAG_LZMA:
+        return 'lzma'
+    if flags & FLAG_ZLIB:
+        return 'zlib'
+    return None
+
+
+def _decompressor(codec):
+    if codec == 'lzma':
+        if lzma is None:
+            raise ProtocolError('本机不支持lzma')
+        return lzma.LZMADecompressor()
+    return zlib.decompressobj()
+
+
+def decode_payload(flags, payload):
+    """解压一帧内容，返回 (data, compression_info)；未压缩时info为None"""
+    codec = _codec_name(flags)
+    if codec is None:
+        return payload, None
+    raw_size, compress_us = COMPRESSED_PREFIX.unpack_from(payload)
+    start = time.perf_counter()
+    data = _decompressor(codec).decompress(memoryview(payload)[COMPRESSED_PREFIX.size:])
+    if len(data) != raw_size:
+        raise ProtocolError('解压后长度不符')
+    return data, {
+        'codec': codec,
+        'raw_size': raw_size,
+        'wire_size': len(payload),
+        'ratio': round(len(payload) / raw_size, 4) if raw_size else 1.0,
+        'compress_ms': round(compress_us / 1000, 3),
+        'decompress_ms': round((time.perf_counter() - start) * 1000, 3)
+    }
+
+
+def encode_message(message, framed, codecs=(), threshold=0, request=False):
+    """把消息编码为待发送的缓冲区列表，返回 (buffers, attachment)
+
+    分帧模式下附件内容不在缓冲区中，由调用方紧跟着发送；
+    旧协议下附件被base64编码进JSON字段，attachment 返回 None。
+    codecs/threshold 为连接协商的压缩编码和阈值。
+    旧协议只有响应以 __END__ 结尾，request 为True（客户端发出的请求）时只发送JSON本身。
+    """
+    attachment = message.pop(ATTACHMENT_KEY, None)
+    if not framed:
+        if attachment is not None:
+            try:
+                message[attachment.legacy_field] = base64.b64encode(
+                    attachment.read_all()).decode('ascii')
+            finally:
+                attachment.close()
+        if request:
+            return [encode_json(message)], None
+        return [encode_json(message) + LEGACY_END], None
+
+    if attachment is not None:
+        message['attachment'] = {'size': attachment.size}
+    flags, data = compress_payload(encode_json(message), codecs, 'json', threshold)
+    header = pack_header(MSG_JSON, len(data), flags)
+    if len(data) < COALESCE_SIZE:
+        buffers = [header + data]
+    else:
+        buffers = [header, data]
+    if attachment is not None:
+        # 只有内存中的附件会压缩，文件附件保持sendfile直接发送
+        if attachment.data is not None:
+            flags, attachment.data = compress_payload(attachment.data, codecs, 'binary', threshold)
+            buffers.append(pack_header(MSG_BINARY, len(attachment.data), flags))
+        else:
+            buffers.append(pack_header(MSG_BINARY, attachment.size))
+    return buffers, attachment
+
+
+def apply_metrics_update(state, data):
+    """把一条订阅推送的增量合并到客户端保存的完整状态中"""
+    for topic, value in data.items():
+        if isinstance(value, dict):
+            state.setdefault(topic, {}).update(value)
+        else:
+            state[topic] = value
+    return state
+
+
+def format_metrics(state):
+    """把订阅状态格式化为一行文字"""
+    parts = []
+    if 'cpu' in state:
+        parts.append(f"CPU {state['cpu'].get('percent', 0):5.1f}%")
+    if 'memory' in state:
+        parts.append(f"内存 {state['memory'].get('percent', 0):5.1f}%")
+    if 'net_io' in state:
+        net_io = state['net_io']
+        parts.append(f"↑ {net_io.get('bytes_sent_per_sec', 0) / 1024:7.1f} KB/s "
+                     f"↓ {net_io.get('bytes_recv_per_sec', 0) / 1024:7.1f} KB/s")
+    if state.get('battery'):
+        parts.append(f"电量 {state['battery'].get('level', '-')}%")
+    return ' | '.join(parts)
+
+
+def hello_response(params):
+    """根据客户端的hello参数生成协商结果（协议版本和双方都支持的压缩编码）"""
+    params = params or {}
+    version = min(int(params.get('protocol', 1)), PROTOCOL_VERSION)
+    offered = params.get('codecs') or []
+    codecs = [c for c in available_codecs() if c in offered]
+    return {'success': True, 'protocol': version, 'codecs': codecs, 'pipelining': True}
+
+
+class Attachment:
+    """响应附件：内存数据或文件，发送时不经过base64和JSON"""
+
+    def __init__(self, data=None, path=None, fileobj=None, offset=0, size=None,
+                 legacy_field='data'):
+        self.data = data
+        self.path = path
+        self.fileobj = fileobj
+        self.offset = offset
+        self.legacy_field = legacy_field
+        if size is None:
+            if data is not None:
+                size = len(data)
+            elif fileobj is not None:
+                size = os.fstat(fileobj.fileno()).st_size - offset
+            else:
+                size = os.path.getsize(path) - offset
+        self.size = size
+
+    def open(self):
+        """返回可供sendfile使用的文件对象"""
+        if self.fileobj is not None:
+            return self.fileobj
+        return open(self.path, 'rb')
+
+    def read_all(self):
+        """读取全部内容（仅旧协议需要）"""
+        if self.data is not None:
+            return bytes(self.data)
+        f = self.open()
+        try:
+            f.seek(self.offset)
+            return f.read(self.size)
+        finally:
+            f.close()
+
+    def close(self):
+        if self.fileobj is not None:
+            self.fileobj.close()
+
+
+class Connection:
+    """封装一个socket连接，负责消息的收发（兼容旧的__END__协议）"""
+
+    def __init__(self, sock, framed=False, compress_threshold=0, client=False):
+        self.sock = sock
+        self.framed = framed
+        # 客户端一侧的连接：旧协议下发出的请求不带结束标记
+        self.client = client
+        self.codecs = []
+        # 服务端是否支持带 request_id 的并发请求
+        self.pipelining = False
+        self.compress_threshold = compress_threshold
+        self.send_lock = threading.Lock()
+        try:
+            # 对端IP，服务端据此区分客户端（后台任务配额等）
+            self.peer = sock.getpeername()[0]
+        except (OSError, IndexError):
+            self.peer = None
+        self._header_buffer = bytearray(HEADER.size)
+        self._legacy_buffer = bytearray()
+        # 客户端收到推送消息时的回调
+        self.push_handler = None
+        # 客户端：hello 的响应（含服务端的认证挑战）；服务端：本连接是否已通过认证
+        self.hello = None
+        self.authenticated = False
+        self.auth_nonce = None
+
+    # ---------- 发送 ----------
+
+    def send_message(self, message):
+        """发送一条JSON消息，响应中带附件时紧跟着发送二进制帧"""
+        buffers, attachment = encode_message(
+            message, self.framed, self.codecs, self.compress_threshold, request=self.client)
+        try:
+            with self.send_lock:
+                for buf in buffers:
+                    self.sock.sendall(buf)
+                if attachment is not None:
+                    self._send_attachment(attachment)
+        finally:
+            if attachment is not None:
+                attachment.close()
+
+    def _send_attachment(self, attachment):
+        """发送附件内容：内存数据用memoryview，文件用sendfile"""
+        if attachment.data is not None:
+            self.sock.sendall(memoryview(attachment.data))
+            return
+        if not attachment.size:
+            # sendfile不接受长度0（空文件）
+            return
+        f = attachment.open()
+        try:
+            self.sock.sendfile(f, attachment.offset, attachment.size)
+        finally:
+            f.close()
+
+    # ---------- 接收 ----------
+
+    def recv_frame(self):
+        """接收一帧，返回 (type, flags, payload)"""
+        recv_into_exact(self.sock, memoryview(self._header_buffer))
+        msg_type, flags, length = unpack_header(self._header_buffer)
+        return msg_type, flags, recv_exact(self.sock, length)
+
+    def recv_message(self):
+        """接收一条分帧的JSON消息，压缩的消息附带 compression 统计"""
+        msg_type, flags, payload = self.recv_frame()
+        if msg_type != MSG_JSON:
+            raise ProtocolError(f'期望JSON消息，收到类型 {msg_type}')
+        data, info = decode_payload(flags, payload)
+        message = json.loads(bytes(data).decode('utf-8'))
+        if info is not None:
+            message['compression'] = info
+        return message
+
+    def recv_reply(self):
+        """接收下一条响应，途中收到的推送消息交给 push_handler"""
+        while True:
+            message = self.recv_message()
+            if PUSH_KEY not in message:
+                return message
+            if 'attachment' in message:
+                message['attachment_data'] = self.recv_attachment()
+            if self.push_handler:
+                self.push_handler(message)
+
+    def recv_push(self):
+        """接收下一条消息（通常为推送），带附件时一并读入 attachment_data"""
+        message = self.recv_message()
+        if 'attachment' in message:
+            message['attachment_data'] = self.recv_attachment()
+        return message
+
+    def recv_request(self):
+        """服务端接收请求，连接关闭时返回None"""
+        if self.framed:
+            try:
+                return self.recv_message()
+            except ConnectionError:
+                return None
+        data = self.sock.recv(LEGACY_RECV_SIZE)
+        if not data:
+            return None
+        return json.loads(data.decode('utf-8'))
+
+    def recv_response(self, save_to=None, progress=None):
+        """客户端接收响应
+
+        带附件时：save_to 为文件路径或已打开的文件对象则直接写入
+        （结果中的 saved_to 字段），否则读入内存放在 attachment_data 字段。
+        progress(received, total) 在每写入一块后调用。
+        """
+        if not self.framed:
+            return json.loads(self._recv_legacy().decode('utf-8'))
+        response = self.recv_reply()
+        info = response.get('attachment')
+        if info is not None:
+            if hasattr(save_to, 'write'):
+                self.recv_attachment(save_to, progress)
+                response['saved_to'] = getattr(save_to, 'name', None)
+            elif save_to:
+                with open(save_to, 'wb') as f:
+                    self.recv_attachment(f, progress)
+                response['saved_to'] = save_to
+            else:
+                response['attachment_data'] = bytes(self.recv_attachment())
+        return response
+
+    def recv_attachment(self, sink=None, progress=None):
+        """接收附件帧；有sink时按固定缓冲区分块写入，否则返回bytearray"""
+        recv_into_exact(self.sock, memoryview(self._header_buffer))
+        msg_type, flags, length = unpack_header(self._header_buffer)
+        if msg_type != MSG_BINARY:
+            raise ProtocolError(f'期望二进制附件，收到类型 {msg_type}')
+        if sink is None:
+            data, info = decode_payload(flags, recv_exact(self.sock, length))
+            return data
+
+        codec = _codec_name(flags)
+        decompressor = None
+        received = 0
+        if codec is not None:
+            recv_exact(self.sock, COMPRESSED_PREFIX.size)
+            received = COMPRESSED_PREFIX.size
+            decompressor = _decompressor(codec)
+
+        buffer = bytearray(min(ATTACHMENT_CHUNK, max(length, 1)))
+        view = memoryview(buffer)
+        while received < length:
+            n = self.sock.recv_into(view, min(length - received, len(buffer)))
+            if n == 0:
+                raise ConnectionError('连接已关闭')
+            if decompressor is not None:
+                sink.write(decompressor.decompress(view[:n]))
+            else:
+                sink.write(view[:n])
+            received += n
+            if progress:
+                progress(received, length)
+        return length
+
+    def _recv_legacy(self):
+        """按旧协议读取到结束标记为止，只在新到达的数据附近查找标记"""
+        buffer = self._legacy_buffer
+        start = 0
+        while True:
+            index = buffer.find(LEGACY_END, start)
+            if index >= 0:
+                data = bytes(buffer[:index])
+                del buffer[:index + len(LEGACY_END)]
+                return data
+            start = max(0, len(buffer) - len(LEGACY_END) + 1)
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError('连接已关闭')
+            buffer += chunk
+
+    # ---------- 协商 ----------
+
+    def accept_hello(self, params, extra=None):
+        """服务端处理hello：按旧协议回复后切换到分帧协议（extra 为附加字段，如认证挑战）"""
+        response = hello_response(params)
+        self.send_message(dict(response, **(extra or {})))
+        self.framed = True
+        self.codecs = response['codecs']
+
+    def negotiate(self):
+        """客户端发起协商，服务端支持时切换到分帧协议"""
+        request = {'command': HELLO_COMMAND,
+                   'params': {'protocol': PROTOCOL_VERSION, 'codecs': available_codecs()}}
+        with self.send_lock:
+            self.sock.sendall(encode_json(request))
+        response = self.recv_response()
+        if response.get('rejected'):
+            raise ConnectionError(response.get('error', '服务器拒绝连接'))
+        self.hello = response
+        if response.get('success') and response.get('protocol', 0) >= 1:
+            self.framed = True
+            self.codecs = response.get('codecs', [])
+            self.pipelining = bool(response.get('pipelining'))
+        return self.framed
+
+
+class AsyncConnection:
+    """asyncio版本的服务端连接，收发格式与 Connection 相同"""
+
+    def __init__(self, reader, writer, compress_threshold=0):
+        self.reader = reader
+        self.writer = writer
+        self.framed = False
+        self.codecs = []
+        self.compress_threshold = compress_threshold
+        self.peer = (writer.get_extra_info('peername') or [None])[0]
+        self.loop = asyncio.get_event_loop()
+        self.send_lock = asyncio.Lock()
+        # 本连接是否已通过认证，及下发给客户端的挑战
+        self.authenticated = False
+        self.auth_nonce = None
+
+    async def recv_request(self):
+        """接收请求，连接关闭时返回None"""
+        if not self.framed:
+            data = await self.reader.read(LEGACY_RECV_SIZE)
+            if not data:
+                return None
+            return json.loads(data.decode('utf-8'))
+
+        try:
+            header = await self.reader.readexactly(HEADER.size)
+        except asyncio.IncompleteReadError:
+            return None
+        msg_type, flags, length = unpack_header(header)
+        if length > MAX_FRAME_SIZE:
+            raise ProtocolError(f'帧过大: {length} 字节')
+        payload = await self.reader.readexactly(length)
+        if msg_type != MSG_JSON:
+            raise ProtocolError(f'期望JSON消息，收到类型 {msg_type}')
+        data, info = decode_payload(flags, payload)
+        return json.loads(bytes(data).decode('utf-8'))
+
+    async def send_message_async(self, message):
+        """发送一条消息，文件附件通过 loop.sendfile 发送"""
+        buffers, attachment = encode_message(
+            message, self.framed, self.codecs, self.compress_threshold)
+        try:
+            async with self.send_lock:
+                self.writer.writelines(buffers)
+                if attachment is not None:
+                    if attachment.data is not None:
+                        self.writer.write(memoryview(attachment.data))
+                    elif attachment.size:
+                        await self.writer.drain()
+                        f = attachment.open()
+                        try:
+                            await self.loop.sendfile(self.writer.transport, f,
+                                                     attachment.offset, attachment.size)
+                        finally:
+                            f.close()
+                await self.writer.drain()
+        finally:
+            if attachment is not None:
+                attachment.close()
+
+    def send_message(self, message):
+        """线程安全的同步发送，供执行器线程中的处理函数使用"""
+        asyncio.run_coroutine_threadsafe(self.send_message_async(message), self.loop).result()
+
+    async def accept_hello(self, params, extra=None):
+        """处理hello并切换到分帧协议"""
+        response = hello_response(params)
+        await self.send_message_async(dict(response, **(extra or {})))
+        self.framed = True
+        self.codecs = response['codecs']
+
+
+class AsyncClientConnection:
+    """asyncio版本的客户端连接，供同时控制多台设备使用；一次只处理一个请求"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.framed = False
+        self.codecs = []
+        self.hello = None
+
+    @classmethod
+    async def open(cls, host, port, ssl_context=None, password=None):
+        """建立连接、协商协议，服务端要求时完成密码认证"""
+        # 旧协议的响应按结束标记读取，放宽StreamReader的单次读取上限
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_FRAME_SIZE,
+                                                       ssl=ssl_context)
+        conn = cls(reader, writer)
+        try:
+            await conn.negotiate()
+            challenge = conn.hello.get('auth')
+            if challenge is not None:
+                params, proof = security.auth_params(challenge, password)
+                security.check_auth_response(await conn.request(security.AUTH_COMMAND, params), proof)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    async def negotiate(self):
+        request = {'command': HELLO_COMMAND,
+                   'params': {'protocol': PROTOCOL_VERSION, 'codecs': available_codecs()}}
+        self.writer.write(encode_json(request))
+        await self.writer.drain()
+        response = await self._recv_legacy()
+        if response.get('rejected'):
+            raise ConnectionError(response.get('error', '服务器拒绝连接'))
+        self.hello = response
+        if response.get('success') and response.get('protocol', 0) >= 1:
+            self.framed = True
+            self.codecs = response.get('codecs', [])
+        return self.framed
+
+    async def _recv_legacy(self):
+        data = await self.reader.readuntil(LEGACY_END)
+        return json.loads(data[:-len(LEGACY_END)].decode('utf-8'))
+
+    async def _recv_frame(self, expected):
+        header = await self.reader.readexactly(HEADER.size)
+        msg_type, flags, length = unpack_header(header)
+        if length > MAX_FRAME_SIZE:
+            raise ProtocolError(f'帧过大: {length} 字节')
+        if msg_type != expected:
+            raise ProtocolError(f'期望类型 {expected}，收到类型 {msg_type}')
+        data, info = decode_payload(flags, await self.reader.readexactly(length))
+        return data, info
+
+    async def request(self, command, params=None):
+        """发送命令并返回响应（途中的推送消息被忽略），附件读入 attachment_data"""
+        message = {'command': command, 'params': params or {}}
+        if not self.framed:
+            self.writer.write(encode_json(message))
+            await self.writer.drain()
+            return await self._recv_legacy()
+
+        buffers, _ = encode_message(message, True)
+        self.writer.writelines(buffers)
+        await self.writer.drain()
+        while True:
+            data, info = await self._recv_frame(MSG_JSON)
+            response = json.loads(bytes(data).decode('utf-8'))
+            if info is not None:
+                response['compression'] = info
+            if 'attachment' in response:
+                attachment, _ = await self._recv_frame(MSG_BINARY)
+                response['attachment_data'] = bytes(attachment)
+            if PUSH_KEY not in response:
+                return response
+
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
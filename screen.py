@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+截图采集与编码 - 服务端共用
+支持PNG/JPEG/WebP、质量、最大尺寸和灰度选项；
+Android上 screencap 直接把原始RGBA像素输出到管道，不再经过临时文件
+"""
+
+import io
+import os
+import struct
+import subprocess
+import time
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+FORMATS = {'PNG': 'PNG', 'JPEG': 'JPEG', 'JPG': 'JPEG', 'WEBP': 'WEBP'}
+
+# 客户端按保存文件的扩展名选择格式
+EXTENSIONS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG', '.webp': 'WEBP'}
+
+# PNG使用较低的压缩级别，编码速度快很多，体积只略大
+PNG_COMPRESS_LEVEL = 3
+
+# screencap 原始输出的像素格式（Android PixelFormat）
+PIXEL_FORMAT_RGBA_8888 = 1
+PIXEL_FORMAT_RGBX_8888 = 2
+
+
+def parse_options(params, default_quality=85):
+    """从请求参数解析编码选项"""
+    fmt = FORMATS.get(str(params.get('format') or 'PNG').upper())
+    if fmt is None:
+        raise ValueError(f"不支持的格式: {params.get('format')}")
+    quality = max(1, min(100, int(params.get('quality') or default_quality)))
+    max_width = params.get('max_width')
+    max_height = params.get('max_height')
+    return {
+        'fmt': fmt,
+        'quality': quality,
+        'max_width': int(max_width) if max_width else None,
+        'max_height': int(max_height) if max_height else None,
+        'grayscale': bool(params.get('grayscale')),
+    }
+
+
+def format_for_path(path):
+    """根据文件扩展名返回截图格式，无法识别时为PNG"""
+    return EXTENSIONS.get(os.path.splitext(str(path))[1].lower(), 'PNG')
+
+
+def capture_desktop():
+    """桌面系统截图"""
+    from PIL import ImageGrab
+    return ImageGrab.grab()
+
+
+def capture_android(timeout=10):
+    """Android截图：读取 screencap 输出到管道的原始像素"""
+    result = subprocess.run(['screencap'], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, timeout=timeout)
+    data = result.stdout
+    if result.returncode != 0 or len(data) < 12:
+        raise RuntimeError('截图命令执行失败')
+
+    width, height, pixel_format = struct.unpack_from('<III', data)
+    # 头部为12字节，Android 10起多一个4字节的色彩空间字段
+    header = len(data) - width * height * 4
+    if header not in (12, 16):
+        raise RuntimeError(f'无法识别的screencap输出（格式 {pixel_format}）')
+
+    pixels = memoryview(data)[header:]
+    if pixel_format == PIXEL_FORMAT_RGBX_8888:
+        # 解码时丢弃填充字节；frombuffer对RGBX会得到无法直接保存为PNG的RGBX图像
+        return Image.frombytes('RGB', (width, height), pixels, 'raw', 'RGBX')
+    return Image.frombuffer('RGBA', (width, height), pixels, 'raw', 'RGBA', 0, 1)
+
+
+def capture_android_png(timeout=10):
+    """没有Pillow时的退路：screencap -p 直接输出PNG到管道"""
+    result = subprocess.run(['screencap', '-p'], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, timeout=timeout)
+    if result.returncode != 0 or not result.stdout:
+        raise RuntimeError('截图命令执行失败')
+    return result.stdout
+
+
+def resize_image(image, max_width=None, max_height=None):
+    """按最大宽高等比缩小，不放大"""
+    if max_width or max_height:
+        scale = min((max_width or image.width) / image.width,
+                    (max_height or image.height) / image.height)
+        if scale < 1:
+            size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+            image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    return image
+
+
+def encode_image(image, fmt='PNG', quality=85, max_width=None, max_height=None, grayscale=False):
+    """按选项缩放并编码图片，返回 (数据, 统计信息)"""
+    start = time.perf_counter()
+    original_size = image.size
+
+    image = resize_image(image, max_width, max_height)
+    if grayscale:
+        image = image.convert('L')
+    elif fmt == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    buffer = io.BytesIO()
+    if fmt == 'PNG':
+        image.save(buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+    elif fmt == 'JPEG':
+        image.save(buffer, format='JPEG', quality=quality)
+    else:
+        image.save(buffer, format='WEBP', quality=quality, method=0)
+
+    data = buffer.getbuffer()
+    return data, {
+        'format': fmt,
+        'width': image.width,
+        'height': image.height,
+        'original_width': original_size[0],
+        'original_height': original_size[1],
+        'quality': quality if fmt != 'PNG' else None,
+        'encode_ms': round((time.perf_counter() - start) * 1000, 1),
+        'bytes': len(data),
+    }
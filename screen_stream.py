@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+屏幕直播 - 服务端推流与客户端合成
+服务端按目标帧率截图，把画面切成方块，只编码并推送与上一帧不同的区域；
+发送是阻塞的，客户端跟不上时下一帧会推迟，错过的帧直接丢弃而不是排队
+"""
+
+import io
+import itertools
+import threading
+import time
+
+import protocol
+import screen
+from screen import Image
+
+MAX_FPS = 30
+DEFAULT_TILE_SIZE = 128
+
+# 变化区域超过该比例时直接发送整帧，一次编码比大量小块更快也更小
+FULL_FRAME_RATIO = 0.5
+
+
+class TileDiffer:
+    """逐块比较相邻两帧的原始像素，返回变化的矩形区域"""
+
+    def __init__(self, tile_size=DEFAULT_TILE_SIZE):
+        self.tile_size = tile_size
+        self.previous = None
+        self.size = None
+        self.mode = None
+
+    def reset(self):
+        self.previous = None
+
+    def diff(self, image):
+        """返回 (是否整帧, 变化区域列表[(x, y, w, h)])，同一行中相邻的变化块合并为一个区域"""
+        data = image.tobytes()
+        width, height = image.size
+        previous, self.previous = self.previous, data
+        if previous is None or image.size != self.size or image.mode != self.mode:
+            self.size, self.mode = image.size, image.mode
+            return True, [(0, 0, width, height)]
+
+        bpp = len(image.getbands())
+        stride = width * bpp
+        ts = self.tile_size
+        regions = []
+        changed_area = 0
+        for top in range(0, height, ts):
+            bottom = min(top + ts, height)
+            band = slice(top * stride, bottom * stride)
+            # 整条相同时跳过，静止画面的绝大部分只需这一次比较
+            if data[band] == previous[band]:
+                continue
+            run_start = None
+            for left in range(0, width, ts):
+                right = min(left + ts, width)
+                if self._tile_changed(data, previous, stride, bpp, top, bottom, left, right):
+                    if run_start is None:
+                        run_start = left
+                    continue
+                if run_start is not None:
+                    regions.append((run_start, top, left - run_start, bottom - top))
+                    run_start = None
+            if run_start is not None:
+                regions.append((run_start, top, width - run_start, bottom - top))
+
+        for _, _, w, h in regions:
+            changed_area += w * h
+        if changed_area > width * height * FULL_FRAME_RATIO:
+            return True, [(0, 0, width, height)]
+        return False, regions
+
+    @staticmethod
+    def _tile_changed(data, previous, stride, bpp, top, bottom, left, right):
+        start = left * bpp
+        end = right * bpp
+        for row in range(top, bottom):
+            offset = row * stride
+            if data[offset + start:offset + end] != previous[offset + start:offset + end]:
+                return True
+        return False
+
+
+class ScreenStream(threading.Thread):
+    """单个直播：后台线程循环截图、比较、编码并推送"""
+
+    def __init__(self, stream_id, conn, capture, options, fps, tile_size):
+        super().__init__(name=f'screen-stream-{stream_id}', daemon=True)
+        self.id = stream_id
+        self.conn = conn
+        self.capture = capture
+        self.options = options
+        self.fps = fps
+        self.differ = TileDiffer(tile_size)
+        self.seq = 0
+        self.dropped = 0
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        interval = 1.0 / self.fps
+        deadline = time.monotonic()
+        while not self.stop_event.is_set():
+            try:
+                self.send_frame()
+            except Exception as e:
+                # 连接失效或截图失败都结束本次直播
+                print(f"[-] 屏幕直播 {self.id} 结束: {e}")
+                self.send_error(str(e))
+                break
+
+            deadline += interval
+            now = time.monotonic()
+            if now > deadline:
+                # 发送阻塞或截图过慢，错过的帧直接丢弃，从当前时间重新计时
+                self.dropped += int((now - deadline) / interval) + 1
+                deadline = now
+            elif self.stop_event.wait(deadline - now):
+                break
+
+    def send_error(self, error):
+        """通知客户端直播已中止（连接已失效时忽略）"""
+        try:
+            self.conn.send_message({protocol.PUSH_KEY: 'screen', 'stream': self.id, 'error': error})
+        except Exception:
+            pass
+
+    def send_frame(self):
+        start = time.perf_counter()
+        image = self.capture()
+        image = screen.resize_image(image, self.options['max_width'], self.options['max_height'])
+        if self.options['grayscale']:
+            image = image.convert('L')
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        capture_ms = (time.perf_counter() - start) * 1000
+
+        full, regions = self.differ.diff(image)
+        if not regions:
+            return
+
+        start = time.perf_counter()
+        tiles = []
+        chunks = []
+        offset = 0
+        for x, y, w, h in regions:
+            tile = image if full else image.crop((x, y, x + w, y + h))
+            data, _ = screen.encode_image(tile, self.options['fmt'], self.options['quality'])
+            tiles.append([x, y, w, h, offset, len(data)])
+            chunks.append(data)
+            offset += len(data)
+        encode_ms = (time.perf_counter() - start) * 1000
+
+        self.conn.send_message({
+            protocol.PUSH_KEY: 'screen',
+            'stream': self.id,
+            'seq': self.seq,
+            'full': full,
+            'width': image.width,
+            'height': image.height,
+            'mode': image.mode,
+            'format': self.options['fmt'],
+            'tiles': tiles,
+            'dropped': self.dropped,
+            'capture_ms': round(capture_ms, 1),
+            'encode_ms': round(encode_ms, 1),
+            protocol.ATTACHMENT_KEY: protocol.Attachment(data=b''.join(chunks))
+        })
+        self.seq += 1
+
+
+class ScreenStreamManager:
+    """管理各连接的屏幕直播，每个连接同时最多一个"""
+
+    def __init__(self, capture):
+        self.capture = capture
+        self.streams = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def start(self, conn, params, default_quality=70):
+        """开始直播，返回 ScreenStream；同一连接已有的直播会先停止"""
+        if Image is None:
+            raise RuntimeError('需要安装Pillow')
+        options = screen.parse_options(dict(params, format=params.get('format') or 'JPEG'),
+                                       default_quality)
+        fps = max(0.1, min(float(params.get('fps') or 5), MAX_FPS))
+        tile_size = max(16, int(params.get('tile_size') or DEFAULT_TILE_SIZE))
+
+        self.stop(conn)
+        stream = ScreenStream(next(self._ids), conn, self.capture, options, fps, tile_size)
+        with self.lock:
+            self.streams[conn] = stream
+        stream.start()
+        return stream
+
+    def stop(self, conn, stream_id=None):
+        """停止该连接的直播，返回是否确有直播被停止"""
+        with self.lock:
+            stream = self.streams.get(conn)
+            if stream is None or (stream_id is not None and stream.id != stream_id):
+                return False
+            del self.streams[conn]
+        stream.stop()
+        return True
+
+    def remove_connection(self, conn):
+        """连接关闭时停止其直播"""
+        self.stop(conn)
+
+
+class FrameCompositor:
+    """客户端：把推送的变化区域贴到本地画布上，还原完整画面"""
+
+    def __init__(self):
+        self.canvas = None
+        self.frames = 0
+        self.bytes = 0
+        self.last_message = None
+
+    def apply(self, message):
+        """合并一帧推送，返回当前完整画面（PIL Image）"""
+        if Image is None:
+            raise RuntimeError('需要安装Pillow')
+        data = message.get('attachment_data') or b''
+        size = (message['width'], message['height'])
+        mode = message.get('mode', 'RGB')
+        if message.get('full') or self.canvas is None or self.canvas.size != size or self.canvas.mode != mode:
+            self.canvas = Image.new(mode, size)
+
+        view = memoryview(data)
+        for x, y, w, h, offset, length in message.get('tiles', []):
+            tile = Image.open(io.BytesIO(view[offset:offset + length]))
+            if tile.mode != mode:
+                tile = tile.convert(mode)
+            self.canvas.paste(tile, (x, y))
+
+        self.frames += 1
+        self.bytes += len(data)
+        self.last_message = message
+        return self.canvas
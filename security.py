@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传输安全 - 服务端和客户端共用
+可选的TLS加密（客户端缓存会话票据，重连时恢复会话，省去完整握手的证书运算）、
+基于共享密码的HMAC挑战应答认证（每个连接一次，密码不在网络上传输）、按IP/网段限制来源
+
+直接运行本文件对比完整握手与会话恢复的耗时: python security.py [次数]
+"""
+
+import hashlib
+import hmac
+import ipaddress
+import os
+import secrets
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+AUTH_COMMAND = 'auth'
+AUTH_METHOD = 'hmac-sha256'
+# TLS握手的超时（秒），防止不发送数据的连接一直占用处理线程
+HANDSHAKE_TIMEOUT = 10
+
+
+# ---------- 来源IP限制 ----------
+
+class IPAllowList:
+    """ALLOWED_IPS：单个IP或CIDR网段，为空时允许所有"""
+
+    def __init__(self, entries):
+        self.networks = [ipaddress.ip_network(entry.strip(), strict=False)
+                         for entry in entries if entry.strip()]
+
+    def __bool__(self):
+        return bool(self.networks)
+
+    def allows(self, address):
+        if not self.networks:
+            return True
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        return any(ip in network for network in self.networks)
+
+
+# ---------- TLS ----------
+
+def server_context(certfile, keyfile):
+    """服务端TLS上下文；会话票据由OpenSSL默认开启，票据密钥在进程生命周期内有效"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(certfile, keyfile)
+    context.options &= ~ssl.OP_NO_TICKET
+    return context
+
+
+def client_context(cafile=None):
+    """客户端TLS上下文
+
+    给出 cafile（通常就是服务端的自签名证书）时校验证书链，相当于固定证书；
+    不给出时只加密、不校验身份（中间人可以冒充服务端，应配合密码认证使用）。
+    连接通常使用IP地址，不检查证书中的主机名。
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.check_hostname = False
+    if cafile:
+        context.load_verify_locations(cafile)
+        context.verify_mode = ssl.CERT_REQUIRED
+    else:
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def generate_certificate(certfile, keyfile, days=3650, name='phone-monitor'):
+    """用 openssl 命令生成自签名证书（EC P-256，握手运算量远小于RSA）"""
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1',
+        '-nodes', '-keyout', keyfile, '-out', certfile, '-days', str(days), '-subj', f'/CN={name}'
+    ], check=True, capture_output=True)
+
+
+def load_server_context(certfile, keyfile):
+    """服务端启用TLS时调用：证书不存在则先生成，返回 (上下文, 证书SHA-256指纹)"""
+    if not (os.path.exists(certfile) and os.path.exists(keyfile)):
+        generate_certificate(certfile, keyfile)
+        print(f"[*] 已生成自签名证书: {certfile}")
+    with open(certfile, 'r') as f:
+        der = ssl.PEM_cert_to_DER_cert(f.read())
+    return server_context(certfile, keyfile), hashlib.sha256(der).hexdigest()
+
+
+# ---------- 认证 ----------
+
+def _digest(secret, *parts):
+    return hmac.new(secret.encode('utf-8'), ':'.join(parts).encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+class Authenticator:
+    """服务端：hello 响应中下发随机挑战，客户端用 auth 命令返回 HMAC(密码, 挑战:客户端随机数)
+
+    认证成功后服务端返回 HMAC(密码, 客户端随机数:挑战)，客户端据此确认服务端同样知道密码。
+    """
+
+    def __init__(self, password=None):
+        self.password = password or None
+
+    @property
+    def required(self):
+        return self.password is not None
+
+    def challenge(self, conn):
+        """生成本连接的挑战，作为 hello 响应的附加字段；不需要认证时返回None"""
+        if not self.required:
+            return None
+        conn.auth_nonce = secrets.token_hex(16)
+        return {'auth': {'method': AUTH_METHOD, 'nonce': conn.auth_nonce}}
+
+    def verify(self, conn, params):
+        """处理 auth 命令，成功时标记连接已认证"""
+        nonce = conn.auth_nonce
+        client_nonce = str(params.get('client_nonce', ''))
+        if not self.required:
+            conn.authenticated = True
+            return {'success': True}
+        if nonce is None or not client_nonce:
+            return {'success': False, 'error': '认证前需要先协商协议'}
+        # 每个挑战只能使用一次
+        conn.auth_nonce = None
+        expected = _digest(self.password, nonce, client_nonce)
+        if not hmac.compare_digest(expected, str(params.get('digest', ''))):
+            return {'success': False, 'error': '认证失败'}
+        conn.authenticated = True
+        return {'success': True, 'proof': _digest(self.password, client_nonce, nonce)}
+
+
+def auth_params(challenge, password):
+    """客户端：根据服务端的挑战生成 auth 命令的参数，返回 (参数, 期望的服务端应答)"""
+    if not password:
+        raise ConnectionError('服务器需要密码')
+    if challenge.get('method') != AUTH_METHOD:
+        raise ConnectionError(f"不支持的认证方式: {challenge.get('method')}")
+    client_nonce = secrets.token_hex(16)
+    params = {'client_nonce': client_nonce, 'digest': _digest(password, challenge['nonce'], client_nonce)}
+    return params, _digest(password, client_nonce, challenge['nonce'])
+
+
+def check_auth_response(response, proof):
+    if not response.get('success'):
+        raise ConnectionError(response.get('error', '认证失败'))
+    if not hmac.compare_digest(str(response.get('proof', '')), proof):
+        raise ConnectionError('服务端认证应答无效')
+
+
+def authenticate(conn, password):
+    """客户端：服务端在 hello 响应中要求认证时完成挑战应答，失败时抛出 ConnectionError"""
+    challenge = (conn.hello or {}).get('auth')
+    if challenge is None:
+        return False
+    params, proof = auth_params(challenge, password)
+    conn.send_message({'command': AUTH_COMMAND, 'params': params})
+    check_auth_response(conn.recv_reply(), proof)
+    return True
+
+
+# ---------- 对比测试 ----------
+
+def _serve(listener, context, stop):
+    while not stop.is_set():
+        try:
+            sock, _ = listener.accept()
+        except OSError:
+            break
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            with context.wrap_socket(sock, server_side=True) as tls:
+                # TLS 1.3 的会话票据在握手后发送，读取一个字节让票据随之送达
+                tls.sendall(b'x')
+                tls.recv(1)
+        except OSError:
+            pass
+
+
+def benchmark(rounds=50):
+    """本机回环上对比：TCP连接、完整TLS握手、会话票据恢复"""
+    workdir = tempfile.mkdtemp()
+    certfile, keyfile = os.path.join(workdir, 'bench.crt'), os.path.join(workdir, 'bench.key')
+    try:
+        generate_certificate(certfile, keyfile)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"✗ 无法生成测试证书（需要openssl命令）: {e}")
+        return
+    listener = socket.create_server(('127.0.0.1', 0))
+    address = listener.getsockname()
+    stop = threading.Event()
+    threading.Thread(target=_serve, args=(listener, server_context(certfile, keyfile), stop),
+                     daemon=True).start()
+    context = client_context(certfile)
+
+    def connect(session=None):
+        sock = socket.create_connection(address)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        tls = context.wrap_socket(sock, session=session)
+        tls.recv(1)
+        tls.sendall(b'x')
+        return tls
+
+    def run(label, once):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            once()
+        elapsed = (time.perf_counter() - start) * 1000 / rounds
+        print(f"{label:<18} {elapsed:>10.2f} ms")
+        return elapsed
+
+    print(f"{'项目':<16} {'平均每次':>12}   （{ssl.OPENSSL_VERSION}，{rounds}次）")
+    print('-' * 44)
+    try:
+        run('TCP连接', lambda: socket.create_connection(address).close())
+        full = run('TLS完整握手', lambda: connect().close())
+        first = connect()
+        session = first.session
+        first.close()
+        reused = []
+
+        def resume():
+            tls = connect(session)
+            reused.append(tls.session_reused)
+            tls.close()
+
+        resumed = run('TLS会话恢复', resume)
+        run('HMAC认证计算', lambda: _digest('password', secrets.token_hex(16), secrets.token_hex(16)))
+        print('-' * 44)
+        print(f"会话恢复成功 {sum(reused)}/{len(reused)} 次，握手耗时为完整握手的 {resumed / full:.0%}")
+    finally:
+        stop.set()
+        listener.close()
+        for path in (certfile, keyfile):
+            os.remove(path)
+        os.rmdir(workdir)
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
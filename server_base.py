@@ -0,0 +1,938 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务端共用 - server.py 与 android_server.py 的命令处理、连接管理和启动流程
+平台相关的部分（截图、设备信息、默认目录等）由子类覆盖
+"""
+
+import socket
+import json
+import configparser
+import logging
+import threading
+import time
+import os
+import sys
+import platform
+import subprocess
+from datetime import datetime
+
+import protocol
+from config import LOGGER_NAME, ConfigWatcher, MonitorConfig, setup_logging
+from async_server import AsyncServerCore
+from metrics import MetricsSampler, MetricsHistory
+from subscriptions import SubscriptionHub
+from process_table import ProcessTable
+import screen
+import file_listing
+from file_index import FileIndex
+import file_sync
+from batch import BatchRunner
+from cache import ResponseCache
+import discovery
+import security
+from exec_stream import ExecStreamManager
+from jobs import JobError, JobManager
+from screen_stream import ScreenStreamManager
+
+logger = logging.getLogger(LOGGER_NAME)
+
+class MonitorServerBase:
+    """监控服务端基类"""
+    
+    # 启动信息的标题和 processes 命令的默认条数
+    TITLE = "📱 监控服务端已启动"
+    PROCESS_LIMIT = 20
+    
+    def __init__(self, host=None, port=None, config=None):
+        self.config = config or MonitorConfig.load()
+        # 未指定时使用配置文件中的 HOST / PORT
+        self.host = host or self.config.host
+        self.port = port if port is not None else self.config.port
+        setup_logging(self.config)
+        self.config_watcher = ConfigWatcher(self.config.path, self.reload_config, self.config.reload_interval)
+        self.server_socket = None
+        self.running = False
+        self.clients = []
+        self.clients_lock = threading.Lock()
+        self.sampler = MetricsSampler(self.config.sample_interval)
+        self.history = MetricsHistory(self.config.history_size)
+        self.sampler.add_listener(self.history.append)
+        self.process_table = ProcessTable()
+        self.subscriptions = SubscriptionHub(self.sampler, process_provider=self.top_processes)
+        self.screen_streams = ScreenStreamManager(self.capture_screen)
+        self.exec_streams = ExecStreamManager()
+        self.auth = security.Authenticator(self.config.password if self.config.password_enabled else None)
+        self.allowed_ips = security.IPAllowList(self.config.allowed_ips)
+        self.tls_context, self.tls_fingerprint = None, None
+        if self.config.tls_enabled:
+            try:
+                self.tls_context, self.tls_fingerprint = security.load_server_context(
+                    self.config.tls_cert, self.config.tls_key)
+            except Exception as e:
+                # 不退回明文传输
+                print(f"[-] TLS初始化失败: {e}")
+                sys.exit(1)
+        self.discovery = discovery.DiscoveryResponder(
+            self.discovery_info, self.config.discovery_port,
+            is_allowed=lambda address: self.allowed_ips.allows(address))
+        self.cache = ResponseCache(self.config.cache_ttls if self.config.cache_enabled else {})
+        self.batch = BatchRunner(self.handle_command, self.config.worker_threads)
+        self.jobs = JobManager(self.config.job_workers, self.config.job_queue_size,
+                               self.config.job_max_per_client, self.config.job_output_budget)
+        self.file_index = FileIndex(self.config.index_file, self.config.index_roots or [self.default_root()])
+    
+    def default_root(self):
+        """files 命令和文件索引的默认目录"""
+        return os.path.expanduser('~')
+    
+    def platform_name(self):
+        """自动发现应答中的平台名称"""
+        return platform.system()
+    
+    def capture_screen(self):
+        """截取一帧屏幕（PIL图像），截图和屏幕直播共用"""
+        return screen.capture_desktop()
+    
+    def get_device_info(self):
+        """获取设备信息"""
+        info = {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'platform': platform.platform(),
+            'system': platform.system(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'python_version': sys.version,
+        }
+        
+        # 系统指标来自后台采样线程的最新快照，不在请求中阻塞采样
+        snapshot = self.sampler.snapshot()
+        if snapshot:
+            info.update(snapshot)
+        else:
+            info['note'] = '安装psutil可获取更多系统信息: pip install psutil'
+        info['cache'] = self.cache.stats()
+        
+        return {'success': True, 'data': info}
+    
+    def take_screenshot(self, params=None):
+        """截取屏幕（可选 format/quality/max_width/max_height/grayscale）"""
+        try:
+            options = screen.parse_options(params or {}, self.config.screenshot_quality)
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'error': f'参数错误: {e}'}
+        
+        try:
+            # 尝试使用PIL截图
+            start = time.perf_counter()
+            image = self.capture_screen()
+            capture_ms = round((time.perf_counter() - start) * 1000, 1)
+            img_data, stats = screen.encode_image(image, **options)
+            
+            # 图片作为二进制附件发送，不再base64
+            response = {
+                'success': True, 
+                'size': len(img_data),
+                'capture_ms': capture_ms,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                protocol.ATTACHMENT_KEY: protocol.Attachment(data=img_data)
+            }
+            response.update(stats)
+            return response
+        except ImportError:
+            return {
+                'success': False, 
+                'error': '需要安装PIL: pip install pillow'
+            }
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def get_running_processes(self, limit=20, sort='cpu', since=None):
+        """获取运行中的进程（传入since令牌时只返回新增、结束和变化的进程）"""
+        try:
+            import psutil
+        except ImportError:
+            return {'success': False, 'error': '需要安装psutil: pip install psutil'}
+        
+        try:
+            if since is not None:
+                result = self.process_table.delta(since)
+            else:
+                result = self.process_table.top(limit, sort)
+            result['success'] = True
+            return result
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def list_files(self, params):
+        """列出文件（支持 sort/order/pattern/extensions 和 limit/cursor 分页）"""
+        path = params.get('path') or self.default_root()
+        
+        try:
+            if not os.path.exists(path):
+                return {'success': False, 'error': '路径不存在'}
+            
+            result = file_listing.list_directory(
+                path,
+                sort=params.get('sort', 'name'),
+                order=params.get('order', 'asc'),
+                pattern=params.get('pattern'),
+                extensions=params.get('extensions'),
+                limit=params.get('limit'),
+                cursor=params.get('cursor'),
+                dirs_first=params.get('dirs_first', True)
+            )
+            result.update({'success': True, 'path': path})
+            return result
+        except ValueError as e:
+            return {'success': False, 'error': f'参数错误: {e}'}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def get_file_content(self, filepath):
+        """读取文件内容"""
+        try:
+            if not os.path.exists(filepath):
+                return {'success': False, 'error': '文件不存在'}
+                
+            if os.path.isdir(filepath):
+                return {'success': False, 'error': '这是一个目录'}
+                
+            # 限制文件大小，更大的文件请使用download命令
+            file_size = os.path.getsize(filepath)
+            limit = self.config.max_file_size
+            if file_size > limit:
+                return {'success': False, 'error': f'文件太大（超过{limit // (1024 * 1024)}MB），请使用download命令'}
+            
+            # 只读取一次，再尝试按文本解码
+            with open(filepath, 'rb') as f:
+                raw = f.read()
+            try:
+                return {
+                    'success': True, 
+                    'content': raw.decode('utf-8'),
+                    'type': 'text',
+                    'size': file_size
+                }
+            except UnicodeDecodeError:
+                # 二进制文件，作为附件直接发送
+                return {
+                    'success': True,
+                    'type': 'binary',
+                    'size': file_size,
+                    protocol.ATTACHMENT_KEY: protocol.Attachment(data=raw, legacy_field='content')
+                }
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def download_file(self, filepath, offset=0, length=None):
+        """流式下载文件，offset用于断点续传"""
+        try:
+            if not filepath or not os.path.isfile(filepath):
+                return {'success': False, 'error': '文件不存在'}
+            
+            f = open(filepath, 'rb')
+            try:
+                stat = os.fstat(f.fileno())
+                offset = int(offset or 0)
+                if offset < 0 or offset > stat.st_size:
+                    f.close()
+                    return {'success': False, 'error': f'无效的偏移量: {offset}'}
+                
+                remaining = stat.st_size - offset
+                length = remaining if length is None else min(int(length), remaining)
+                
+                # 通过已打开的文件描述符sendfile，内存占用与文件大小无关
+                return {
+                    'success': True,
+                    'size': stat.st_size,
+                    'offset': offset,
+                    'length': length,
+                    'mtime': stat.st_mtime,
+                    protocol.ATTACHMENT_KEY: protocol.Attachment(fileobj=f, offset=offset, size=length)
+                }
+            except Exception:
+                f.close()
+                raise
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def sync_plan(self, params):
+        """目录同步第一步：对比客户端清单 {相对路径: [大小, 修改时间]}，返回新增/变化/删除的文件"""
+        root = params.get('path')
+        if not root or not os.path.isdir(root):
+            return {'success': False, 'error': '目录不存在'}
+        try:
+            remote = file_sync.scan_tree(root)
+            plan = file_sync.make_plan(remote, params.get('manifest') or {})
+        except (TypeError, ValueError, IndexError) as e:
+            return {'success': False, 'error': f'参数错误: {e}'}
+        plan['sizes'] = {rel: remote[rel][0] for rel in plan['new'] + plan['changed']}
+        plan.update({'success': True, 'path': root})
+        return plan
+    
+    def sync_files(self, conn, params):
+        """目录同步第二步：依次推送 files 中的文件，不等待客户端逐个确认
+
+        signatures 中给出分块校验和的文件只发送差异，其余整体发送（sendfile）。
+        """
+        if conn is None or not conn.framed:
+            return {'success': False, 'error': '同步需要新版协议'}
+        root = params.get('path')
+        if not root or not os.path.isdir(root):
+            return {'success': False, 'error': '目录不存在'}
+        
+        signatures = params.get('signatures') or {}
+        start = time.time()
+        stats = {'files': 0, 'skipped': [], 'total_bytes': 0, 'sent_bytes': 0, 'matched_bytes': 0}
+        for rel in params.get('files') or []:
+            try:
+                path = file_sync.safe_join(root, rel)
+                signature = signatures.get(rel)
+                f = open(path, 'rb')
+                stat = os.fstat(f.fileno())
+                message = {protocol.PUSH_KEY: 'sync', 'path': rel, 'size': stat.st_size, 'mtime': stat.st_mtime}
+                if signature and stat.st_size <= file_sync.DELTA_MAX_SIZE:
+                    with f:
+                        data = f.read()
+                    ops, literal = file_sync.compute_delta(data, signature['block_size'], signature['blocks'])
+                    message.update({'mode': 'delta', 'block_size': signature['block_size'], 'ops': ops,
+                                    protocol.ATTACHMENT_KEY: protocol.Attachment(data=literal)})
+                    sent = len(literal)
+                else:
+                    message.update({'mode': 'full', protocol.ATTACHMENT_KEY: protocol.Attachment(fileobj=f)})
+                    sent = stat.st_size
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                stats['skipped'].append({'path': rel, 'error': str(e)})
+                continue
+            
+            # 阻塞发送，客户端处理慢时自然限速
+            conn.send_message(message)
+            stats['files'] += 1
+            stats['total_bytes'] += message['size']
+            stats['sent_bytes'] += sent
+            stats['matched_bytes'] += message['size'] - sent
+        
+        stats.update({'success': True, 'elapsed': round(time.time() - start, 3)})
+        return stats
+    
+    def execute_command(self, command):
+        """执行系统命令（谨慎使用）"""
+        try:
+            result = subprocess.run(
+                command,
+                shell=True,
+                capture_output=True,
+                text=True,
+                timeout=30
+            )
+            return {
+                'success': True,
+                'stdout': result.stdout,
+                'stderr': result.stderr,
+                'returncode': result.returncode
+            }
+        except subprocess.TimeoutExpired:
+            return {'success': False, 'error': '命令执行超时'}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def execute_command_stream(self, conn, params):
+        """流式执行命令：输出分块推送，可用 exec_cancel 取消"""
+        if conn is None or not conn.framed:
+            return {'success': False, 'error': '流式执行需要新版协议'}
+        command = params.get('command')
+        if not command:
+            return {'success': False, 'error': '缺少command参数'}
+        try:
+            timeout = float(params.get('timeout', self.config.exec_timeout) or 0)
+            idle_timeout = float(params.get('idle_timeout', self.config.exec_idle_timeout) or 0)
+            # 输出上限不能超过配置值
+            max_output = int(params.get('max_output') or self.config.exec_max_output)
+            max_output = min(max_output, self.config.exec_max_output)
+            stream = self.exec_streams.start(conn, command, timeout, idle_timeout, max_output)
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'error': f'参数错误: {e}'}
+        except RuntimeError as e:
+            return {'success': False, 'error': str(e)}
+        return {'success': True, 'id': stream.id, 'timeout': timeout,
+                'idle_timeout': idle_timeout, 'max_output': max_output}
+    
+    def cancel_command_stream(self, conn, params):
+        """取消流式执行的命令（不指定id时取消本连接的全部）"""
+        count = self.exec_streams.cancel(conn, params.get('id'))
+        return {'success': True, 'cancelled': count}
+    
+    def submit_job(self, conn, params):
+        """提交后台任务，立即返回任务ID"""
+        command = params.get('command')
+        if not command:
+            return {'success': False, 'error': '缺少command参数'}
+        try:
+            timeout = float(params.get('timeout', self.config.exec_timeout) or 0)
+            idle_timeout = float(params.get('idle_timeout', self.config.exec_idle_timeout) or 0)
+            max_output = min(int(params.get('max_output') or self.config.exec_max_output),
+                             self.config.exec_max_output)
+            job = self.jobs.submit(self.client_id(conn), command, timeout, idle_timeout, max_output)
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'error': f'参数错误: {e}'}
+        except JobError as e:
+            return {'success': False, 'error': str(e)}
+        return {'success': True, 'id': job.id, 'status': job.status}
+    
+    def job_command(self, conn, command, params):
+        """job_status/job_output/job_cancel/job_list"""
+        owner = self.client_id(conn)
+        try:
+            if command == 'job_list':
+                return {'success': True, 'jobs': self.jobs.list(owner), 'pool': self.jobs.stats()}
+            job_id = int(params.get('id'))
+            if command == 'job_status':
+                return dict(self.jobs.get(owner, job_id).info(), success=True)
+            if command == 'job_cancel':
+                return dict(self.jobs.cancel(owner, job_id).info(), success=True)
+            result = self.jobs.output(owner, job_id, params.get('stdout_offset'),
+                                      params.get('stderr_offset'))
+            return dict(result, success=True)
+        except (TypeError, ValueError):
+            return {'success': False, 'error': '缺少或无效的id参数'}
+        except JobError as e:
+            return {'success': False, 'error': str(e)}
+    
+    @staticmethod
+    def client_id(conn):
+        """后台任务按客户端IP归属，断线重连后仍可查询"""
+        return getattr(conn, 'peer', None) or 'local'
+    
+    def get_metrics_history(self, params):
+        """查询指标历史（服务端降采样）"""
+        if not self.sampler.available:
+            return {'success': False, 'error': '需要安装psutil'}
+        self.sampler.start()
+        
+        try:
+            start = params.get('start')
+            if start is None and params.get('seconds'):
+                start = time.time() - float(params['seconds'])
+            data = self.history.query(
+                start=start,
+                end=params.get('end'),
+                points=params.get('points', 100),
+                fields=params.get('fields')
+            )
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'error': f'参数错误: {e}'}
+        
+        data['success'] = True
+        data['interval'] = self.sampler.interval
+        return data
+    
+    def get_network_info(self):
+        """获取网络信息"""
+        try:
+            import psutil
+            
+            # 获取网络接口信息
+            interfaces = {}
+            for interface, addrs in psutil.net_if_addrs().items():
+                interfaces[interface] = []
+                for addr in addrs:
+                    interfaces[interface].append({
+                        'family': str(addr.family),
+                        'address': addr.address,
+                        'netmask': addr.netmask,
+                        'broadcast': addr.broadcast
+                    })
+            
+            # 获取网络统计
+            net_io = psutil.net_io_counters()
+            stats = {
+                'bytes_sent': net_io.bytes_sent,
+                'bytes_recv': net_io.bytes_recv,
+                'packets_sent': net_io.packets_sent,
+                'packets_recv': net_io.packets_recv
+            }
+            
+            return {
+                'success': True,
+                'interfaces': interfaces,
+                'stats': stats
+            }
+        except ImportError:
+            return self.get_network_info_fallback()
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def get_network_info_fallback(self):
+        """没有psutil时的网络信息"""
+        return {'success': False, 'error': '需要安装psutil'}
+    
+    def top_processes(self, n):
+        """CPU占用最高的n个进程（供订阅推送使用）"""
+        return self.get_running_processes(limit=n).get('processes', [])
+    
+    def subscribe(self, conn, params):
+        """订阅指标推送，服务端按周期在同一连接上推送变化"""
+        if conn is None or not conn.framed:
+            return {'success': False, 'error': '订阅需要新版协议'}
+        if not self.sampler.available:
+            return {'success': False, 'error': '需要安装psutil'}
+        try:
+            sub = self.subscriptions.subscribe(
+                conn,
+                params.get('topics') or ['cpu', 'memory'],
+                params.get('interval', self.sampler.interval),
+                params.get('top_n', 10)
+            )
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'error': str(e)}
+        return {'success': True, 'subscription': sub.id, 'topics': sub.topics, 'interval': sub.interval}
+    
+    def unsubscribe(self, conn, params):
+        """取消订阅（不指定subscription时取消本连接的全部订阅）"""
+        count = self.subscriptions.unsubscribe(conn, params.get('subscription'))
+        return {'success': True, 'cancelled': count}
+    
+    def start_screen_stream(self, conn, params):
+        """开始屏幕直播：按fps推送变化的画面区域"""
+        if conn is None or not conn.framed:
+            return {'success': False, 'error': '屏幕直播需要新版协议'}
+        try:
+            stream = self.screen_streams.start(conn, params)
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'error': f'参数错误: {e}'}
+        except RuntimeError as e:
+            return {'success': False, 'error': str(e)}
+        return {
+            'success': True,
+            'stream': stream.id,
+            'fps': stream.fps,
+            'format': stream.options['fmt'],
+            'tile_size': stream.differ.tile_size
+        }
+    
+    def stop_screen_stream(self, conn, params):
+        """停止屏幕直播"""
+        stopped = self.screen_streams.stop(conn, params.get('stream'))
+        return {'success': True, 'stopped': stopped}
+    
+    def search_files(self, params):
+        """在文件索引中搜索（name/contains/ext/min_size/max_size/after/before/path/type）"""
+        if not self.config.index_enabled:
+            return {'success': False, 'error': '文件索引未启用'}
+        try:
+            result = self.file_index.search(
+                name=params.get('name'),
+                contains=params.get('contains'),
+                ext=params.get('ext'),
+                min_size=params.get('min_size'),
+                max_size=params.get('max_size'),
+                after=params.get('after'),
+                before=params.get('before'),
+                path=params.get('path'),
+                kind=params.get('type'),
+                sort=params.get('sort', 'name'),
+                order=params.get('order', 'asc'),
+                limit=params.get('limit', 100)
+            )
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'error': f'参数错误: {e}'}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+        result['success'] = True
+        result['indexed_at'] = self.file_index.last_refresh
+        result['indexing'] = self.file_index.refreshing
+        return result
+    
+    def reindex(self, params):
+        """触发一次增量刷新并返回索引状态"""
+        if not self.config.index_enabled:
+            return {'success': False, 'error': '文件索引未启用'}
+        started = self.file_index.refresh_async() if params.get('refresh', True) else False
+        status = self.file_index.status()
+        status.update({'success': True, 'started': started})
+        return status
+    
+    def connection_closed(self, conn):
+        """连接关闭时清理与之关联的状态"""
+        self.subscriptions.remove_connection(conn)
+        self.screen_streams.remove_connection(conn)
+        self.exec_streams.remove_connection(conn)
+    
+    def command_handlers(self, command, params, conn):
+        """命令名 -> 处理函数，子类可以增加平台特有的命令"""
+        return {
+            'info': lambda: self.get_device_info(),
+            'screenshot': lambda: self.take_screenshot(params),
+            'processes': lambda: self.get_running_processes(
+                params.get('limit', self.PROCESS_LIMIT), params.get('sort', 'cpu'), params.get('since')),
+            'files': lambda: self.list_files(params),
+            'read_file': lambda: self.get_file_content(params.get('filepath')),
+            'download': lambda: self.download_file(params.get('filepath'), params.get('offset', 0), params.get('length')),
+            'exec': lambda: self.execute_command(params.get('command')),
+            'network': lambda: self.get_network_info(),
+            'history': lambda: self.get_metrics_history(params),
+            'subscribe': lambda: self.subscribe(conn, params),
+            'unsubscribe': lambda: self.unsubscribe(conn, params),
+            'screen_stream': lambda: self.start_screen_stream(conn, params),
+            'screen_stream_stop': lambda: self.stop_screen_stream(conn, params),
+            'search': lambda: self.search_files(params),
+            'sync_plan': lambda: self.sync_plan(params),
+            'sync': lambda: self.sync_files(conn, params),
+            'exec_stream': lambda: self.execute_command_stream(conn, params),
+            'exec_cancel': lambda: self.cancel_command_stream(conn, params),
+            'exec_async': lambda: self.submit_job(conn, params),
+            'batch': lambda: self.batch.run(conn, params),
+            'job_status': lambda: self.job_command(conn, command, params),
+            'job_output': lambda: self.job_command(conn, command, params),
+            'job_cancel': lambda: self.job_command(conn, command, params),
+            'job_list': lambda: self.job_command(conn, command, params),
+            'reindex': lambda: self.reindex(params),
+            'ping': lambda: {'success': True, 'message': 'pong', 'timestamp': datetime.now().isoformat()}
+        }
+    
+    def handle_command(self, command, params=None, conn=None):
+        """处理命令（conn为发起请求的连接，推送类命令需要）"""
+        if params is None:
+            params = {}
+        
+        if not self.config.command_allowed(command):
+            logger.warning('已在配置中禁用的命令: %s', command)
+            return {'success': False, 'error': f'该功能已在配置中禁用: {command}'}
+        
+        handler = self.command_handlers(command, params, conn).get(command)
+        if handler:
+            if self.cache.handles(command):
+                return self.cache.get(command, params, handler)
+            return handler()
+        else:
+            return {'success': False, 'error': f'未知命令: {command}'}
+    
+    def handle_pipelined(self, conn, slots, command, params, request_id):
+        """在独立线程中处理带请求ID的命令，响应可能先于之前的请求返回"""
+        try:
+            try:
+                response = self.handle_command(command, params, conn)
+            except Exception as e:
+                response = {'success': False, 'error': str(e)}
+            response = dict(response)
+            response[protocol.REQUEST_ID_KEY] = request_id
+            conn.send_message(response)
+        except Exception:
+            # 连接已关闭，由读取线程清理
+            pass
+        finally:
+            slots.release()
+    
+    def accept_tls(self, client_socket):
+        """在处理线程中完成TLS握手（不阻塞接受新连接），返回加密后的socket"""
+        client_socket.settimeout(security.HANDSHAKE_TIMEOUT)
+        tls_socket = self.tls_context.wrap_socket(client_socket, server_side=True)
+        tls_socket.settimeout(None)
+        with self.clients_lock:
+            if client_socket in self.clients:
+                self.clients[self.clients.index(client_socket)] = tls_socket
+        return tls_socket
+    
+    def handle_client(self, client_socket, address):
+        """处理客户端连接"""
+        print(f"[+] 客户端已连接: {address}")
+        logger.info('客户端已连接: %s', address)
+        conn = None
+        
+        try:
+            if self.tls_context is not None:
+                client_socket = self.accept_tls(client_socket)
+            conn = protocol.Connection(client_socket, compress_threshold=self.config.compress_threshold)
+            conn.authenticated = not self.auth.required
+            # 限制同一连接上并发处理的流水线请求数
+            slots = threading.BoundedSemaphore(self.config.pipeline_depth)
+            
+            while self.running:
+                try:
+                    request = conn.recv_request()
+                    if request is None:
+                        break
+                    command = request.get('command')
+                    params = request.get('params', {})
+                    
+                    # 协议协商，需要认证时附带挑战
+                    if command == protocol.HELLO_COMMAND:
+                        conn.accept_hello(params, self.auth.challenge(conn))
+                        continue
+                    
+                    if command == security.AUTH_COMMAND:
+                        response = self.auth.verify(conn, params)
+                        conn.send_message(response)
+                        if not response['success']:
+                            print(f"[-] 认证失败: {address}")
+                            logger.warning('认证失败: %s', address)
+                            break
+                        continue
+                    
+                    if not conn.authenticated:
+                        conn.send_message({'success': False, 'auth_required': True, 'error': '需要认证'})
+                        break
+                    
+                    print(f"[*] 收到命令: {command} {params}")
+                    logger.info('命令 %s 来自 %s', command, address)
+                    
+                    request_id = request.get(protocol.REQUEST_ID_KEY)
+                    if request_id is not None and conn.framed:
+                        slots.acquire()
+                        threading.Thread(
+                            target=self.handle_pipelined,
+                            args=(conn, slots, command, params, request_id),
+                            daemon=True
+                        ).start()
+                        continue
+                    
+                    response = self.handle_command(command, params, conn)
+                    conn.send_message(response)
+                    
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    conn.send_message({'success': False, 'error': 'JSON解析错误'})
+                except protocol.ProtocolError as e:
+                    print(f"[-] 协议错误: {e}")
+                    break
+                except (ConnectionError, OSError):
+                    raise
+                except Exception as e:
+                    conn.send_message({'success': False, 'error': str(e)})
+        
+        except Exception as e:
+            print(f"[-] 客户端处理错误: {e}")
+            logger.error('客户端处理错误 %s: %s', address, e)
+        finally:
+            print(f"[-] 客户端断开: {address}")
+            logger.info('客户端断开: %s', address)
+            if conn is not None:
+                self.connection_closed(conn)
+            with self.clients_lock:
+                if client_socket in self.clients:
+                    self.clients.remove(client_socket)
+            client_socket.close()
+    
+    def reload_config(self):
+        """重新读取配置文件并应用到运行中的服务，已建立的连接不受影响"""
+        try:
+            config, changed, pending = self.config.reload()
+            allowed_ips = security.IPAllowList(config.allowed_ips)
+        except Exception as e:
+            print(f"[-] 配置文件有误，继续使用当前配置: {e}")
+            logger.error('配置文件有误，继续使用当前配置: %s', e)
+            return False
+        if not changed and not pending:
+            return True
+        
+        # 处理请求时读取 self.config，整体替换后新的连接数上限、功能开关、超时等立即生效
+        self.config = config
+        self.allowed_ips = allowed_ips
+        # 已认证的连接保持认证状态，新的连接使用新密码
+        self.auth = security.Authenticator(config.password if config.password_enabled else None)
+        self.sampler.interval = config.sample_interval
+        self.cache.set_ttls(config.cache_ttls if config.cache_enabled else {})
+        self.jobs.configure(config.job_queue_size, config.job_max_per_client, config.job_output_budget)
+        if {'logging_enabled', 'log_file', 'log_level'} & set(changed):
+            setup_logging(config)
+        
+        if changed:
+            print(f"[*] 配置已重新加载: {', '.join(changed)}")
+            logger.info('配置已重新加载: %s', ', '.join(changed))
+        if pending:
+            print(f"[*] 以下设置需要重启服务端才能生效: {', '.join(pending)}")
+            logger.warning('以下设置需要重启服务端才能生效: %s', ', '.join(pending))
+        return True
+    
+    def discovery_info(self):
+        """自动发现应答的内容：设备名称、平台、服务端口和负载"""
+        snapshot = self.sampler.snapshot() or {}
+        load = discovery.load_info()
+        if 'cpu_percent' in snapshot:
+            load['cpu'] = snapshot['cpu_percent']
+        if 'memory' in snapshot:
+            load['memory'] = snapshot['memory'].get('percent')
+        if snapshot.get('battery'):
+            load['battery'] = snapshot['battery'].get('level')
+        if self.config.server_mode != 'async':
+            with self.clients_lock:
+                load['clients'] = len(self.clients)
+        return {
+            'name': self.config.device_name or discovery.device_name(),
+            'platform': self.platform_name(),
+            'port': self.port,
+            'protocol': protocol.PROTOCOL_VERSION,
+            'tls': self.tls_context is not None,
+            'auth': self.auth.required,
+            'load': load
+        }
+    
+    def show_banner(self, mode):
+        """显示启动信息"""
+        local_ip = discovery.local_ip()
+        
+        print("=" * 60)
+        print(self.TITLE)
+        print(f"🌐 监听地址: {self.host}:{self.port}")
+        print(f"📍 本机IP: {local_ip}")
+        print(f"🔗 客户端连接地址: {local_ip}:{self.port}")
+        print(f"⚙️  运行模式: {mode}，最大连接数: {self.config.max_clients}")
+        if self.tls_context is not None:
+            print(f"🔒 TLS已启用，证书指纹(SHA-256): {self.tls_fingerprint}")
+        if self.auth.required:
+            print("🔑 已启用密码认证")
+        if self.allowed_ips:
+            print(f"🛡️  允许的来源: {', '.join(self.config.allowed_ips)}")
+        print(f"📝 配置文件: {self.config.path}（修改后自动重新加载，也可发送 SIGHUP）")
+        for line in self.banner_notes():
+            print(line)
+        print("=" * 60)
+        print("\n等待客户端连接...")
+    
+    def banner_notes(self):
+        """启动信息中附加的说明行"""
+        return []
+    
+    def start(self):
+        """启动服务器"""
+        if self.config.server_mode == 'async':
+            return self.start_async()
+        
+        try:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_socket.bind((self.host, self.port))
+            self.server_socket.listen(self.config.listen_backlog)
+            self.running = True
+            self.sampler.start()
+            self.jobs.start()
+            self.start_config_watcher()
+            if self.config.discovery_enabled:
+                self.discovery.start()
+            if self.config.index_enabled:
+                self.file_index.start(self.config.index_interval)
+            self.show_banner('thread')
+            
+            while self.running:
+                try:
+                    client_socket, address = self.server_socket.accept()
+                    if not self.allowed_ips.allows(address[0]):
+                        # 不在允许列表中的连接不分配线程，直接关闭
+                        print(f"[-] 来源不在允许列表中，拒绝: {address}")
+                        logger.warning('来源不在允许列表中，拒绝: %s', address)
+                        client_socket.close()
+                        continue
+                    with self.clients_lock:
+                        accepted = len(self.clients) < self.config.max_clients
+                        if accepted:
+                            self.clients.append(client_socket)
+                    if not accepted:
+                        print(f"[-] 连接数已达上限({self.config.max_clients})，拒绝: {address}")
+                        logger.warning('连接数已达上限(%d)，拒绝: %s', self.config.max_clients, address)
+                        try:
+                            protocol.Connection(client_socket).send_message(
+                                {'success': False, 'rejected': True, 'error': '服务器连接数已满'})
+                        finally:
+                            client_socket.close()
+                        continue
+                    
+                    # 为每个客户端创建新线程
+                    client_thread = threading.Thread(
+                        target=self.handle_client,
+                        args=(client_socket, address)
+                    )
+                    client_thread.daemon = True
+                    client_thread.start()
+                except Exception as e:
+                    if self.running:
+                        print(f"[-] 接受连接错误: {e}")
+                        
+        except Exception as e:
+            print(f"[-] 服务器启动失败: {e}")
+        finally:
+            self.stop()
+    
+    def start_async(self):
+        """以asyncio模式启动服务器（单事件循环 + 有限线程池）"""
+        self.running = True
+        self.sampler.start()
+        self.jobs.start()
+        self.start_config_watcher()
+        if self.config.discovery_enabled:
+            self.discovery.start()
+        if self.config.index_enabled:
+            self.file_index.start(self.config.index_interval)
+        self.show_banner('asyncio')
+        try:
+            AsyncServerCore(self).run()
+        except Exception as e:
+            print(f"[-] 服务器启动失败: {e}")
+        finally:
+            self.stop()
+    
+    def start_config_watcher(self):
+        """监视配置文件的修改，并在主线程中注册 SIGHUP"""
+        self.config_watcher.install_signal()
+        self.config_watcher.start()
+    
+    def stop(self):
+        """停止服务器"""
+        print("\n[*] 正在关闭服务器...")
+        self.running = False
+        self.sampler.stop()
+        self.config_watcher.stop()
+        self.file_index.stop()
+        self.jobs.stop()
+        self.discovery.stop()
+        self.batch.shutdown()
+        
+        # 关闭所有客户端连接
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.close()
+            except:
+                pass
+        
+        # 关闭服务器socket
+        if self.server_socket:
+            try:
+                self.server_socket.close()
+            except:
+                pass
+        
+        print("[*] 服务器已关闭")
+
+def main(server_class, title):
+    """命令行入口：python server.py [端口] [--async]"""
+    print(f"\n{title}")
+    print("⚠️  注意：请确保您有权监控此设备\n")
+    
+    # 命令行参数优先于配置文件，重新加载配置时同样保留
+    args = sys.argv[1:]
+    overrides = {}
+    # --async 使用asyncio模式（也可在config.ini中设置SERVER_MODE）
+    if '--async' in args:
+        args.remove('--async')
+        overrides['server_mode'] = 'async'
+    # 可以通过命令行参数指定端口（默认使用config.ini中的PORT）
+    if args:
+        try:
+            overrides['port'] = int(args[0])
+        except ValueError:
+            print("❌ 端口号必须是数字")
+            return
+    
+    try:
+        config = MonitorConfig.load(overrides=overrides)
+    except (ValueError, configparser.Error) as e:
+        print(f"❌ 配置文件有误: {e}")
+        return
+    server = server_class(config=config)
+    
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        print("\n[*] 收到中断信号")
+        server.stop()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+指标订阅 - 服务端主动推送
+所有订阅共用 MetricsSampler 的同一次采样，各自按订阅周期推送相对上次的变化部分
+"""
+
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import protocol
+
+TOPICS = ('cpu', 'memory', 'net_io', 'battery', 'processes')
+
+
+class Subscription:
+    """单个订阅的状态"""
+
+    def __init__(self, sub_id, conn, topics, interval, top_n):
+        self.id = sub_id
+        self.conn = conn
+        self.topics = topics
+        self.interval = interval
+        self.top_n = top_n
+        self.seq = 0
+        self.last_sent = 0.0
+        self.last_values = {}
+        # 上一次推送尚未发送完时跳过本轮，慢客户端不会堆积消息
+        self.busy = False
+
+    def delta(self, values):
+        """计算相对上次推送的变化部分，并记录为新的基准"""
+        changes = {}
+        for topic in self.topics:
+            value = values.get(topic)
+            if topic == 'processes':
+                value = value[:self.top_n] if value else []
+                if value != self.last_values.get(topic):
+                    changes[topic] = value
+            else:
+                previous = self.last_values.get(topic, {})
+                changed = {k: v for k, v in (value or {}).items() if previous.get(k) != v}
+                if changed:
+                    changes[topic] = changed
+            self.last_values[topic] = value
+        return changes
+
+
+class SubscriptionHub:
+    """订阅管理器，作为采样器的监听器运行"""
+
+    def __init__(self, sampler, process_provider=None, push_workers=2):
+        self.sampler = sampler
+        self.process_provider = process_provider
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._previous = None
+        self.executor = ThreadPoolExecutor(max_workers=push_workers, thread_name_prefix='monitor-push')
+        sampler.add_listener(self.on_sample)
+
+    def subscribe(self, conn, topics, interval, top_n=10):
+        """创建订阅，返回 Subscription"""
+        unknown = [t for t in topics if t not in TOPICS]
+        if unknown:
+            raise ValueError(f'未知主题: {", ".join(unknown)}')
+        interval = max(float(interval), self.sampler.interval)
+        sub = Subscription(next(self._ids), conn, list(topics), interval, int(top_n))
+        with self.lock:
+            self.subscriptions[sub.id] = sub
+        self.sampler.start()
+        return sub
+
+    def unsubscribe(self, conn, sub_id=None):
+        """取消订阅，sub_id为空时取消该连接的全部订阅，返回取消的数量"""
+        with self.lock:
+            ids = [s.id for s in self.subscriptions.values()
+                   if s.conn is conn and (sub_id is None or s.id == sub_id)]
+            for i in ids:
+                del self.subscriptions[i]
+        return len(ids)
+
+    def remove_connection(self, conn):
+        """连接关闭时清理其订阅"""
+        self.unsubscribe(conn)
+
+    def on_sample(self, snapshot):
+        """每次采样后调用：计算到期订阅需要的主题，一次计算供所有订阅共用"""
+        previous, self._previous = self._previous, snapshot
+        with self.lock:
+            subs = list(self.subscriptions.values())
+        if not subs:
+            return
+
+        now = snapshot['sampled_at']
+        # 允许半个采样周期的误差，避免因调度抖动错过一轮
+        slack = self.sampler.interval / 2
+        due = [s for s in subs if not s.busy and now - s.last_sent >= s.interval - slack]
+        if not due:
+            return
+
+        values = self.topic_values(snapshot, previous, due)
+        for sub in due:
+            sub.last_sent = now
+            changes = sub.delta(values)
+            if not changes and sub.seq:
+                continue
+            sub.busy = True
+            self.executor.submit(self._push, sub, changes, now)
+
+    def topic_values(self, snapshot, previous, subs):
+        """从快照生成各主题的数据"""
+        wanted = set()
+        for sub in subs:
+            wanted.update(sub.topics)
+
+        values = {}
+        if 'cpu' in wanted:
+            values['cpu'] = {'percent': snapshot.get('cpu_percent')}
+        if 'memory' in wanted:
+            values['memory'] = snapshot.get('memory')
+        if 'net_io' in wanted:
+            net_io = dict(snapshot.get('net_io') or {})
+            if previous and previous.get('net_io'):
+                elapsed = max(snapshot['sampled_at'] - previous['sampled_at'], 1e-6)
+                for key in ('bytes_sent', 'bytes_recv'):
+                    delta = net_io.get(key, 0) - previous['net_io'].get(key, 0)
+                    net_io[key + '_per_sec'] = round(delta / elapsed, 1)
+            values['net_io'] = net_io
+        if 'battery' in wanted:
+            values['battery'] = snapshot.get('battery') or {}
+        if 'processes' in wanted and self.process_provider:
+            top_n = max(s.top_n for s in subs if 'processes' in s.topics)
+            try:
+                values['processes'] = self.process_provider(top_n)
+            except Exception:
+                values['processes'] = []
+        return values
+
+    def _push(self, sub, changes, sampled_at):
+        try:
+            sub.conn.send_message({
+                protocol.PUSH_KEY: 'metrics',
+                'subscription': sub.id,
+                'seq': sub.seq,
+                'full': sub.seq == 0,
+                'sampled_at': sampled_at,
+                'data': changes
+            })
+            sub.seq += 1
+        except Exception:
+            # 连接已失效
+            self.remove_connection(sub.conn)
+        finally:
+            sub.busy = False
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+响应缓存测试 - TTL、refresh参数、单飞去重、失败不缓存
+运行: python -m pytest -q test_cache.py
+"""
+
+import threading
+import time
+
+from cache import ResponseCache
+
+
+class Counter:
+    """计算函数：记录调用次数，可选地阻塞到放行为止"""
+
+    def __init__(self, result=None, gate=None):
+        self.calls = 0
+        self.result = result or {'success': True, 'value': 1}
+        self.gate = gate
+
+    def __call__(self):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        return dict(self.result)
+
+
+def test_hit_within_ttl_and_refresh():
+    cache = ResponseCache({'battery': 60, 'wifi': 0})
+    assert cache.handles('battery') and not cache.handles('wifi')
+    compute = Counter()
+    assert 'cached' not in cache.get('battery', {}, compute)
+    hit = cache.get('battery', {}, compute)
+    assert hit['cached'] is True and compute.calls == 1
+    # 参数不同的请求分别缓存，refresh 强制重新获取
+    cache.get('battery', {'detail': True}, compute)
+    cache.get('battery', {'refresh': True}, compute)
+    assert compute.calls == 3
+    assert cache.stats()['hits'] == 1
+
+
+def test_expired_entry_is_recomputed():
+    cache = ResponseCache({'network': 0.05})
+    compute = Counter()
+    cache.get('network', {}, compute)
+    time.sleep(0.1)
+    assert 'cached' not in cache.get('network', {}, compute)
+    assert compute.calls == 2
+
+
+def test_failures_are_not_cached():
+    cache = ResponseCache({'apps': 60})
+    compute = Counter({'success': False, 'error': 'x'})
+    cache.get('apps', {}, compute)
+    cache.get('apps', {}, compute)
+    assert compute.calls == 2
+
+
+def test_concurrent_requests_share_one_computation():
+    cache = ResponseCache({'apps': 60})
+    gate = threading.Event()
+    compute = Counter(gate=gate)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('apps', {}, compute)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    # 等所有线程都进入等待后再放行
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        stats = cache.stats()
+        if stats['misses'] + stats['shared'] == 8:
+            break
+        time.sleep(0.01)
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert compute.calls == 1
+    assert len(results) == 8 and all(r['value'] == 1 for r in results)
+    assert cache.stats()['shared'] == 7
+
+
+def test_shared_error_is_raised_to_every_waiter():
+    cache = ResponseCache({'apps': 60})
+    gate = threading.Event()
+
+    def fail():
+        gate.wait(5)
+        raise RuntimeError('boom')
+
+    errors = []
+
+    def call():
+        try:
+            cache.get('apps', {}, fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert errors == ['boom'] * 3
+
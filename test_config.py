@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+配置测试 - 加载与命令行覆盖、功能开关、重新加载，以及运行中的服务端应用新配置
+运行: python -m pytest -q test_config.py
+"""
+
+import threading
+
+import pytest
+
+from cache import ResponseCache
+from config import ConfigWatcher, MonitorConfig
+from server import PhoneMonitorServer
+
+CONFIG = """[SERVER]
+PORT = 9000
+MAX_CLIENTS = 5
+WORKER_THREADS = 4
+
+[FEATURES]
+ALLOW_EXEC = True
+JOB_QUEUE_SIZE = 16
+
+[METRICS]
+SAMPLE_INTERVAL = 2
+
+[DISCOVERY]
+ENABLE_DISCOVERY = False
+
+[CACHE]
+WIFI_TTL = 30
+
+[LOGGING]
+ENABLE_LOGGING = False
+"""
+
+
+def write_config(path, **changes):
+    """写入测试配置，changes 为 {键: 新值}"""
+    text = CONFIG
+    for key, value in changes.items():
+        lines = [f'{key} = {value}' if line.split(' = ')[0] == key else line for line in text.splitlines()]
+        text = '\n'.join(lines) + '\n'
+    path.write_text(text, encoding='utf-8')
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / 'config.ini'
+    write_config(path)
+    return path
+
+
+def test_load_with_overrides(config_path):
+    config = MonitorConfig.load(str(config_path), {'port': 9100})
+    assert config.port == 9100
+    assert config.host == '0.0.0.0'
+    assert config.max_clients == 5
+    assert config.cache_ttls['wifi'] == 30
+    # 命令行覆盖的值在重新加载后保留
+    write_config(config_path, PORT=9200)
+    reloaded, changed, pending = config.reload()
+    assert reloaded.port == 9100 and 'port' not in changed + pending
+
+
+def test_command_allowed(config_path):
+    write_config(config_path, ALLOW_EXEC='False')
+    config = MonitorConfig.load(str(config_path))
+    assert not config.command_allowed('exec_stream')
+    assert config.command_allowed('info')
+    assert config.command_allowed('files')
+
+
+def test_reload_reports_changes_and_keeps_restart_settings(config_path):
+    config = MonitorConfig.load(str(config_path))
+    write_config(config_path, MAX_CLIENTS=1, WORKER_THREADS=8)
+    reloaded, changed, pending = config.reload()
+    assert changed == ['max_clients'] and pending == ['worker_threads']
+    assert reloaded.max_clients == 1
+    assert reloaded.worker_threads == 4
+
+
+def test_reload_rejects_invalid_file(config_path):
+    config = MonitorConfig.load(str(config_path))
+    write_config(config_path, MAX_CLIENTS='many')
+    with pytest.raises(ValueError):
+        config.reload()
+
+
+def test_watcher_reacts_to_file_change_and_trigger(config_path):
+    calls = threading.Semaphore(0)
+    watcher = ConfigWatcher(str(config_path), calls.release, interval=0.05)
+    watcher.start()
+    try:
+        assert not calls.acquire(timeout=0.3)
+        write_config(config_path, MAX_CLIENTS=2)
+        assert calls.acquire(timeout=2)
+        # 文件没有变化时，SIGHUP（trigger）同样重新加载
+        watcher.trigger()
+        assert calls.acquire(timeout=2)
+    finally:
+        watcher.stop()
+
+
+def test_cache_set_ttls():
+    cache = ResponseCache({'battery': 60, 'wifi': 60})
+    for command in ('battery', 'wifi'):
+        cache.get(command, {}, lambda: {'success': True})
+    cache.set_ttls({'battery': 60, 'wifi': 0})
+    assert cache.handles('battery') and not cache.handles('wifi')
+    assert cache.stats()['entries'] == 1
+
+
+def test_server_applies_reloaded_config(config_path):
+    server = PhoneMonitorServer(config=MonitorConfig.load(str(config_path)))
+    assert server.port == 9000
+    assert server.handle_command('exec', {'command': 'echo hi'})['success']
+    write_config(config_path, ALLOW_EXEC='False', SAMPLE_INTERVAL=0.5, JOB_QUEUE_SIZE=2,
+                 WIFI_TTL=0, PORT=9001)
+    assert server.reload_config()
+    assert server.handle_command('exec', {'command': 'echo hi'}) == {
+        'success': False, 'error': '该功能已在配置中禁用: exec'}
+    assert server.sampler.interval == 0.5
+    assert server.jobs.queue_size == 2
+    assert not server.cache.handles('wifi')
+    # 端口需要重启才能生效
+    assert server.config.port == 9000
+    # 配置文件有误时保持当前配置
+    write_config(config_path, MAX_CLIENTS='many')
+    assert not server.reload_config()
+    assert server.config.sample_interval == 0.5
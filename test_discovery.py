@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+局域网发现测试 - 本机单播探测，以及按来源IP限制应答
+运行: python -m pytest -q test_discovery.py
+"""
+
+import socket
+
+import discovery
+import security
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_responder(allowed):
+    port = free_udp_port()
+    allow_list = security.IPAllowList(allowed)
+    responder = discovery.DiscoveryResponder(
+        lambda: {'name': 'test-device', 'port': 9999}, port, is_allowed=allow_list.allows)
+    responder.start()
+    return responder, port
+
+
+def test_discover_reply():
+    responder, port = start_responder([])
+    try:
+        devices = discovery.discover(1.0, port, targets=['127.0.0.1'])
+    finally:
+        responder.stop()
+    assert [(d['name'], d['host'], d['port']) for d in devices] == [('test-device', '127.0.0.1', 9999)]
+
+
+def test_disallowed_source_gets_no_reply():
+    responder, port = start_responder(['10.0.0.0/8'])
+    try:
+        assert discovery.discover(0.5, port, targets=['127.0.0.1']) == []
+    finally:
+        responder.stop()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载测试 - 只有 .part 记录与服务端文件一致时才续传，否则重新下载
+运行: python -m pytest -q test_download.py
+"""
+
+import json
+import os
+import socket
+import threading
+
+import protocol
+from client import PhoneMonitorClient
+from server import PhoneMonitorServer
+
+
+def download_server(listener, offsets):
+    """用服务端的命令处理回复请求，记录每次 download 的 (offset, length)"""
+    server = PhoneMonitorServer()
+    sock, _ = listener.accept()
+    listener.close()
+    conn = protocol.Connection(sock)
+    with sock:
+        while True:
+            request = conn.recv_request()
+            if request is None:
+                break
+            command, params = request['command'], request.get('params', {})
+            if command == protocol.HELLO_COMMAND:
+                conn.accept_hello(params)
+                continue
+            if command == 'download':
+                offsets.append((params.get('offset'), params.get('length')))
+            conn.send_message(server.handle_command(command, params))
+
+
+def connect(offsets):
+    listener = socket.create_server(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    threading.Thread(target=download_server, args=(listener, offsets), daemon=True).start()
+    client = PhoneMonitorClient('127.0.0.1', port)
+    client.link.heartbeat = 0
+    assert client.connect()
+    return client
+
+
+def prepare(tmp_path, part_data, record):
+    remote = tmp_path / 'remote.bin'
+    remote.write_bytes(bytes(range(256)) * 100)
+    local = tmp_path / 'local.bin'
+    (tmp_path / 'local.bin.part').write_bytes(part_data)
+    stat = os.stat(remote)
+    marker = dict({'filepath': str(remote), 'size': stat.st_size, 'mtime': stat.st_mtime}, **record)
+    (tmp_path / 'local.bin.part.json').write_text(json.dumps(marker), encoding='utf-8')
+    return remote, local
+
+
+def test_resume_when_marker_matches(tmp_path):
+    remote, local = prepare(tmp_path, (bytes(range(256)) * 100)[:1000], {})
+    offsets = []
+    client = connect(offsets)
+    try:
+        assert client.download_file(str(remote), str(local))
+    finally:
+        client.disconnect()
+    assert local.read_bytes() == remote.read_bytes()
+    assert offsets == [(0, 0), (1000, None)]
+    assert not os.path.exists(str(local) + '.part') and not os.path.exists(str(local) + '.part.json')
+
+
+def test_restart_when_remote_changed(tmp_path):
+    remote, local = prepare(tmp_path, b'stale data', {'mtime': 1.0})
+    offsets = []
+    client = connect(offsets)
+    try:
+        assert client.download_file(str(remote), str(local))
+    finally:
+        client.disconnect()
+    assert local.read_bytes() == remote.read_bytes()
+    assert offsets == [(0, 0), (0, None)]
+
+
+def test_read_file_never_resumes(tmp_path):
+    remote, local = prepare(tmp_path, (bytes(range(256)) * 100)[:1000], {})
+    local.write_bytes(b'old local file')
+    offsets = []
+    client = connect(offsets)
+    try:
+        assert client.read_file(str(remote), str(local))
+    finally:
+        client.disconnect()
+    assert local.read_bytes() == remote.read_bytes()
+    assert offsets == [(0, None)]
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式执行测试 - 输出按到达顺序推送，结束前发出解码器中剩余的字节
+运行: python -m pytest -q test_exec_stream.py
+"""
+
+import sys
+import threading
+
+from exec_stream import ExecStreamManager
+
+
+class RecordingConnection:
+    """记录推送消息，收到结束消息时通知"""
+
+    def __init__(self):
+        self.messages = []
+        self.done = threading.Event()
+
+    def send_message(self, message):
+        self.messages.append(message)
+        if message.get('done'):
+            self.done.set()
+
+
+def run(script):
+    conn = RecordingConnection()
+    ExecStreamManager().start(conn, f'{sys.executable} -c "{script}"')
+    assert conn.done.wait(10)
+    output = ''.join(m['data'] for m in conn.messages if m.get('stream') == 'stdout')
+    return output, conn.messages[-1]
+
+
+def test_output_and_exit_message():
+    output, done = run("print('你好')")
+    assert output == '你好\n'
+    assert done['returncode'] == 0 and done['reason'] == 'exit'
+    assert done['bytes'] == len('你好\n'.encode())
+
+
+def test_truncated_character_is_flushed_before_exit():
+    # 输出以不完整的UTF-8序列结尾
+    output, done = run("import sys; sys.stdout.buffer.write(b'ok\\xe4\\xbd')")
+    assert output == 'ok�'
+    assert done['done'] is True
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录列表测试 - 排序、过滤、游标分页，以及服务端 files 命令的路径参数
+运行: python -m pytest -q test_file_listing.py
+"""
+
+import os
+
+import file_listing
+from android_server import AndroidMonitorServer
+from server import PhoneMonitorServer
+
+
+def make_tree(root):
+    os.mkdir(os.path.join(root, 'sub'))
+    for i, name in enumerate(['b.txt', 'a.log', 'c.txt', 'd.py', 'e.txt']):
+        with open(os.path.join(root, name), 'wb') as f:
+            f.write(b'x' * (i + 1) * 10)
+
+
+def names(result):
+    return [item['name'] for item in result['files']]
+
+
+def test_sort_and_filter(tmp_path):
+    make_tree(str(tmp_path))
+    result = file_listing.list_directory(str(tmp_path))
+    assert names(result) == ['sub', 'a.log', 'b.txt', 'c.txt', 'd.py', 'e.txt']
+    result = file_listing.list_directory(str(tmp_path), sort='size', order='desc', dirs_first=False)
+    assert names(result)[:2] == ['e.txt', 'd.py']
+    result = file_listing.list_directory(str(tmp_path), extensions=['txt'])
+    assert names(result) == ['sub', 'b.txt', 'c.txt', 'e.txt']
+
+
+def test_cursor_paging_visits_every_entry_once(tmp_path):
+    make_tree(str(tmp_path))
+    seen, cursor = [], None
+    while True:
+        result = file_listing.list_directory(str(tmp_path), limit=2, cursor=cursor)
+        seen += names(result)
+        cursor = result['next_cursor']
+        if cursor is None:
+            break
+    assert seen == ['sub', 'a.log', 'b.txt', 'c.txt', 'd.py', 'e.txt']
+
+
+def test_files_command_uses_requested_path(tmp_path):
+    make_tree(str(tmp_path))
+    android = AndroidMonitorServer()
+    android.is_android = False
+    for server in (android, PhoneMonitorServer()):
+        result = server.list_files({'path': str(tmp_path)})
+        assert result['success'] is True
+        assert result['path'] == str(tmp_path)
+        assert 'a.log' in names(result)
+        # 不给出路径时列出用户目录
+        assert server.list_files({})['path'] == os.path.expanduser('~')
+    android.is_android = True
+    assert android.list_files({'path': str(tmp_path)})['path'] == str(tmp_path)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录同步测试 - 同步清单、块差异的计算与重建、本地路径检查
+运行: python -m pytest -q test_file_sync.py
+"""
+
+import io
+import os
+import random
+
+import pytest
+
+import file_sync
+
+BLOCK = file_sync.MIN_BLOCK_SIZE
+
+
+def sync(tmp_path, old, new, block_size=BLOCK):
+    """用旧文件的签名计算新内容的差异并重建，返回 (重建结果, 字面数据长度)"""
+    old_path = tmp_path / 'old.bin'
+    old_path.write_bytes(old)
+    signatures = file_sync.file_signature(str(old_path), block_size)
+    ops, literal = file_sync.compute_delta(new, block_size, signatures)
+    out = io.BytesIO()
+    written = file_sync.apply_delta(str(old_path), ops, block_size, bytes(literal), out)
+    assert written == len(new)
+    return out.getvalue(), len(literal)
+
+
+def test_make_plan():
+    remote = {'a.txt': (10, 100.0, '/r/a.txt'), 'b.txt': (20, 200.0, '/r/b.txt'),
+              'c.txt': (30, 300.0, '/r/c.txt'), 'd.txt': (40, 400.0, '/r/d.txt')}
+    manifest = {'a.txt': [10, 100.5], 'b.txt': [21, 200.0], 'c.txt': [30, 310.0], 'old.txt': [1, 1.0]}
+    plan = file_sync.make_plan(remote, manifest)
+    assert plan == {'new': ['d.txt'], 'changed': ['b.txt', 'c.txt'], 'deleted': ['old.txt'],
+                    'unchanged': 1}
+
+
+@pytest.mark.parametrize('size', [BLOCK * 20 + 123, file_sync.ROLLING_MAX_SIZE + BLOCK * 3 + 7])
+def test_delta_reuses_unchanged_blocks(tmp_path, size):
+    rng = random.Random(size)
+    old = bytes(rng.getrandbits(8) for _ in range(size))
+    # 中间原地修改一段，末尾追加
+    new = old[:BLOCK * 5] + b'changed!' + old[BLOCK * 5 + 8:] + b'appended'
+    rebuilt, literal = sync(tmp_path, old, new)
+    assert rebuilt == new
+    assert literal < BLOCK * 3
+
+
+def test_delta_finds_shifted_data(tmp_path):
+    rng = random.Random(1)
+    old = bytes(rng.getrandbits(8) for _ in range(BLOCK * 10))
+    # 开头插入数据后其余内容整体后移，滚动查找仍能复用旧块
+    new = b'inserted' + old
+    rebuilt, literal = sync(tmp_path, old, new)
+    assert rebuilt == new
+    assert literal < BLOCK
+
+
+def test_delta_handles_small_and_empty_files(tmp_path):
+    for old, new in ((b'', b'hello'), (b'hello', b''), (b'short', b'short'), (b'abc', b'abcd')):
+        rebuilt, _ = sync(tmp_path, old, new)
+        assert rebuilt == new
+
+
+def test_safe_join_rejects_escaping_paths(tmp_path):
+    root = str(tmp_path)
+    assert file_sync.safe_join(root, 'a/b.txt') == os.path.join(root, 'a', 'b.txt')
+    for rel in ('../x', 'a/../../x', '/etc/passwd'):
+        with pytest.raises(ValueError):
+            file_sync.safe_join(root, rel)
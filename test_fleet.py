@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多设备控制测试 - 设备列表解析、结果按 host:port 区分同名设备
+运行: python -m pytest -q test_fleet.py
+"""
+
+import asyncio
+import socket
+import threading
+
+import fleet
+import protocol
+
+
+def ping_server():
+    """回复 ping 的服务端，返回端口"""
+    listener = socket.create_server(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+
+    def run():
+        sock, _ = listener.accept()
+        listener.close()
+        conn = protocol.Connection(sock)
+        with sock:
+            while True:
+                request = conn.recv_request()
+                if request is None:
+                    break
+                if request['command'] == protocol.HELLO_COMMAND:
+                    conn.accept_hello(request['params'])
+                    continue
+                conn.send_message({'success': True, 'message': f'pong {port}'})
+
+    threading.Thread(target=run, daemon=True).start()
+    return port
+
+
+def test_load_hosts(tmp_path):
+    path = tmp_path / 'hosts.txt'
+    path.write_text('# 注释\n10.0.0.1 phone\n10.0.0.2:9000 phone\n\n10.0.0.1:8888 again\n', encoding='utf-8')
+    devices = fleet.load_hosts(str(path))
+    assert [(d.address, d.name) for d in devices] == [('10.0.0.1:8888', 'phone'), ('10.0.0.2:9000', 'phone')]
+
+
+def test_devices_with_same_name_keep_separate_results():
+    ports = [ping_server(), ping_server()]
+    devices = [fleet.Device('127.0.0.1', port, 'phone') for port in ports]
+
+    async def sweep():
+        controller = fleet.FleetController(devices, timeout=5)
+        try:
+            return await controller.run('ping')
+        finally:
+            controller.close()
+
+    results = asyncio.run(sweep())
+    assert list(results) == [f'127.0.0.1:{port}' for port in ports]
+    assert [r['message'] for r in results.values()] == [f'pong {port}' for port in ports]
+    assert all(r['name'] == 'phone' for r in results.values())
+    table = fleet.format_table('ping', results)
+    assert f'phone (127.0.0.1:{ports[0]})' in table and '成功 2/2' in table
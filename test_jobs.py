@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台任务测试 - 取消排队中和刚出队的任务、输出按字节偏移分段读取
+运行: python -m pytest -q test_jobs.py
+"""
+
+import base64
+import codecs
+import sys
+import threading
+import time
+
+import jobs
+from jobs import JobManager
+
+
+def test_cancel_queued_job():
+    manager = JobManager(workers=1)
+    job = manager.submit('client', 'echo never')
+    assert manager.cancel('client', job.id).status == 'cancelled'
+    assert not manager.pending and job.id in manager.finished
+
+
+def test_cancel_right_after_dequeue(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def blocking_run(job):
+        started.set()
+        release.wait(5)
+        job.status = 'cancelled' if job.cancel_event.is_set() else 'done'
+
+    monkeypatch.setattr(jobs.Job, 'run', blocking_run)
+    manager = JobManager(workers=1)
+    manager.start()
+    try:
+        job = manager.submit('client', 'echo hi')
+        assert started.wait(5)
+        # 工作线程已出队但尚未运行命令：走运行中的取消路径，不会从队列中移除而出错
+        assert job.status == 'running'
+        manager.cancel('client', job.id)
+        assert job.cancel_event.is_set()
+    finally:
+        release.set()
+        manager.stop()
+
+
+def test_output_split_inside_multibyte_character():
+    manager = JobManager(workers=1)
+    manager.start()
+    try:
+        command = f'{sys.executable} -c "import sys; sys.stdout.buffer.write(\'你好世界\'.encode())"'
+        job = manager.submit('client', command)
+        for _ in range(100):
+            if job.status == 'done':
+                break
+            time.sleep(0.05)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        text, offset = '', 0
+        while True:
+            # 每次4字节，必然切在汉字中间
+            chunk = manager.output('client', job.id, offset, 0, limit=4)
+            data = base64.b64decode(chunk['stdout'])
+            if not data:
+                break
+            text += decoder.decode(data)
+            offset = chunk['stdout_offset']
+        assert text + decoder.decode(b'', final=True) == '你好世界'
+        assert chunk['complete']
+    finally:
+        manager.stop()
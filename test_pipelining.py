@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流水线请求测试 - 响应乱序到达时按 request_id 交给各自的请求，发送期间心跳不能插入
+运行: python -m pytest -q test_pipelining.py
+"""
+
+import socket
+import threading
+
+import protocol
+from client import PhoneMonitorClient
+
+
+def out_of_order_server(listener, batch_size):
+    """收齐 batch_size 个带ID的请求后倒序回复，其余请求按顺序回复"""
+    sock, _ = listener.accept()
+    listener.close()
+    conn = protocol.Connection(sock)
+    held = []
+    with sock:
+        while True:
+            request = conn.recv_request()
+            if request is None:
+                break
+            if request['command'] == protocol.HELLO_COMMAND:
+                conn.accept_hello(request['params'])
+                continue
+            response = {'success': True, 'echo': request['params'].get('n')}
+            request_id = request.get(protocol.REQUEST_ID_KEY)
+            if request_id is None:
+                conn.send_message(response)
+                continue
+            held.append(dict(response, **{protocol.REQUEST_ID_KEY: request_id}))
+            if len(held) == batch_size:
+                for message in reversed(held):
+                    conn.send_message(message)
+                held = []
+
+
+def connect(batch_size):
+    listener = socket.create_server(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    threading.Thread(target=out_of_order_server, args=(listener, batch_size), daemon=True).start()
+    client = PhoneMonitorClient('127.0.0.1', port)
+    client.link.heartbeat = 0
+    assert client.connect()
+    assert client.conn.pipelining
+    return client
+
+
+def test_out_of_order_responses_reach_their_requests():
+    client = connect(batch_size=5)
+    try:
+        responses = client.fetch_many([('echo', {'n': n}) for n in range(5)])
+        assert [r['echo'] for r in responses] == list(range(5))
+        assert not client.pending
+        # 流水线请求之后的普通请求不会读到流水线的响应
+        assert client.send_command('echo', {'n': 'plain'})['echo'] == 'plain'
+    finally:
+        client.disconnect()
+
+
+def test_send_async_holds_link_lock_while_sending():
+    client = connect(batch_size=1)
+    conn = client.conn
+    send = conn.send_message
+    lock_free_during_send = []
+
+    def heartbeat_probe():
+        # 与心跳线程相同的非阻塞获取
+        acquired = client.link.lock.acquire(blocking=False)
+        if acquired:
+            client.link.lock.release()
+        lock_free_during_send.append(acquired)
+
+    def checked_send(message):
+        probe = threading.Thread(target=heartbeat_probe)
+        probe.start()
+        probe.join()
+        send(message)
+
+    conn.send_message = checked_send
+    try:
+        assert client.send_async('echo', {'n': 1}).result(5)['echo'] == 1
+        assert lock_free_during_send == [False]
+    finally:
+        client.disconnect()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程表测试 - 无权限读取的属性、pid 复用、增量令牌
+运行: python -m pytest -q test_process_table.py
+"""
+
+import contextlib
+
+import psutil
+import pytest
+
+import process_table
+from process_table import ProcessTable
+
+
+class FakeProcess:
+    """按 (pid, 创建时间) 区分的假进程；denied 中的属性读取时抛出 AccessDenied"""
+
+    def __init__(self, pid, create_time, name, denied=()):
+        self.pid = pid
+        self._create_time = create_time
+        self._name = name
+        self.denied = set(denied)
+
+    def _get(self, attr, value):
+        if attr in self.denied:
+            raise psutil.AccessDenied(self.pid)
+        return value
+
+    def create_time(self):
+        return self._create_time
+
+    def name(self):
+        return self._get('name', self._name)
+
+    def cpu_percent(self, interval=None):
+        return self._get('cpu_percent', 5.0)
+
+    def memory_percent(self):
+        return self._get('memory_percent', 1.0)
+
+    def oneshot(self):
+        return contextlib.nullcontext()
+
+
+class FakeSystem:
+    def __init__(self):
+        self.processes = {}
+
+    def start(self, pid, create_time, name, denied=()):
+        self.processes[pid] = FakeProcess(pid, create_time, name, denied)
+
+    def Process(self, pid):
+        if pid not in self.processes:
+            raise psutil.NoSuchProcess(pid)
+        proc = self.processes[pid]
+        return FakeProcess(pid, proc._create_time, proc._name, proc.denied)
+
+
+@pytest.fixture
+def system(monkeypatch):
+    system = FakeSystem()
+    monkeypatch.setattr(process_table.psutil, 'pids', lambda: list(system.processes))
+    monkeypatch.setattr(process_table.psutil, 'Process', system.Process)
+    monkeypatch.setattr(FakeProcess, 'is_running', lambda self: (
+        self.pid in system.processes and system.processes[self.pid]._create_time == self._create_time),
+        raising=False)
+    monkeypatch.setattr(process_table, 'MIN_REFRESH_INTERVAL', 0)
+    return system
+
+
+def test_unreadable_attributes_are_none(system):
+    system.start(1, 100.0, 'init')
+    system.start(2, 200.0, 'secret', denied={'name', 'memory_percent'})
+    table = ProcessTable()
+    result = table.top(10, sort='memory')
+    assert result['total'] == 2
+    assert result['processes'][1] == {'pid': 2, 'name': None, 'cpu_percent': 0.0, 'memory_percent': None}
+
+
+def test_reused_pid_is_a_single_replace(system):
+    system.start(1, 100.0, 'init')
+    system.start(7, 100.0, 'old')
+    table = ProcessTable()
+    token = table.top()['token']
+    system.start(7, 150.0, 'new')
+    delta = table.delta(token)
+    assert delta['removed'] == []
+    assert [row['name'] for row in delta['added']] == ['new']
+    assert delta['total'] == 2
+    # 进程结束时记录pid
+    del system.processes[7]
+    assert table.delta(delta['token'])['removed'] == [7]
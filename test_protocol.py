@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+通信协议测试 - 分帧与旧协议的收发、协商、压缩，以及新客户端连接旧服务端
+运行: python -m pytest -q test_protocol.py
+"""
+
+import json
+import os
+import socket
+import threading
+
+import connection
+import protocol
+
+
+def serve_once(handler):
+    """在本机端口上接受一个连接，交给 handler(sock) 处理，返回 (端口, 线程)"""
+    listener = socket.create_server(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+
+    def run():
+        sock, _ = listener.accept()
+        listener.close()
+        with sock:
+            handler(sock)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return port, thread
+
+
+def baseline_handler(sock):
+    """旧版服务端的收发方式：一次 recv 的数据整体作为JSON解析，响应以 __END__ 结尾"""
+    while True:
+        data = sock.recv(8192)
+        if not data:
+            break
+        try:
+            request = json.loads(data.decode('utf-8'))
+            command = request.get('command')
+            if command == 'ping':
+                response = {'success': True, 'message': 'pong'}
+            else:
+                response = {'success': False, 'error': f'未知命令: {command}'}
+            sock.sendall(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+            sock.sendall(b'\n__END__\n')
+        except json.JSONDecodeError:
+            # 旧版服务端的错误响应没有结束标记
+            sock.sendall(json.dumps({'success': False, 'error': 'JSON解析错误'}).encode('utf-8'))
+
+
+def new_server_handler(sock):
+    """新版服务端的收发方式：支持hello协商，附件和压缩按连接协商的结果发送"""
+    conn = protocol.Connection(sock, compress_threshold=64)
+    while True:
+        request = conn.recv_request()
+        if request is None:
+            break
+        command, params = request.get('command'), request.get('params', {})
+        if command == protocol.HELLO_COMMAND:
+            conn.accept_hello(params)
+            continue
+        if command == 'echo':
+            response = {'success': True, 'params': params}
+        elif command == 'blob':
+            response = {'success': True, protocol.ATTACHMENT_KEY: protocol.Attachment(
+                data=b'\x00\x01' * params.get('size', 0), legacy_field='data')}
+        else:
+            response = {'success': False, 'error': f'未知命令: {command}'}
+        conn.send_message(response)
+
+
+def client_connection(port, negotiate=True):
+    sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+    conn = protocol.Connection(sock, client=True)
+    if negotiate:
+        conn.negotiate()
+    return conn
+
+
+def test_legacy_request_has_no_end_marker():
+    buffers, _ = protocol.encode_message({'command': 'info'}, False, request=True)
+    assert b''.join(buffers) == protocol.encode_json({'command': 'info'})
+    buffers, _ = protocol.encode_message({'success': True}, False)
+    assert b''.join(buffers).endswith(protocol.LEGACY_END)
+
+
+def test_framed_round_trip_both_directions():
+    client_sock, server_sock = socket.socketpair()
+    client = protocol.Connection(client_sock, framed=True, client=True)
+    server = protocol.Connection(server_sock, framed=True)
+    with client_sock, server_sock:
+        client.send_message({'command': 'echo', 'params': {'text': '你好'}})
+        assert server.recv_request() == {'command': 'echo', 'params': {'text': '你好'}}
+        data = bytes(range(256)) * 4
+        server.send_message({'success': True,
+                             protocol.ATTACHMENT_KEY: protocol.Attachment(data=data, legacy_field='data')})
+        response = client.recv_response()
+        assert response['success'] is True
+        assert response['attachment'] == {'size': len(data)}
+        assert response['attachment_data'] == data
+
+
+def test_negotiation_switches_to_framed_and_compresses():
+    port, thread = serve_once(new_server_handler)
+    conn = client_connection(port)
+    with conn.sock:
+        assert conn.framed
+        assert 'zlib' in conn.codecs
+        conn.send_message({'command': 'echo', 'params': {'text': 'x' * 10000}})
+        response = conn.recv_response()
+        assert response['params']['text'] == 'x' * 10000
+        assert response['compression']['codec'] in conn.codecs
+        conn.send_message({'command': 'blob', 'params': {'size': 50000}})
+        assert conn.recv_response()['attachment_data'] == b'\x00\x01' * 50000
+    thread.join(5)
+
+
+def test_old_client_against_new_server():
+    """旧版客户端不发送hello：请求是裸JSON，响应按 __END__ 读取，附件以base64放在JSON中"""
+    port, thread = serve_once(new_server_handler)
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+        sock.sendall(json.dumps({'command': 'blob', 'params': {'size': 3}}).encode('utf-8'))
+        data = b''
+        while protocol.LEGACY_END not in data:
+            chunk = sock.recv(4096)
+            assert chunk
+            data += chunk
+    response = json.loads(data[:-len(protocol.LEGACY_END)].decode('utf-8'))
+    assert response['success'] is True
+    assert response['data'] == 'AAEAAQAB'
+    thread.join(5)
+
+
+def test_compression_round_trip_per_codec():
+    data = ('{"name": "value", "n": 12345}' * 2000).encode('utf-8')
+    for codec in protocol.available_codecs():
+        flags, payload = protocol.compress_payload(data, [codec], 'json', 1024)
+        assert flags == protocol.CODEC_FLAGS[codec]
+        assert len(payload) < len(data)
+        decoded, info = protocol.decode_payload(flags, payload)
+        assert bytes(decoded) == data
+        assert info['codec'] == codec and info['raw_size'] == len(data)
+
+
+def test_compression_skipped_when_not_worthwhile():
+    data = b'x' * 10000
+    # 低于阈值、未协商编码、已压缩格式都原样发送
+    assert protocol.compress_payload(data, ['zlib'], 'json', 20000) == (0, data)
+    assert protocol.compress_payload(data, [], 'json', 1) == (0, data)
+    png = b'\x89PNG\r\n\x1a\n' + data
+    assert protocol.compress_payload(png, ['zlib'], 'binary', 1) == (0, png)
+    random_data = os.urandom(10000)
+    assert protocol.compress_payload(random_data, ['zlib'], 'binary', 1) == (0, random_data)
+    assert protocol.decode_payload(0, data) == (data, None)
+
+
+def test_new_client_against_baseline_server():
+    port, thread = serve_once(baseline_handler)
+    conn = client_connection(port)
+    with conn.sock:
+        assert not conn.framed
+        for _ in range(3):
+            conn.send_message({'command': 'ping', 'params': {}})
+            assert conn.recv_response() == {'success': True, 'message': 'pong'}
+    thread.join(5)
+
+
+def test_connection_manager_against_baseline_server():
+    port, thread = serve_once(baseline_handler)
+    link = connection.ConnectionManager('127.0.0.1', port, timeout=5, heartbeat=0, retries=1,
+                                        log=lambda message: None)
+    link.open()
+    try:
+        response = link.request({'command': 'ping', 'params': {}}, retry=True)
+        assert response['message'] == 'pong'
+        assert link.reconnects == 0
+    finally:
+        link.close()
+    thread.join(5)
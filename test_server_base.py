@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务端共用部分测试 - 两个服务端共享命令处理，Android服务端只增加平台特有的命令
+运行: python -m pytest -q test_server_base.py
+"""
+
+from android_server import AndroidMonitorServer
+from server import PhoneMonitorServer
+
+
+def test_android_server_extends_common_commands():
+    server = PhoneMonitorServer()
+    android = AndroidMonitorServer()
+    android.is_android = False
+    common = set(server.command_handlers('ping', {}, None))
+    assert common < set(android.command_handlers('ping', {}, None))
+    assert server.handle_command('battery') == {'success': False, 'error': '未知命令: battery'}
+    assert android.handle_command('battery') == {'success': False, 'error': '仅Android支持'}
+    for instance in (server, android):
+        assert instance.handle_command('ping')['message'] == 'pong'
+
+
+def test_platform_hooks():
+    android = AndroidMonitorServer()
+    android.is_android = True
+    assert android.default_root() == '/sdcard/'
+    assert android.platform_name() == 'Android'
+    assert android.discovery_info()['platform'] == 'Android'
+    assert "检测到Android环境" in android.banner_notes()[0]
+    assert PhoneMonitorServer().banner_notes() == []